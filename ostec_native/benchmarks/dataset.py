@@ -0,0 +1,383 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Synthetic Renewal Tracking dataset for benchmarks.
+
+Bulk-inserts submitted documents, with 1-500 item rows each, straight into
+the tables. This bypasses the controller so 100k documents take minutes
+instead of hours. Stages and transition dates come from the shared
+classifier, so the rows look exactly like saved documents.
+
+	bench --site <site> execute ostec_native.benchmarks.dataset.make_renewal_dataset --kwargs "{'documents': 100000}"
+	bench --site <site> execute ostec_native.benchmarks.dataset.delete_renewal_dataset
+
+Only run this on a benchmark site. Every row is named with BENCH_PREFIX so
+delete_renewal_dataset can remove it again.
+"""
+
+import csv
+import time
+
+import frappe
+import numpy as np
+from frappe.utils import add_days, flt, getdate, now_datetime, today
+
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_stage import (
+	classify_renewal_stages,
+	get_stage_labels,
+	get_transition_dates,
+)
+
+BENCH_PREFIX = "_BENCH-RT-"
+BENCH_ITEM_PREFIX = "_Bench Item "
+BENCH_ITEMS = 200
+
+# Foreign currencies used for part of the documents, with a rough rate to the company currency
+FOREIGN_CURRENCIES = {"USD": 15.5, "EUR": 16.8, "GBP": 19.6}
+# Typical contract lengths in days, picked for most documents
+CONTRACT_DAYS = (365, 730, 1095)
+
+PARENT_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"naming_series",
+	"renewal_title",
+	"renewal_type",
+	"renewal_outcome",
+	"date",
+	"license_start",
+	"license_end",
+	"renewal_stage",
+	"next_stage_transition",
+	"company",
+	"currency",
+	"exchange_rate",
+	"net_total",
+	"net_total_base",
+)
+
+ITEM_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"parent",
+	"parenttype",
+	"parentfield",
+	"idx",
+	"item_code",
+	"item_name",
+	"description",
+	"item_group",
+	"oum",
+	"qty",
+	"rate",
+	"amount",
+	"base_rate",
+	"base_amount",
+)
+
+# Column headers import_items reads
+IMPORT_HEADERS = ("Item Code", "Item Name", "Description", "Brand", "Item Group", "UOM", "Qty", "Rate")
+# Column headers import_renewals reads besides IMPORT_HEADERS
+RENEWAL_IMPORT_HEADERS = (
+	"Renewal Key",
+	"Renewal Title",
+	"License Start",
+	"License End",
+	"Company",
+	"Currency",
+	"Exchange Rate",
+)
+
+
+def get_bench_items():
+	"""Item masters used for item rows, created on first use"""
+	item_group = frappe.db.get_value("Item Group", {"is_group": 0}) or "All Item Groups"
+	uom = "Nos" if frappe.db.exists("UOM", "Nos") else frappe.db.get_value("UOM", {})
+
+	for i in range(BENCH_ITEMS):
+		item_code = f"{BENCH_ITEM_PREFIX}{i:04d}"
+		if not frappe.db.exists("Item", item_code):
+			frappe.get_doc(
+				{
+					"doctype": "Item",
+					"item_code": item_code,
+					"item_name": item_code,
+					"item_group": item_group,
+					"stock_uom": uom,
+					"is_stock_item": 0,
+				}
+			).insert(ignore_permissions=True)
+	frappe.db.commit()
+
+	return frappe.get_all(
+		"Item",
+		filters={"name": ("like", f"{BENCH_ITEM_PREFIX}%")},
+		fields=["item_code", "item_name", "description", "item_group", "stock_uom"],
+		order_by="name",
+	)
+
+
+def get_item_counts(rng, documents, max_items):
+	"""Item rows per document, log-uniform between 1 and max_items (median ~22 for 500)"""
+	counts = np.exp(rng.uniform(0, np.log(max_items + 1), documents)).astype(np.int64)
+	return np.clip(counts, 1, max_items)
+
+
+def make_renewal_dataset(documents=100_000, max_items=500, seed=0, batch_size=500):
+	"""
+	Insert documents submitted Renewal Tracking rows with item tables
+
+	License starts are spread over roughly 3 years around today. Most
+	contracts run 1-3 years, so every renewal stage is represented. About
+	a third of the documents use a foreign currency. Commits every
+	batch_size documents. Returns counts and elapsed seconds
+	"""
+	documents = int(documents)
+	rng = np.random.default_rng(seed)
+	started = time.perf_counter()
+
+	companies = frappe.get_all("Company", fields=["name", "default_currency"])
+	if not companies:
+		frappe.throw("Create a Company before generating the benchmark dataset")
+	items = get_bench_items()
+
+	as_of = getdate(today())
+	now = now_datetime()
+	user = frappe.session.user
+
+	# Dates, stages and transitions for the whole dataset, one vectorized pass
+	start_offsets = rng.integers(-1000, 200, documents)
+	durations = np.where(
+		rng.random(documents) < 0.8,
+		rng.choice(CONTRACT_DAYS, documents) + rng.integers(-15, 16, documents),
+		rng.integers(30, 1100, documents),
+	)
+	license_start = np.datetime64(as_of, "D") + start_offsets.astype("timedelta64[D]")
+	license_end = license_start + durations.astype("timedelta64[D]")
+	batch = classify_renewal_stages(license_start, license_end, as_of)
+	stages = get_stage_labels(batch.codes)
+	transitions = get_transition_dates(batch.next_transition)
+	license_start = license_start.astype(object).tolist()
+	license_end = license_end.astype(object).tolist()
+
+	item_counts = get_item_counts(rng, documents, int(max_items))
+	foreign = rng.random(documents) < 1 / 3
+	currencies = list(FOREIGN_CURRENCIES)
+
+	total_items = 0
+	for batch_start in range(0, documents, batch_size):
+		parents = []
+		children = []
+
+		for i in range(batch_start, min(batch_start + batch_size, documents)):
+			name = f"{BENCH_PREFIX}{i:07d}"
+			company = companies[i % len(companies)]
+			if foreign[i]:
+				currency = currencies[i % len(currencies)]
+				exchange_rate = FOREIGN_CURRENCIES[currency]
+			else:
+				currency = company.default_currency
+				exchange_rate = 1.0
+
+			net_total = 0.0
+			for idx in range(1, int(item_counts[i]) + 1):
+				item = items[int(rng.integers(len(items)))]
+				qty = float(rng.integers(1, 50))
+				rate = flt(rng.uniform(5, 5000), 2)
+				amount = flt(qty * rate, 2)
+				net_total += amount
+				children.append(
+					(
+						f"{name}-{idx:03d}",
+						now,
+						now,
+						user,
+						user,
+						1,
+						name,
+						"Renewal Tracking",
+						"items",
+						idx,
+						item.item_code,
+						item.item_name,
+						item.description or item.item_name,
+						item.item_group,
+						item.stock_uom,
+						qty,
+						rate,
+						amount,
+						flt(rate * exchange_rate, 2),
+						flt(amount * exchange_rate, 2),
+					)
+				)
+
+			parents.append(
+				(
+					name,
+					now,
+					now,
+					user,
+					user,
+					1,
+					"REN-ORD-.YYYY.-",
+					f"Benchmark Renewal {i}",
+					"Support & Maintenance",
+					"Not Decided",
+					add_days(license_start[i], -14),
+					license_start[i],
+					license_end[i],
+					stages[i],
+					transitions[i],
+					company.name,
+					currency,
+					exchange_rate,
+					flt(net_total, 2),
+					flt(net_total * exchange_rate, 2),
+				)
+			)
+
+		frappe.db.bulk_insert("Renewal Tracking", PARENT_FIELDS, parents)
+		frappe.db.bulk_insert("Renewal Tracking Item", ITEM_FIELDS, children)
+		frappe.db.commit()
+		total_items += len(children)
+
+	return {
+		"documents": documents,
+		"items": total_items,
+		"seconds": round(time.perf_counter() - started, 2),
+	}
+
+
+def delete_renewal_dataset():
+	"""Remove everything make_renewal_dataset inserted, along with the events and quotations it caused"""
+	like = f"{BENCH_PREFIX}%"
+	frappe.db.delete("Renewal Stage Event", {"renewal_tracking": ("like", like)})
+	frappe.db.delete("Renewal Tracking Item", {"parent": ("like", like)})
+	frappe.db.delete("Renewal Tracking", {"name": ("like", like)})
+	delete_imported_renewals()
+
+
+def delete_imported_renewals():
+	"""Remove the renewals import_renewals created from make_renewals_file files, named by the series"""
+	imported = frappe.get_all(
+		"Renewal Tracking", filters={"external_key": ("like", f"{BENCH_PREFIX}%")}, pluck="name"
+	)
+	for start in range(0, len(imported), 1000):
+		names = imported[start : start + 1000]
+		frappe.db.delete("Renewal Stage Event", {"renewal_tracking": ("in", names)})
+		frappe.db.delete("Renewal Tracking Item", {"parent": ("in", names)})
+		frappe.db.delete("Renewal Tracking", {"name": ("in", names)})
+	frappe.db.commit()
+
+
+def make_items_file(path, rows, seed=0):
+	"""
+	Write an import_items file with rows item lines to path
+
+	The format follows the extension: .csv, otherwise .xlsx
+	"""
+	rng = np.random.default_rng(seed)
+	items = get_bench_items()
+
+	def get_rows():
+		for _ in range(int(rows)):
+			item = items[int(rng.integers(len(items)))]
+			yield (
+				item.item_code,
+				item.item_name,
+				item.description or item.item_name,
+				"",
+				item.item_group,
+				item.stock_uom,
+				int(rng.integers(1, 50)),
+				flt(rng.uniform(5, 5000), 2),
+			)
+
+	if path.endswith(".csv"):
+		with open(path, "w", newline="", encoding="utf-8") as f:
+			writer = csv.writer(f)
+			writer.writerow(IMPORT_HEADERS)
+			writer.writerows(get_rows())
+		return path
+
+	import openpyxl
+
+	workbook = openpyxl.Workbook(write_only=True)
+	sheet = workbook.create_sheet()
+	sheet.append(IMPORT_HEADERS)
+	for row in get_rows():
+		sheet.append(row)
+	workbook.save(path)
+	return path
+
+
+def make_renewals_file(path, renewals, items_per_renewal=20, seed=0):
+	"""
+	Write an import_renewals file to path: renewals renewals keyed with
+	BENCH_PREFIX, each with items_per_renewal item lines. About a third use
+	a foreign currency with the rate given in the file
+
+	The format follows the extension: .csv, otherwise .xlsx
+	"""
+	rng = np.random.default_rng(seed)
+	items = get_bench_items()
+	companies = frappe.get_all("Company", fields=["name", "default_currency"])
+	if not companies:
+		frappe.throw("Create a Company before generating a renewals file")
+	currencies = list(FOREIGN_CURRENCIES)
+	as_of = getdate(today())
+
+	def get_rows():
+		for i in range(int(renewals)):
+			company = companies[i % len(companies)]
+			currency = currencies[i % len(currencies)] if rng.random() < 1 / 3 else company.default_currency
+			license_start = add_days(as_of, int(rng.integers(-1000, 200)))
+			header = (
+				f"{BENCH_PREFIX}{i:07d}",
+				f"Imported Renewal {i}",
+				license_start,
+				add_days(license_start, int(rng.choice(CONTRACT_DAYS))),
+				company.name,
+				currency,
+				FOREIGN_CURRENCIES.get(currency, 1.0),
+			)
+			for _ in range(int(items_per_renewal)):
+				item = items[int(rng.integers(len(items)))]
+				yield (
+					*header,
+					item.item_code,
+					item.item_name,
+					item.description or item.item_name,
+					"",
+					item.item_group,
+					item.stock_uom,
+					int(rng.integers(1, 50)),
+					flt(rng.uniform(5, 5000), 2),
+				)
+
+	headers = (*RENEWAL_IMPORT_HEADERS, *IMPORT_HEADERS)
+	if path.endswith(".csv"):
+		with open(path, "w", newline="", encoding="utf-8") as f:
+			writer = csv.writer(f)
+			writer.writerow(headers)
+			writer.writerows(get_rows())
+		return path
+
+	import openpyxl
+
+	workbook = openpyxl.Workbook(write_only=True)
+	sheet = workbook.create_sheet()
+	sheet.append(headers)
+	for row in get_rows():
+		sheet.append(row)
+	workbook.save(path)
+	return path
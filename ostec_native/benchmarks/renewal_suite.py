@@ -0,0 +1,384 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+End-to-end Renewal Tracking benchmarks, emitted as JSON for comparison across commits.
+
+	bench --site <site> execute ostec_native.benchmarks.renewal_suite.run
+	bench --site <site> execute ostec_native.benchmarks.renewal_suite.run --kwargs "{'documents': 10000, 'output': '/tmp/bench.json'}"
+
+Times the heavy and light jobs over the synthetic dataset, insert/save/validate
+with large item tables, the scalar and array line item paths, import_items
+on CSV and XLSX files, bulk renewal creation with import_renewals, the
+streaming export_renewals and the three make_* mappers against plain
+get_mapped_doc. Each case reports the min and median of repeat runs.
+The dataset is created once per site and kept between runs unless
+keep_dataset is False.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import frappe
+import numpy as np
+from frappe.utils import add_days, getdate, now_datetime, today
+from frappe.utils.file_manager import get_file_path
+
+from ostec_native.benchmarks.dataset import (
+	BENCH_PREFIX,
+	delete_imported_renewals,
+	delete_renewal_dataset,
+	make_items_file,
+	make_renewal_dataset,
+	make_renewals_file,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking import line_items
+from ostec_native.ostec_native.doctype.renewal_tracking.item_import import IMPORT_PAGE_LENGTH, clear_import_pages
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_export import export_renewals
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_import import import_renewals
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_mapping import (
+	RENEWAL_TABLE_MAPS,
+	SET_MISSING_VALUES,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import (
+	import_items,
+	import_items_page,
+	make_quotation,
+	make_request_for_quotation,
+	make_supplier_quotation,
+	run_renewal_stage_shard,
+	update_all_renewal_stages_light,
+)
+
+MAPPERS = (make_quotation, make_supplier_quotation, make_request_for_quotation)
+
+
+def timed(fn, repeat=3, setup=None):
+	"""min/median wall time of fn() over repeat runs, setup() runs untimed before each"""
+	timings = []
+	for _ in range(repeat):
+		if setup:
+			setup()
+		started = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - started)
+	return {
+		"repeat": repeat,
+		"min_seconds": round(min(timings), 4),
+		"median_seconds": round(statistics.median(timings), 4),
+	}
+
+
+def get_git_commit():
+	try:
+		return subprocess.check_output(
+			["git", "rev-parse", "--short", "HEAD"],
+			cwd=frappe.get_app_path("ostec_native"),
+			text=True,
+			stderr=subprocess.DEVNULL,
+		).strip()
+	except Exception:
+		return None
+
+
+def ensure_dataset(documents, max_items):
+	"""Generate the dataset unless a large enough one already exists"""
+	existing = frappe.db.count("Renewal Tracking", {"name": ("like", f"{BENCH_PREFIX}%")})
+	if existing >= documents:
+		return {"documents": existing, "reused": True}
+	if existing:
+		delete_renewal_dataset()
+	return make_renewal_dataset(documents, max_items)
+
+
+def mark_dataset_due():
+	"""Clear the stages of the whole dataset and make every row due today"""
+	frappe.db.sql(
+		"""UPDATE `tabRenewal Tracking`
+		SET renewal_stage = NULL, next_stage_transition = %(today)s
+		WHERE name LIKE %(prefix)s""",
+		{"today": today(), "prefix": f"{BENCH_PREFIX}%"},
+	)
+	frappe.db.commit()
+
+
+def bench_scheduler_jobs(documents):
+	"""
+	Heavy job in one process over every dataset row (all due), then the
+	steady state where nothing is due, then the light job
+	"""
+	as_of = getdate(today())
+
+	results = {
+		"heavy_all_due": timed(lambda: run_renewal_stage_shard(as_of, ""), repeat=1, setup=mark_dataset_due),
+		"heavy_nothing_due": timed(lambda: run_renewal_stage_shard(as_of, "")),
+		"light": timed(update_all_renewal_stages_light),
+	}
+	results["heavy_all_due"]["rows"] = documents
+	results["heavy_all_due"]["rows_per_second"] = int(documents / results["heavy_all_due"]["min_seconds"])
+	return results
+
+
+def make_draft(items):
+	"""Unsaved Renewal Tracking with items item rows, built from the bench item masters"""
+	item_rows = frappe.get_all(
+		"Renewal Tracking Item",
+		filters={"parent": ("like", f"{BENCH_PREFIX}%")},
+		fields=["item_code", "item_name", "description", "item_group", "oum", "qty", "rate"],
+		limit=items,
+	)
+	company = frappe.get_all("Company", fields=["name", "default_currency"], limit=1)[0]
+	return frappe.get_doc(
+		{
+			"doctype": "Renewal Tracking",
+			"renewal_title": "_Benchmark Draft",
+			"license_start": add_days(today(), -10),
+			"license_end": add_days(today(), 365),
+			"company": company.name,
+			"currency": company.default_currency,
+			"items": item_rows,
+		}
+	)
+
+
+def bench_document_save(item_rows, repeat):
+	"""
+	insert, save, validate and the calculate_values pass alone for drafts
+	with each item table size, rolled back afterwards
+	"""
+	results = {}
+	for items in item_rows:
+		doc = make_draft(items)
+		drafts = []
+		case = {
+			"insert": timed(
+				lambda: drafts.pop().insert(), repeat, setup=lambda: drafts.append(frappe.copy_doc(doc))
+			)
+		}
+
+		saved = frappe.copy_doc(doc).insert()
+		case["save"] = timed(saved.save, repeat)
+		case["validate"] = timed(lambda: saved.run_method("validate"), repeat)
+		case["calculate_values"] = timed(saved.calculate_values, repeat)
+
+		frappe.db.rollback()
+		results[str(items)] = case
+	return results
+
+
+def bench_line_items(line_item_rows, repeat):
+	"""
+	calculate_values on in-memory foreign currency drafts, the scalar loop
+	against the array path, with the largest total difference between them
+	"""
+	rng = np.random.default_rng(0)
+	doc = make_draft(1)
+	doc.currency = next(currency for currency in ("USD", "EUR") if currency != doc.get_company_currency())
+	doc.exchange_rate = 15.5
+	template = doc.items[0].as_dict()
+
+	results = {}
+	for rows in line_item_rows:
+		doc.items = []
+		for qty, rate in zip(rng.integers(1, 50, rows).tolist(), rng.uniform(5, 5000, rows).tolist()):
+			doc.append("items", {**template, "name": None, "qty": qty, "rate": rate})
+
+		with patch.object(line_items, "ARRAY_PATH_MIN_ROWS", sys.maxsize):
+			case = {"scalar": timed(doc.calculate_values, repeat)}
+			scalar_totals = (doc.net_total, doc.net_total_base)
+		case["array"] = timed(doc.calculate_values, repeat)
+		case["max_total_difference"] = max(
+			abs(scalar_totals[0] - doc.net_total), abs(scalar_totals[1] - doc.net_total_base)
+		)
+		results[str(rows)] = case
+	return results
+
+
+def peak_memory_mb(fn):
+	"""Peak Python heap allocated while fn() runs, in MB"""
+	tracemalloc.start()
+	try:
+		fn()
+		return round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+	finally:
+		tracemalloc.stop()
+
+
+def read_all_pages(file_url):
+	"""
+	Every page of import_items_page, keeping only the current one like the
+	form does. The pages kept from an earlier run are dropped first, so
+	each run reads the file
+	"""
+	clear_import_pages(get_file_path(file_url))
+	start = 0
+	while start is not None:
+		start = import_items_page(file_url, start)["next_start"]
+
+
+def bench_import_items(import_rows, repeat):
+	"""
+	import_items and the paged import_items_page over generated CSV and
+	XLSX files of each size, with rows per second and peak heap of each.
+	import_items only takes files of up to one page
+	"""
+	results = {}
+	for rows in import_rows:
+		for extension in ("csv", "xlsx"):
+			file_name = f"renewal-bench-items-{rows}.{extension}"
+			file_url = f"/private/files/{file_name}"
+			path = make_items_file(frappe.get_site_path("private", "files", file_name), rows)
+			try:
+				modes = [("paged", lambda: read_all_pages(file_url))]
+				if rows <= IMPORT_PAGE_LENGTH:
+					modes.append(("all", lambda: import_items(file_url, None)))
+				for mode, fn in modes:
+					case = timed(fn, repeat)
+					case["rows_per_second"] = int(rows / case["min_seconds"])
+					case["peak_memory_mb"] = peak_memory_mb(fn)
+					results[f"{extension}_{rows}_{mode}"] = case
+			finally:
+				clear_import_pages(path)
+				os.remove(path)
+	return results
+
+
+def bench_renewal_import(renewal_import_sizes):
+	"""
+	import_renewals of a generated CSV per (renewals, items per renewal)
+	size, run once each since the renewals stay created, with renewals and
+	item rows per second
+	"""
+	results = {}
+	for renewals, items_per_renewal in renewal_import_sizes:
+		file_name = f"renewal-bench-renewals-{renewals}.csv"
+		path = make_renewals_file(frappe.get_site_path("private", "files", file_name), renewals, items_per_renewal)
+		try:
+			summary = import_renewals(f"/private/files/{file_name}")
+			results[f"{renewals}x{items_per_renewal}"] = {
+				"renewals": summary.renewals,
+				"items": summary.items,
+				"failed": summary.failed,
+				"seconds": summary.seconds,
+				"renewals_per_second": int(summary.renewals / summary.seconds) if summary.seconds else None,
+				"items_per_second": int(summary.items / summary.seconds) if summary.seconds else None,
+			}
+		finally:
+			os.remove(path)
+			delete_imported_renewals()
+	return results
+
+
+def bench_export(file_formats=("CSV", "Excel")):
+	"""
+	export_renewals of every dataset renewal and item row per format, with
+	the time to the first block of the response body, rows per second and
+	peak heap while the body is consumed
+	"""
+	filters = [["Renewal Tracking", "name", "like", f"{BENCH_PREFIX}%"]]
+	results = {}
+	for doctype in ("Renewal Tracking", "Renewal Tracking Item"):
+		for file_format in file_formats:
+			case = {}
+
+			def consume():
+				started = time.perf_counter()
+				body = iter(export_renewals(filters, doctype, file_format).response)
+				size = len(next(body))
+				case["first_byte_seconds"] = round(time.perf_counter() - started, 4)
+				for block in body:
+					size += len(block)
+				case["seconds"] = round(time.perf_counter() - started, 4)
+				case["bytes"] = size
+
+			case["peak_memory_mb"] = peak_memory_mb(consume)
+			case["rows"] = (
+				frappe.db.count("Renewal Tracking Item", {"parent": ("like", f"{BENCH_PREFIX}%")})
+				if doctype == "Renewal Tracking Item"
+				else frappe.db.count("Renewal Tracking", {"name": ("like", f"{BENCH_PREFIX}%")})
+			)
+			case["rows_per_second"] = int(case["rows"] / case["seconds"]) if case["seconds"] else None
+			results[f"{frappe.scrub(doctype)}_{file_format.lower()}"] = case
+	return results
+
+
+def bench_mappers(item_rows, repeat):
+	"""
+	The three make_* mappers, now on compiled mapping plans, next to plain
+	get_mapped_doc with the same table maps, on a saved draft with each item
+	table size, rolled back afterwards
+	"""
+	from frappe.model.mapper import get_mapped_doc
+
+	results = {}
+	for items in item_rows:
+		source = make_draft(items).insert()
+		for mapper, target_doctype in zip(MAPPERS, ("Quotation", "Supplier Quotation", "Request for Quotation")):
+			# the first call compiles the plan, the timed ones reuse it like every later click
+			mapper(source.name)
+			case = timed(lambda: mapper(source.name), repeat)
+			case["get_mapped_doc"] = timed(
+				lambda: get_mapped_doc(
+					"Renewal Tracking",
+					source.name,
+					RENEWAL_TABLE_MAPS[target_doctype],
+					None,
+					SET_MISSING_VALUES[target_doctype],
+				),
+				repeat,
+			)
+			case["items"] = len(source.items)
+			case["speedup"] = round(case["get_mapped_doc"]["min_seconds"] / case["min_seconds"], 2)
+			results[f"{mapper.__name__}_{items}"] = case
+		frappe.db.rollback()
+	return results
+
+
+def run(
+	documents=100_000,
+	max_items=500,
+	item_rows=(100, 500, 2000),
+	import_rows=(5_000, 100_000),
+	mapper_rows=(10, 1000, 5000),
+	line_item_rows=(100, 1000, 10_000),
+	renewal_import_sizes=((1000, 20), (10_000, 20)),
+	repeat=3,
+	output=None,
+	keep_dataset=True,
+):
+	"""Run every benchmark, print the JSON report and write it to output when given"""
+	started = now_datetime()
+	dataset = ensure_dataset(int(documents), int(max_items))
+
+	report = {
+		"benchmark": "renewal_suite",
+		"commit": get_git_commit(),
+		"site": frappe.local.site,
+		"started_at": str(started),
+		"dataset": dataset,
+		"results": {
+			"scheduler": bench_scheduler_jobs(int(documents)),
+			"document_save": bench_document_save(item_rows, repeat),
+			"line_items": bench_line_items(line_item_rows, repeat),
+			"import_items": bench_import_items(import_rows, repeat),
+			"renewal_import": bench_renewal_import(renewal_import_sizes),
+			"export": bench_export(),
+			"mappers": bench_mappers(mapper_rows, repeat),
+		},
+	}
+
+	if not keep_dataset:
+		delete_renewal_dataset()
+
+	output_json = json.dumps(report, indent=1, default=str)
+	if output:
+		with open(output, "w") as f:
+			f.write(output_json)
+	print(output_json)
+	return report
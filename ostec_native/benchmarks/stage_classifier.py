@@ -0,0 +1,99 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Throughput of the vectorized renewal stage classifier on synthetic rows,
+against reference_renewal_stage, the per-document logic it replaced. The
+tests check the classifier against the same reference.
+
+	bench --site <site> execute ostec_native.benchmarks.stage_classifier.run
+	bench --site <site> execute ostec_native.benchmarks.stage_classifier.run --kwargs "{'rows': 100000}"
+"""
+
+import json
+import time
+
+import numpy as np
+from frappe.utils import add_days, date_diff, getdate, today
+
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_stage import classify_renewal_stages
+
+
+def reference_renewal_stage(license_start, license_end, now_date):
+	"""Per-document stage logic as it was before the vectorized classifier"""
+	now_date = getdate(now_date)
+	license_start = getdate(license_start)
+	license_end = getdate(license_end)
+
+	date_90_days_before = add_days(license_end, -90)
+	date_60_days_before = add_days(license_end, -60)
+	date_30_days_before = add_days(license_end, -30)
+
+	if now_date < license_start:
+		stage = "Open"
+	elif now_date >= license_end:
+		stage = "Expired"
+	elif now_date >= date_30_days_before:
+		stage = "30 Days to Expiry"
+	elif now_date >= date_60_days_before:
+		stage = "60 Days to Expiry"
+	elif now_date >= date_90_days_before:
+		stage = "90 Days to Expiry"
+	else:
+		stage = "Running"
+
+	if now_date < license_start:
+		next_transition = license_start
+	elif now_date < date_90_days_before:
+		next_transition = date_90_days_before
+	elif now_date < date_60_days_before:
+		next_transition = date_60_days_before
+	elif now_date < date_30_days_before:
+		next_transition = date_30_days_before
+	elif now_date < license_end:
+		next_transition = license_end
+	else:
+		next_transition = None
+
+	return stage, next_transition, date_diff(license_end, now_date)
+
+
+def make_synthetic_dates(rows, seed=0):
+	"""license_start/license_end arrays spread around today, 1 day to ~3 years long"""
+	rng = np.random.default_rng(seed)
+	as_of = np.datetime64(getdate(today()), "D")
+	license_start = as_of + rng.integers(-1000, 200, rows).astype("timedelta64[D]")
+	license_end = license_start + rng.integers(1, 1100, rows).astype("timedelta64[D]")
+	return license_start, license_end
+
+
+def run(rows=1_000_000, reference_rows=100_000, repeat=3):
+	"""Time classify_renewal_stages over rows and the per-document logic over reference_rows"""
+	license_start, license_end = make_synthetic_dates(rows)
+	as_of = today()
+
+	timings = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		classify_renewal_stages(license_start, license_end, as_of)
+		timings.append(time.perf_counter() - started)
+	vectorized = min(timings)
+
+	starts = license_start[:reference_rows].astype(object)
+	ends = license_end[:reference_rows].astype(object)
+	started = time.perf_counter()
+	for start, end in zip(starts, ends):
+		reference_renewal_stage(start, end, as_of)
+	per_document = time.perf_counter() - started
+
+	result = {
+		"benchmark": "stage_classifier",
+		"rows": rows,
+		"vectorized_seconds": round(vectorized, 4),
+		"vectorized_rows_per_second": int(rows / vectorized),
+		"per_document_rows": len(starts),
+		"per_document_seconds": round(per_document, 4),
+		"per_document_rows_per_second": int(len(starts) / per_document),
+	}
+	print(json.dumps(result, indent=1))
+	return result
@@ -145,6 +145,23 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Company": {
+		"on_update": "ostec_native.utils.currency.clear_company_currency_cache",
+		"on_trash": "ostec_native.utils.currency.clear_company_currency_cache",
+	},
+	"Currency Exchange": {
+		"on_update": [
+			"ostec_native.utils.currency.clear_exchange_rate_cache",
+			"ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.enqueue_draft_renewal_revaluation",
+		],
+		"on_trash": [
+			"ostec_native.utils.currency.clear_exchange_rate_cache",
+			"ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.enqueue_draft_renewal_revaluation",
+		],
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
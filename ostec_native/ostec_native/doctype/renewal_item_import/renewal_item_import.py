@@ -0,0 +1,260 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Background import of item files into draft Renewal Tracking documents.
+
+enqueue_item_import records a Renewal Item Import and queues
+run_item_import on the long queue. The worker streams the file through
+item_import, checks each chunk against the masters, computes line values
+with calculate_line_items and bulk inserts the rows straight into the
+draft, so neither the web request nor the browser ever holds the whole
+file.
+
+Replacing the items is one transaction, committed once the last chunk is
+in: an import that fails leaves the draft with its old items and totals.
+
+Progress goes out on the renewal_item_import_progress realtime event of
+the Renewal Tracking as every chunk goes in. The Renewal Item Import
+record, which the form polls in case realtime is unavailable, is written
+when the import starts and ends, outside the items transaction.
+"""
+
+import json
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+from frappe.utils.file_manager import get_file_path
+
+from ostec_native.ostec_native.doctype.renewal_tracking.item_import import (
+	count_data_rows,
+	is_csv,
+	iter_resolved_chunks,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.line_items import calculate_line_items
+from ostec_native.utils.currency import get_company_currency
+
+ITEM_IMPORT_PROGRESS_EVENT = "renewal_item_import_progress"
+
+RUN_ITEM_IMPORT_METHOD = (
+	"ostec_native.ostec_native.doctype.renewal_item_import.renewal_item_import.run_item_import"
+)
+
+ITEM_ROW_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"parent",
+	"parenttype",
+	"parentfield",
+	"idx",
+	"item_code",
+	"item_name",
+	"description",
+	"brand",
+	"item_group",
+	"oum",
+	"qty",
+	"rate",
+	"amount",
+	"base_rate",
+	"base_amount",
+)
+
+STATUS_FIELDS = ("status", "total_rows", "rows_read", "rows_imported", "rows_failed")
+
+# Error Details keeps the first rejected rows, rows_failed counts all of them
+MAX_ERROR_DETAILS = 1000
+
+
+class RenewalItemImport(Document):
+	pass
+
+
+@frappe.whitelist()
+def enqueue_item_import(renewal_tracking, file_url):
+	"""
+	Queue the import of file_url into the draft renewal_tracking, replacing
+	its items. Returns the name of the Renewal Item Import to follow
+	"""
+	renewal = frappe.get_doc("Renewal Tracking", renewal_tracking)
+	renewal.check_permission("write")
+	if renewal.docstatus != 0:
+		frappe.throw("Items can only be imported into a draft Renewal Tracking")
+
+	if frappe.db.exists(
+		"Renewal Item Import", {"renewal_tracking": renewal_tracking, "status": ("in", ("Queued", "Running"))}
+	):
+		frappe.throw(f"An item import into {renewal_tracking} is already running")
+
+	item_import = frappe.get_doc(
+		{
+			"doctype": "Renewal Item Import",
+			"renewal_tracking": renewal_tracking,
+			"file_url": file_url,
+			"status": "Queued",
+		}
+	).insert(ignore_permissions=True)
+
+	frappe.enqueue(
+		RUN_ITEM_IMPORT_METHOD,
+		queue="long",
+		job_id=f"renewal_item_import::{renewal_tracking}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		import_name=item_import.name,
+	)
+	return item_import.name
+
+
+@frappe.whitelist()
+def get_item_import_status(import_name):
+	"""Counters and status of an item import, with the rejected rows once it has ended"""
+	renewal_tracking = frappe.db.get_value("Renewal Item Import", import_name, "renewal_tracking")
+	if not renewal_tracking:
+		frappe.throw(f"Renewal Item Import {import_name} not found", frappe.DoesNotExistError)
+	frappe.has_permission("Renewal Tracking", "read", renewal_tracking, throw=True)
+
+	return get_status_message(import_name)
+
+
+def get_status_message(import_name):
+	status = frappe.db.get_value(
+		"Renewal Item Import", import_name, ["name", *STATUS_FIELDS, "error_details"], as_dict=True
+	)
+	status.errors = json.loads(status.pop("error_details") or "[]")
+	return status
+
+
+def run_item_import(import_name):
+	"""Worker side of enqueue_item_import"""
+	item_import = frappe.get_doc("Renewal Item Import", import_name)
+	renewal_tracking = item_import.renewal_tracking
+
+	counters = frappe._dict(total_rows=0, rows_read=0, rows_imported=0, rows_failed=0)
+	errors = []
+
+	try:
+		renewal = frappe.db.get_value(
+			"Renewal Tracking",
+			renewal_tracking,
+			["docstatus", "company", "currency", "exchange_rate"],
+			as_dict=True,
+		)
+		if not renewal or renewal.docstatus != 0:
+			frappe.throw(f"{renewal_tracking} is no longer a draft")
+
+		company_currency = get_company_currency(renewal.company)
+		convert = bool(renewal.currency and company_currency and renewal.currency != company_currency)
+
+		file_path = get_file_path(item_import.file_url)
+		csv_file = is_csv(item_import.file_url)
+
+		counters.total_rows = count_data_rows(file_path, csv_file)
+		update_status(item_import, "Running", counters, started_at=now_datetime())
+
+		# Nothing is committed from here until the last chunk is in.
+		# The file replaces the items, like the import on the form
+		frappe.db.delete(
+			"Renewal Tracking Item",
+			{"parent": renewal_tracking, "parenttype": "Renewal Tracking", "parentfield": "items"},
+		)
+
+		net_total = 0.0
+		net_total_base = 0.0
+		for items, chunk_errors in iter_resolved_chunks(file_path, csv_file):
+			rows = [frappe._dict(item) for item in items]
+			chunk_total, chunk_total_base = calculate_line_items(rows, renewal.exchange_rate, convert)
+			net_total += chunk_total
+			net_total_base += chunk_total_base
+
+			insert_item_rows(renewal_tracking, rows, start_idx=counters.rows_imported + 1)
+
+			# a rejected row can fail several checks
+			failed_rows = len({error["row"] for error in chunk_errors})
+			counters.rows_read += len(items) + failed_rows
+			counters.rows_imported += len(items)
+			counters.rows_failed += failed_rows
+			errors.extend(chunk_errors[: MAX_ERROR_DETAILS - len(errors)])
+			publish_status(item_import, {**counters, "status": "Running"})
+
+		# items_fingerprint is cleared so the next save of the draft recalculates from the new rows
+		frappe.db.set_value(
+			"Renewal Tracking",
+			renewal_tracking,
+			{"net_total": net_total, "net_total_base": net_total_base, "items_fingerprint": None},
+		)
+		update_status(item_import, "Completed", counters, errors=errors, ended_at=now_datetime())
+
+	except Exception as e:
+		# Drops every chunk inserted so far and the delete of the old items
+		frappe.db.rollback()
+		counters.rows_imported = 0
+		frappe.log_error(
+			message=frappe.get_traceback(), title=f"Renewal Item Import Failed - {renewal_tracking}"
+		)
+		errors.append({"row": None, "item_code": None, "field": None, "value": None, "message": str(e)})
+		update_status(item_import, "Failed", counters, errors=errors, ended_at=now_datetime())
+
+
+def insert_item_rows(renewal_tracking, rows, start_idx=1):
+	"""Bulk insert computed item rows under the draft, numbered from start_idx"""
+	now = now_datetime()
+	user = frappe.session.user
+	frappe.db.bulk_insert(
+		"Renewal Tracking Item",
+		ITEM_ROW_FIELDS,
+		[
+			(
+				frappe.generate_hash(length=10),
+				now,
+				now,
+				user,
+				user,
+				0,
+				renewal_tracking,
+				"Renewal Tracking",
+				"items",
+				idx,
+				row.item_code,
+				row.item_name,
+				row.description,
+				row.brand,
+				row.item_group,
+				row.oum,
+				row.qty,
+				row.rate,
+				row.amount,
+				row.base_rate,
+				row.base_amount,
+			)
+			for idx, row in enumerate(rows, start_idx)
+		],
+	)
+
+
+def update_status(item_import, status, counters, errors=None, **values):
+	"""Store progress on the Renewal Item Import, commit, and push it to the renewal's form"""
+	values.update(counters, status=status)
+	if errors is not None:
+		values["error_details"] = json.dumps(errors, default=str)
+	frappe.db.set_value("Renewal Item Import", item_import.name, values)
+	frappe.db.commit()
+	publish_status(item_import, values, errors)
+
+
+def publish_status(item_import, values, errors=None):
+	"""Push the status and counters in values to the renewal's form, without touching the database"""
+	message = {"name": item_import.name, **{field: values[field] for field in STATUS_FIELDS}}
+	if errors is not None:
+		message["errors"] = errors
+	frappe.publish_realtime(
+		ITEM_IMPORT_PROGRESS_EVENT,
+		message,
+		doctype="Renewal Tracking",
+		docname=item_import.renewal_tracking,
+	)
@@ -0,0 +1,134 @@
+# Copyright (c) 2026, Richmond Gedziq and Contributors
+# See license.txt
+
+import os
+from functools import partial
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, flt, today
+
+from ostec_native.benchmarks.dataset import get_bench_items, make_items_file
+from ostec_native.ostec_native.doctype.renewal_item_import import renewal_item_import
+from ostec_native.ostec_native.doctype.renewal_item_import.renewal_item_import import (
+	get_item_import_status,
+	insert_item_rows,
+	run_item_import,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.item_import import iter_resolved_chunks
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import import_items
+from ostec_native.ostec_native.doctype.renewal_tracking.test_renewal_tracking import make_renewal
+
+
+class TestRenewalItemImport(FrappeTestCase):
+	def setUp(self):
+		self.renewal = make_renewal(add_days(today(), -10), add_days(today(), 200), submit=False)
+
+	def tearDown(self):
+		# run_item_import commits per chunk, so the rows have to go explicitly
+		frappe.db.delete("Renewal Item Import", {"renewal_tracking": self.renewal.name})
+		frappe.db.delete("Renewal Tracking Item", {"parent": self.renewal.name})
+		frappe.db.delete("Renewal Tracking", {"name": self.renewal.name})
+		frappe.db.commit()
+
+	def make_import(self, rows):
+		file_name = "_test-renewal-item-import.csv"
+		path = make_items_file(frappe.get_site_path("private", "files", file_name), rows)
+		self.addCleanup(os.remove, path)
+
+		item_import = frappe.get_doc(
+			{
+				"doctype": "Renewal Item Import",
+				"renewal_tracking": self.renewal.name,
+				"file_url": f"/private/files/{file_name}",
+			}
+		).insert(ignore_permissions=True)
+		# the job rolls back on failure, the records have to outlive that like enqueued ones do
+		frappe.db.commit()
+		return item_import
+
+	def test_job_writes_items_and_totals_like_a_save(self):
+		item_import = self.make_import(120)
+		run_item_import(item_import.name)
+
+		status = get_item_import_status(item_import.name)
+		self.assertEqual(status.status, "Completed")
+		self.assertEqual(status.total_rows, 120)
+		self.assertEqual(status.rows_imported, 120)
+		self.assertEqual(status.rows_failed, 0)
+		self.assertEqual(status.errors, [])
+
+		doc = frappe.get_doc("Renewal Tracking", self.renewal.name)
+		self.assertEqual([item.idx for item in doc.items], list(range(1, 121)))
+		self.assertEqual(
+			[(item.item_code, flt(item.qty), flt(item.rate)) for item in doc.items],
+			[(item["item_code"], item["qty"], item["rate"]) for item in import_items(item_import.file_url, None)],
+		)
+
+		def line_values(doc):
+			# Currency columns keep 9 decimals, so compare past the float noise
+			return [(flt(item.amount, 6), flt(item.base_amount, 6)) for item in doc.items]
+
+		stored = line_values(doc)
+		net_total, net_total_base = flt(doc.net_total), flt(doc.net_total_base)
+		doc.calculate_values()
+		self.assertEqual(stored, line_values(doc))
+		self.assertAlmostEqual(net_total, flt(doc.net_total), places=2)
+		self.assertAlmostEqual(net_total_base, flt(doc.net_total_base), places=2)
+
+	def test_job_fails_on_submitted_renewal(self):
+		item_import = self.make_import(5)
+		frappe.db.set_value("Renewal Tracking", self.renewal.name, "docstatus", 1)
+		frappe.db.commit()
+
+		run_item_import(item_import.name)
+
+		status = get_item_import_status(item_import.name)
+		self.assertEqual(status.status, "Failed")
+		self.assertEqual(status.rows_imported, 0)
+		self.assertIn("no longer a draft", status.errors[-1]["message"])
+		self.assertFalse(frappe.db.exists("Renewal Tracking Item", {"parent": self.renewal.name}))
+
+	def test_failed_import_leaves_draft_unchanged(self):
+		doc = frappe.get_doc("Renewal Tracking", self.renewal.name)
+		for item in get_bench_items()[:3]:
+			doc.append("items", {"item_code": item.item_code, "qty": 2, "rate": 10.5})
+		doc.save()
+		frappe.db.commit()
+
+		def get_state():
+			return (
+				frappe.get_all(
+					"Renewal Tracking Item",
+					filters={"parent": self.renewal.name},
+					fields=["name", "idx", "item_code", "qty", "rate", "amount", "base_amount"],
+					order_by="idx",
+				),
+				frappe.db.get_value(
+					"Renewal Tracking", self.renewal.name, ["net_total", "net_total_base", "items_fingerprint"]
+				),
+			)
+
+		before = get_state()
+		item_import = self.make_import(120)
+
+		chunks = []
+
+		def fail_on_second_chunk(*args, **kwargs):
+			chunks.append(args)
+			if len(chunks) == 2:
+				raise frappe.ValidationError("Second chunk failed")
+			return insert_item_rows(*args, **kwargs)
+
+		# 50 row chunks, so the first one is already in when the second fails
+		with patch.object(
+			renewal_item_import, "iter_resolved_chunks", partial(iter_resolved_chunks, chunk_size=50)
+		), patch.object(renewal_item_import, "insert_item_rows", side_effect=fail_on_second_chunk):
+			run_item_import(item_import.name)
+
+		status = get_item_import_status(item_import.name)
+		self.assertEqual(status.status, "Failed")
+		self.assertEqual(status.rows_imported, 0)
+		self.assertIn("Second chunk failed", status.errors[-1]["message"])
+		self.assertEqual(get_state(), before)
@@ -0,0 +1,148 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Ledger of renewal scheduler runs.
+
+Every run of update_all_renewal_stages_heavy / _light gets one Renewal Job
+Run record holding its counters and the wall time spent fetching rows,
+classifying them and writing them back. get_job_run_trends() turns the
+last N runs into percentiles so slowdowns show up inside the system
+instead of only in worker logs.
+"""
+
+import time
+from contextlib import contextmanager
+
+import frappe
+import numpy as np
+from frappe.model.document import Document
+from frappe.utils import cint, flt, now_datetime, time_diff_in_seconds
+
+# Counters and phase timings stored on every run, summed across shards
+JOB_RUN_COUNTERS = ("rows_scanned", "rows_written", "stage_changes", "errors", "commit_count")
+JOB_RUN_PHASES = ("fetch_time", "compute_time", "write_time")
+
+TREND_FIELDS = ("duration", "lock_wait_time", *JOB_RUN_COUNTERS, *JOB_RUN_PHASES)
+TREND_PERCENTILES = (50, 90, 95, 99)
+
+# Error Details keeps the first few messages, the full list is in the Error Log
+MAX_ERROR_DETAILS = 50
+
+
+class RenewalJobRun(Document):
+	pass
+
+
+class JobRunMetrics:
+	"""Counters and per-phase wall time of one renewal job run or shard"""
+
+	def __init__(self, **values):
+		for field in JOB_RUN_COUNTERS:
+			setattr(self, field, cint(values.get(field)))
+		for field in JOB_RUN_PHASES:
+			setattr(self, field, flt(values.get(field)))
+
+	@contextmanager
+	def phase(self, name):
+		"""Add the wall time spent in the block to the <name>_time phase"""
+		field = f"{name}_time"
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			setattr(self, field, getattr(self, field) + time.perf_counter() - start)
+
+	def add(self, other):
+		for field in JOB_RUN_COUNTERS + JOB_RUN_PHASES:
+			setattr(self, field, getattr(self, field) + getattr(other, field))
+		return self
+
+	def as_dict(self):
+		return {field: getattr(self, field) for field in JOB_RUN_COUNTERS + JOB_RUN_PHASES}
+
+
+def start_job_run(job_type, as_of, shards=1, lock_wait_time=0, status="Running"):
+	"""Insert a ledger entry, Running unless given another status, and commit it. Returns its name"""
+	job_run = frappe.get_doc(
+		{
+			"doctype": "Renewal Job Run",
+			"job_type": job_type,
+			"status": status,
+			"as_of": as_of,
+			"shards": shards,
+			"started_at": now_datetime(),
+			"lock_wait_time": lock_wait_time,
+		}
+	).insert(ignore_permissions=True)
+	frappe.db.commit()
+	return job_run.name
+
+
+def finish_job_run(name, metrics, status="Completed", errors=None):
+	"""Store the final counters, timings and status of a run and commit them"""
+	ended_at = now_datetime()
+	started_at = frappe.db.get_value("Renewal Job Run", name, "started_at")
+
+	values = metrics.as_dict()
+	values.update(
+		status=status,
+		ended_at=ended_at,
+		duration=time_diff_in_seconds(ended_at, started_at) if started_at else 0,
+	)
+	if errors:
+		values["error_details"] = "\n".join(errors[:MAX_ERROR_DETAILS])
+
+	frappe.db.set_value("Renewal Job Run", name, values)
+	frappe.db.commit()
+
+
+@frappe.whitelist()
+def get_job_run_trends(job_type=None, last_n=30):
+	"""
+	Percentiles of duration, counters and phase timings over the last N
+	completed runs, optionally for one job type
+
+	change compares the median of the newer half of the window with the
+	older half, 0.25 means the newer runs are 25% higher
+	"""
+	frappe.has_permission("Renewal Job Run", "read", throw=True)
+
+	filters = {"status": "Completed"}
+	if job_type:
+		filters["job_type"] = job_type
+
+	runs = frappe.get_all(
+		"Renewal Job Run",
+		filters=filters,
+		fields=["started_at", *TREND_FIELDS],
+		order_by="started_at desc",
+		limit=cint(last_n) or 30,
+	)
+	if not runs:
+		return {"runs": 0, "fields": {}}
+
+	# oldest first
+	runs.reverse()
+	half = len(runs) // 2
+
+	trends = {}
+	for field in TREND_FIELDS:
+		values = np.array([flt(run[field]) for run in runs])
+		percentiles = np.percentile(values, TREND_PERCENTILES)
+
+		trend = {f"p{p}": round(float(value), 3) for p, value in zip(TREND_PERCENTILES, percentiles)}
+		trend["max"] = float(values.max())
+		trend["latest"] = float(values[-1])
+
+		older, newer = (np.median(values[:half]), np.median(values[half:])) if half else (0, 0)
+		trend["change"] = round(float(newer / older - 1), 3) if older else None
+
+		trends[field] = trend
+
+	return {
+		"runs": len(runs),
+		"from": runs[0].started_at,
+		"to": runs[-1].started_at,
+		"fields": trends,
+	}
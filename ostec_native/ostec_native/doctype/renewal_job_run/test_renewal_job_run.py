@@ -0,0 +1,83 @@
+# Copyright (c) 2026, Richmond Gedziq and Contributors
+# See license.txt
+
+import time
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, add_to_date, now_datetime, today
+
+from ostec_native.ostec_native.doctype.renewal_job_run.renewal_job_run import (
+	JobRunMetrics,
+	get_job_run_trends,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import (
+	update_all_renewal_stages_heavy,
+	update_all_renewal_stages_light,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.test_renewal_tracking import make_renewal
+
+
+class TestRenewalJobRun(FrappeTestCase):
+	def test_light_job_records_run(self):
+		now = today()
+		doc = make_renewal(add_days(now, -200), add_days(now, 45))
+		frappe.db.sql(
+			"""update `tabRenewal Tracking` set renewal_stage = null, next_stage_transition = %s
+			where name = %s""",
+			(now, doc.name),
+		)
+
+		summary = update_all_renewal_stages_light()
+		job_run = frappe.get_doc("Renewal Job Run", summary["job_run"])
+
+		self.assertEqual(job_run.job_type, "Light")
+		self.assertEqual(job_run.status, "Completed")
+		self.assertEqual(job_run.rows_scanned, summary["total"])
+		self.assertEqual(job_run.stage_changes, summary["stage_changes"])
+		self.assertGreaterEqual(job_run.rows_written, 1)
+		self.assertGreaterEqual(job_run.commit_count, 1)
+		self.assertGreaterEqual(job_run.duration, job_run.write_time)
+		self.assertTrue(job_run.ended_at)
+
+	def test_heavy_job_records_run(self):
+		summary = update_all_renewal_stages_heavy()
+		job_run = frappe.get_doc("Renewal Job Run", summary.get("job_run") or summary.get("run_id"))
+		self.assertEqual(job_run.job_type, "Heavy")
+		self.assertGreaterEqual(job_run.shards, 1)
+
+	def test_metrics_phase_and_add(self):
+		metrics = JobRunMetrics()
+		with metrics.phase("fetch"):
+			time.sleep(0.01)
+		metrics.rows_scanned += 10
+
+		total = JobRunMetrics(rows_scanned=5, fetch_time=1).add(metrics)
+		self.assertEqual(total.rows_scanned, 15)
+		self.assertGreater(total.fetch_time, 1.009)
+		self.assertEqual(total.compute_time, 0)
+
+	def test_trends(self):
+		frappe.db.delete("Renewal Job Run", {"job_type": "Heavy"})
+		started_at = add_to_date(now_datetime(), days=-30)
+		for i in range(10):
+			frappe.get_doc(
+				{
+					"doctype": "Renewal Job Run",
+					"job_type": "Heavy",
+					"status": "Completed",
+					"started_at": add_to_date(started_at, days=i),
+					# newer runs take twice as long
+					"duration": 10 if i < 5 else 20,
+					"rows_scanned": 100 * (i + 1),
+				}
+			).insert()
+
+		trends = get_job_run_trends("Heavy", last_n=10)
+		self.assertEqual(trends["runs"], 10)
+		self.assertEqual(trends["fields"]["duration"]["p50"], 15)
+		self.assertEqual(trends["fields"]["duration"]["latest"], 20)
+		self.assertEqual(trends["fields"]["duration"]["change"], 1)
+		self.assertEqual(trends["fields"]["rows_scanned"]["max"], 1000)
+
+		self.assertEqual(get_job_run_trends("Heavy", last_n=4)["runs"], 4)
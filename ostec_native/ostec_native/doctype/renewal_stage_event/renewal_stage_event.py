@@ -0,0 +1,94 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Append-only log of Renewal Tracking stage transitions.
+
+Events are named by autoincrement, so the name is a monotonic event id:
+consumers (digests, analytics, dashboards) remember the last id they saw
+and read forward with get_stage_events(after=...) instead of rescanning
+Renewal Tracking. Rows are only ever inserted, by record_stage_events.
+"""
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint, getdate, now_datetime, today
+
+STAGE_EVENT_SOURCES = ("Heavy", "Light", "Save", "Submit", "Manual")
+
+STAGE_EVENT_FIELDS = ("renewal_tracking", "old_stage", "new_stage", "as_of", "days_remaining", "source")
+
+
+class RenewalStageEvent(Document):
+	pass
+
+
+def record_stage_events(changes, source, as_of=None):
+	"""
+	Append one event per stage change with a single multi-row INSERT
+
+	changes are dicts (name, old_stage, new_stage, days_remaining) as
+	returned by write_renewal_stages, rows whose stage did not move are
+	ignored. Runs in the caller's transaction so events commit or roll
+	back together with the stage update
+	"""
+	if source not in STAGE_EVENT_SOURCES:
+		frappe.throw(f"Invalid stage event source: {source}")
+
+	as_of = getdate(as_of or today())
+	now = now_datetime()
+	user = frappe.session.user
+
+	values = [
+		(
+			now,
+			now,
+			user,
+			user,
+			change["name"],
+			change["old_stage"],
+			change["new_stage"],
+			as_of,
+			change["days_remaining"],
+			source,
+		)
+		for change in changes
+		if change["old_stage"] != change["new_stage"]
+	]
+	if values:
+		frappe.db.bulk_insert(
+			"Renewal Stage Event",
+			("creation", "modified", "owner", "modified_by", *STAGE_EVENT_FIELDS),
+			values,
+		)
+
+	return len(values)
+
+
+@frappe.whitelist()
+def get_stage_events(after=0, limit=500, renewal_tracking=None, source=None):
+	"""
+	Stage events with an id greater than after, oldest first
+
+	Returns {"events": [...], "last_event_id": id to pass as after next time}
+	"""
+	frappe.has_permission("Renewal Stage Event", "read", throw=True)
+
+	filters = [["name", ">", cint(after)]]
+	if renewal_tracking:
+		filters.append(["renewal_tracking", "=", renewal_tracking])
+	if source:
+		filters.append(["source", "=", source])
+
+	events = frappe.get_all(
+		"Renewal Stage Event",
+		filters=filters,
+		fields=["name", "creation", *STAGE_EVENT_FIELDS],
+		order_by="name asc",
+		limit=cint(limit) or 500,
+	)
+
+	return {
+		"events": events,
+		"last_event_id": events[-1].name if events else cint(after),
+	}
@@ -0,0 +1,86 @@
+# Copyright (c) 2026, Richmond Gedziq and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, today
+
+from ostec_native.ostec_native.doctype.renewal_stage_event.renewal_stage_event import (
+	get_stage_events,
+	record_stage_events,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import (
+	update_all_renewal_stages_heavy,
+	update_single_renewal_stage,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.test_renewal_tracking import make_renewal
+
+
+def get_events(renewal_tracking):
+	return get_stage_events(renewal_tracking=renewal_tracking)["events"]
+
+
+def get_last_event_id():
+	return frappe.db.sql("select coalesce(max(name), 0) from `tabRenewal Stage Event`")[0][0]
+
+
+class TestRenewalStageEvent(FrappeTestCase):
+	def test_save_records_event(self):
+		now = today()
+		doc = make_renewal(add_days(now, -10), add_days(now, 200), submit=False)
+
+		events = get_events(doc.name)
+		self.assertEqual(len(events), 1)
+		self.assertEqual((events[0].old_stage, events[0].new_stage), (None, "Running"))
+		self.assertEqual(events[0].source, "Save")
+		self.assertEqual(events[0].days_remaining, 200)
+
+		# saving again without a stage change appends nothing
+		doc.save()
+		self.assertEqual(len(get_events(doc.name)), 1)
+
+		doc.license_end = add_days(now, 45)
+		doc.save()
+		events = get_events(doc.name)
+		self.assertEqual((events[-1].old_stage, events[-1].new_stage), ("Running", "60 Days to Expiry"))
+
+	def test_jobs_and_manual_update_record_events(self):
+		now = today()
+		doc = make_renewal(add_days(now, -200), add_days(now, 45))
+		last_event_id = get_last_event_id()
+
+		frappe.db.sql(
+			"""update `tabRenewal Tracking` set renewal_stage = 'Running', next_stage_transition = %s
+			where name = %s""",
+			(now, doc.name),
+		)
+		update_all_renewal_stages_heavy()
+
+		frappe.db.set_value("Renewal Tracking", doc.name, "renewal_stage", "Open", update_modified=False)
+		update_single_renewal_stage(doc.name)
+
+		events = [e for e in get_stage_events(after=last_event_id)["events"] if e.renewal_tracking == doc.name]
+		self.assertEqual(
+			[(e.source, e.old_stage, e.new_stage) for e in events],
+			[("Heavy", "Running", "60 Days to Expiry"), ("Manual", "Open", "60 Days to Expiry")],
+		)
+
+	def test_incremental_reads(self):
+		doc = make_renewal(add_days(today(), -10), add_days(today(), 200), submit=False)
+		changes = [
+			{"name": doc.name, "old_stage": "Open", "new_stage": "Running", "days_remaining": 200},
+			{"name": doc.name, "old_stage": "Running", "new_stage": "Running", "days_remaining": 200},
+			{"name": doc.name, "old_stage": "Running", "new_stage": "90 Days to Expiry", "days_remaining": 90},
+		]
+		after = get_last_event_id()
+		# unchanged rows are skipped
+		self.assertEqual(record_stage_events(changes, "Light"), 2)
+
+		first = get_stage_events(after=after, limit=1)
+		self.assertEqual(first["events"][0].new_stage, "Running")
+
+		second = get_stage_events(after=first["last_event_id"])
+		self.assertEqual([e.new_stage for e in second["events"]], ["90 Days to Expiry"])
+		self.assertEqual(get_stage_events(after=second["last_event_id"])["events"], [])
+
+		self.assertRaises(frappe.ValidationError, record_stage_events, changes, "Nightly")
@@ -0,0 +1,290 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Streaming reader for Renewal Tracking item import files.
+
+CSV files are read row by row with csv.reader and XLSX files through
+openpyxl's read_only mode, so only the rows being handed out are held in
+memory. The header row is mapped once into a column plan, (column index,
+fieldname) pairs, instead of building a dict per row. import_items and
+the paged import_items_page both read through iter_import_items.
+
+import_items_page reads the file once: the first call checks every page
+and keeps it in the cache under the file's path, size and mtime, the
+calls that follow are served from there. A page that has expired is read
+again from its own start on.
+
+Rows are checked against the masters a chunk at a time by
+resolve_item_masters: one IN query for the item codes and one per linked
+doctype, however many rows the chunk holds. Rows that fail are left out
+and reported together instead of failing one by one on save.
+"""
+
+import csv
+import os
+from itertools import islice
+
+import frappe
+from frappe.utils import cstr, flt
+
+# Spreadsheet header -> Renewal Tracking Item field
+IMPORT_COLUMNS = {
+	"Item Code": "item_code",
+	"Item Name": "item_name",
+	"Description": "description",
+	"Brand": "brand",
+	"Item Group": "item_group",
+	"UOM": "oum",
+	"Qty": "qty",
+	"Rate": "rate",
+}
+NUMERIC_FIELDS = ("qty", "rate")
+
+# Rows returned per import_items_page call, also the chunk checked against the masters at once
+IMPORT_PAGE_LENGTH = 5000
+# Seconds the pages of a file read by import_items_page are kept for the calls that follow
+IMPORT_PAGE_EXPIRY = 30 * 60
+
+# Item field -> Item master field it is filled from when the file leaves it empty
+ITEM_MASTER_FIELDS = {
+	"item_name": "item_name",
+	"description": "description",
+	"brand": "brand",
+	"item_group": "item_group",
+	"oum": "stock_uom",
+}
+# Item fields linking to a master, checked when the file supplies a value
+LINK_FIELDS = {"brand": "Brand", "item_group": "Item Group", "oum": "UOM"}
+
+
+def is_csv(file_url):
+	return file_url.lower().endswith(".csv")
+
+
+def iter_file_rows(file_path, csv_file):
+	"""Raw rows of the file as tuples/lists, header row first"""
+	if csv_file:
+		with open(file_path, encoding="utf-8-sig", newline="") as f:
+			yield from csv.reader(f)
+		return
+
+	import openpyxl
+
+	workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+	try:
+		yield from workbook.active.iter_rows(values_only=True)
+	finally:
+		workbook.close()
+
+
+def count_data_rows(file_path, csv_file):
+	"""
+	Data rows in the file for progress reporting, without parsing it:
+	newlines for CSV, the sheet dimensions for XLSX. Approximate when
+	CSV fields contain line breaks or the sheet has no dimensions
+	"""
+	if csv_file:
+		lines = 0
+		with open(file_path, "rb") as f:
+			while block := f.read(1 << 20):
+				lines += block.count(b"\n")
+		return max(lines - 1, 0)
+
+	import openpyxl
+
+	workbook = openpyxl.load_workbook(file_path, read_only=True)
+	try:
+		return max((workbook.active.max_row or 1) - 1, 0)
+	finally:
+		workbook.close()
+
+
+def get_column_plan(headers):
+	"""[(column index, fieldname)] for every known header, mapped once per file"""
+	return [
+		(index, IMPORT_COLUMNS[cstr(header).strip()])
+		for index, header in enumerate(headers)
+		if cstr(header).strip() in IMPORT_COLUMNS
+	]
+
+
+def map_row(plan, row):
+	"""Item dict of one raw row following plan, None for rows without an Item Code"""
+	item = dict.fromkeys(IMPORT_COLUMNS.values(), "")
+	for index, fieldname in plan:
+		if index < len(row) and row[index] is not None:
+			item[fieldname] = row[index]
+
+	if not item["item_code"]:
+		return None
+
+	item["item_code"] = cstr(item["item_code"])
+	for fieldname in NUMERIC_FIELDS:
+		item[fieldname] = flt(item[fieldname])
+	return item
+
+
+def iter_import_items(file_path, csv_file, start=0):
+	"""
+	(position, item dict) for every data row with an Item Code, from the
+	start-th data row on. position counts data rows, empty ones included,
+	so it can be passed back as start
+	"""
+	rows = iter_file_rows(file_path, csv_file)
+	try:
+		plan = get_column_plan(next(rows, None) or ())
+		for position, row in enumerate(islice(rows, start, None), start):
+			if item := map_row(plan, row):
+				yield position, item
+	finally:
+		rows.close()
+
+
+def read_import_page(file_path, csv_file, start=0, page_length=IMPORT_PAGE_LENGTH):
+	"""
+	Up to page_length rows with an Item Code from data row start on,
+	checked against the masters. The first read of the file keeps every
+	later page in the cache, so paging through it parses the file once
+
+	Returns {"items": [...], "errors": [...], "next_start": start of the next
+	page, None after the last one}, see resolve_item_masters for errors
+	"""
+	page = frappe.cache.get_value(get_import_page_key(file_path, page_length, start))
+	if page is not None:
+		return page
+
+	page = None
+	for page_start, next_page in iter_import_pages(file_path, csv_file, start, page_length):
+		if page is None:
+			page = next_page
+		else:
+			frappe.cache.set_value(
+				get_import_page_key(file_path, page_length, page_start), next_page, expires_in_sec=IMPORT_PAGE_EXPIRY
+			)
+	return page
+
+
+def iter_import_pages(file_path, csv_file, start=0, page_length=IMPORT_PAGE_LENGTH):
+	"""(start, page) for every page of read_import_page from data row start to the end of the file"""
+	rows = []
+	page_start = start
+	for position, item in iter_import_items(file_path, csv_file, start):
+		if len(rows) == page_length:
+			yield page_start, get_import_page(rows, position)
+			rows = []
+			page_start = position
+		rows.append((position, item))
+	yield page_start, get_import_page(rows, None)
+
+
+def get_import_page(rows, next_start):
+	items, errors = resolve_item_masters(rows)
+	return {"items": items, "errors": errors, "next_start": next_start}
+
+
+def get_import_page_key(file_path, page_length, start):
+	"""Changes when the file is replaced, so a page is never served from an older upload"""
+	stat = os.stat(file_path)
+	return f"{get_import_page_prefix(file_path)}{stat.st_size}|{stat.st_mtime_ns}|{page_length}|{start}"
+
+
+def get_import_page_prefix(file_path):
+	return f"renewal_item_import_page|{file_path}|"
+
+
+def clear_import_pages(file_path):
+	"""Drop the cached pages of the file"""
+	frappe.cache.delete_keys(get_import_page_prefix(file_path))
+
+
+def iter_resolved_chunks(file_path, csv_file, chunk_size=IMPORT_PAGE_LENGTH):
+	"""(items, errors) of resolve_item_masters for each chunk of chunk_size rows of the file"""
+	chunk = []
+	for row in iter_import_items(file_path, csv_file):
+		chunk.append(row)
+		if len(chunk) == chunk_size:
+			yield resolve_item_masters(chunk)
+			chunk = []
+	if chunk:
+		yield resolve_item_masters(chunk)
+
+
+def resolve_item_masters(rows):
+	"""
+	Check (position, item) rows read from a file against Item, Brand, Item
+	Group and UOM, and fill fields the file left empty from the Item master
+
+	Queries: one for the item codes, one per link doctype with values in
+	the file, independent of the number of rows. Codes and link values are
+	matched case-insensitively and replaced by the master's spelling.
+
+	Returns (items, errors). items are the rows that passed, errors one
+	dict per failed check: row (number in the file, header is row 1),
+	item_code, field, value and message
+	"""
+	if not rows:
+		return [], []
+
+	masters = {
+		master.name.lower(): master
+		for master in frappe.get_all(
+			"Item",
+			filters={"name": ("in", {item["item_code"] for _, item in rows})},
+			fields=["name", "disabled", *set(ITEM_MASTER_FIELDS.values())],
+		)
+	}
+
+	existing = {}
+	for fieldname, doctype in LINK_FIELDS.items():
+		values = {cstr(item[fieldname]) for _, item in rows if item[fieldname]}
+		existing[fieldname] = (
+			{name.lower(): name for name in frappe.get_all(doctype, filters={"name": ("in", values)}, pluck="name")}
+			if values
+			else {}
+		)
+
+	items = []
+	errors = []
+	for position, item in rows:
+		row_errors = []
+
+		master = masters.get(item["item_code"].lower())
+		if not master:
+			row_errors.append(get_import_error(position, item, "item_code", "Item {0} does not exist"))
+		elif master.disabled:
+			row_errors.append(get_import_error(position, item, "item_code", "Item {0} is disabled"))
+		else:
+			item["item_code"] = master.name
+
+		for fieldname, doctype in LINK_FIELDS.items():
+			if not item[fieldname]:
+				continue
+			name = existing[fieldname].get(cstr(item[fieldname]).lower())
+			if name:
+				item[fieldname] = name
+			else:
+				row_errors.append(get_import_error(position, item, fieldname, f"{doctype} {{0}} does not exist"))
+
+		if row_errors:
+			errors.extend(row_errors)
+			continue
+
+		for fieldname, master_field in ITEM_MASTER_FIELDS.items():
+			if not item[fieldname]:
+				item[fieldname] = master.get(master_field) or ""
+		items.append(item)
+
+	return items, errors
+
+
+def get_import_error(position, item, field, message):
+	"""Error entry for the row at position, message is formatted with the field's value"""
+	value = cstr(item[field])
+	return {
+		"row": position + 2,
+		"item_code": item["item_code"],
+		"field": field,
+		"value": value,
+		"message": message.format(value),
+	}
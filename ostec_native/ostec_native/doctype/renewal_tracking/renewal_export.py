@@ -0,0 +1,302 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Streaming export of Renewal Tracking and Renewal Tracking Item rows.
+
+export_renewals returns a response whose body is generated while the rows
+come off an unbuffered (server-side) cursor, so an export of 500k rows
+holds one block of rows at a time and the first bytes leave before the
+query has finished. Frappe may already have closed frappe.db by the time
+the server iterates the body, so the generator reads through a
+connection of its own.
+
+CSV is written as the rows arrive. Excel goes through openpyxl's
+write_only mode into a temporary file that is streamed once complete,
+since the xlsx zip container cannot be sent before its sheet is written.
+
+Filters are list view filters and go through frappe.get_list, so the
+export sees exactly the rows the list shows the user.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import tempfile
+
+import frappe
+from frappe.utils import cstr, now_datetime, strip_html
+from werkzeug.wrappers import Response
+
+EXPORT_DOCTYPES = ("Renewal Tracking", "Renewal Tracking Item")
+EXPORT_FORMATS = {
+	"CSV": ("csv", "text/csv; charset=utf-8"),
+	"Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+RENEWAL_EXPORT_FIELDS = (
+	"name",
+	"renewal_title",
+	"customer",
+	"customer_name",
+	"renewal_type",
+	"date",
+	"license_start",
+	"license_end",
+	"renewal_stage",
+	"renewal_outcome",
+	"company",
+	"account_manager",
+	"currency",
+	"exchange_rate",
+	"net_total",
+	"net_total_base",
+)
+
+# Spreadsheet header -> Renewal Tracking Item field, the columns of the form's item download
+ITEM_EXPORT_COLUMNS = {
+	"Item Code": "item_code",
+	"Item Name": "item_name",
+	"Description": "description",
+	"Brand": "brand",
+	"Item Group": "item_group",
+	"UOM": "oum",
+	"Qty": "qty",
+	"Rate": "rate",
+	"Amount": "amount",
+	"Base Rate": "base_rate",
+	"Base Amount": "base_amount",
+}
+# Text Editor fields, exported as plain text
+HTML_FIELDS = ("description",)
+
+# CSV rows written per block of the response
+EXPORT_BLOCK_ROWS = 1000
+
+EXPORT_TO_FILE_METHOD = (
+	"ostec_native.ostec_native.doctype.renewal_tracking.renewal_export.export_renewals_to_file"
+)
+RENEWAL_EXPORT_READY_EVENT = "renewal_export_ready"
+
+
+@frappe.whitelist()
+def export_renewals(filters=None, doctype="Renewal Tracking", file_format="CSV"):
+	"""Download the doctype rows matching list view filters as CSV or Excel, streamed"""
+	plan = get_export_plan(doctype, filters, file_format)
+	db = get_export_db()
+
+	response = Response(
+		iter_export_file(iter_unbuffered_rows(plan.query, db, close=True), plan, file_format),
+		mimetype=EXPORT_FORMATS[file_format][1],
+	)
+	file_name = get_export_file_name(doctype, file_format)
+	response.headers["Content-Disposition"] = f'attachment; filename="{file_name}"'
+	return response
+
+
+@frappe.whitelist()
+def enqueue_renewal_export(filters=None, doctype="Renewal Tracking", file_format="CSV"):
+	"""
+	Queue export_renewals_to_file, the file_url arrives on
+	RENEWAL_EXPORT_READY_EVENT with the job_id returned here. Asking again
+	for the same export while it is queued or running returns the same job
+	"""
+	# permission and argument errors show up here, not in the worker
+	get_export_plan(doctype, filters, file_format)
+
+	job_id = get_export_job_id(filters, doctype, file_format)
+	frappe.enqueue(
+		EXPORT_TO_FILE_METHOD,
+		queue="long",
+		job_id=job_id,
+		deduplicate=True,
+		filters=filters,
+		doctype=doctype,
+		file_format=file_format,
+	)
+	return job_id
+
+
+def export_renewals_to_file(filters=None, doctype="Renewal Tracking", file_format="CSV"):
+	"""Write the export into a private File instead of a response, returns its file_url"""
+	plan = get_export_plan(doctype, filters, file_format)
+	file_name = get_export_file_name(doctype, file_format)
+
+	with open(frappe.get_site_path("private", "files", file_name), "wb") as f:
+		for block in iter_export_file(iter_unbuffered_rows(plan.query), plan, file_format):
+			f.write(block)
+
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"is_private": 1,
+		}
+	).insert(ignore_permissions=True)
+
+	frappe.publish_realtime(
+		RENEWAL_EXPORT_READY_EVENT,
+		{"file_url": file_doc.file_url, "job_id": get_export_job_id(filters, doctype, file_format)},
+		user=frappe.session.user,
+	)
+	return file_doc.file_url
+
+
+def get_export_job_id(filters, doctype, file_format):
+	"""The same for the same user asking for the same rows in the same format"""
+	filters = json.dumps(frappe.parse_json(filters) if filters else [], sort_keys=True, default=str)
+	key = hashlib.sha1(f"{frappe.session.user}::{filters}".encode()).hexdigest()
+	return f"renewal_export::{doctype}::{file_format}::{key}"
+
+
+def get_export_plan(doctype, filters, file_format):
+	"""
+	Check the request and build the export: the SQL of the permitted rows
+	as frappe.get_list would run it, the header row and the indexes of
+	columns holding HTML
+	"""
+	if doctype not in EXPORT_DOCTYPES:
+		frappe.throw(f"Cannot export {doctype}")
+	if file_format not in EXPORT_FORMATS:
+		frappe.throw(f"Unsupported export format {file_format}")
+	frappe.has_permission("Renewal Tracking", "export", throw=True)
+
+	filters = get_filter_list(frappe.parse_json(filters) if filters else [])
+
+	if doctype == "Renewal Tracking":
+		fieldnames = RENEWAL_EXPORT_FIELDS
+		fields = [f"`tabRenewal Tracking`.`{fieldname}`" for fieldname in fieldnames]
+		meta = frappe.get_meta(doctype)
+		headers = ["ID" if fieldname == "name" else meta.get_label(fieldname) for fieldname in fieldnames]
+		order_by = "`tabRenewal Tracking`.`name`"
+	else:
+		fieldnames = ("parent", *ITEM_EXPORT_COLUMNS.values())
+		fields = [
+			"`tabRenewal Tracking`.`name`",
+			*(f"`tabRenewal Tracking Item`.`{fieldname}`" for fieldname in ITEM_EXPORT_COLUMNS.values()),
+		]
+		headers = ["Renewal Tracking", *ITEM_EXPORT_COLUMNS]
+		order_by = "`tabRenewal Tracking`.`name`, `tabRenewal Tracking Item`.`idx`"
+		# the item fields join the child table, renewals without items have no row to export
+		filters.append(["Renewal Tracking Item", "name", "is", "set"])
+
+	query = frappe.get_list(
+		"Renewal Tracking",
+		fields=fields,
+		filters=filters,
+		order_by=order_by,
+		limit_page_length=0,
+		as_list=True,
+		run=0,
+	)
+	return frappe._dict(
+		query=query,
+		headers=headers,
+		html_columns=[index for index, fieldname in enumerate(fieldnames) if fieldname in HTML_FIELDS],
+	)
+
+
+def get_filter_list(filters):
+	"""List view filters as [doctype, field, operator, value] lists, so more can be appended"""
+	if not isinstance(filters, dict):
+		return list(filters)
+	return [
+		["Renewal Tracking", fieldname, *(value if isinstance(value, (list, tuple)) else ("=", value))]
+		for fieldname, value in filters.items()
+	]
+
+
+def get_export_db():
+	"""
+	A database connection for the response generator, which outlives the
+	request's frappe.db. Opened the way frappe.connect opens frappe.db
+	"""
+	from frappe.database import get_db
+
+	conf = frappe.local.conf
+	return get_db(
+		socket=conf.db_socket,
+		host=conf.db_host,
+		port=conf.db_port,
+		user=conf.db_user or conf.db_name,
+		password=conf.db_password,
+		cur_db_name=conf.db_name,
+	)
+
+
+def iter_unbuffered_rows(query, db=None, close=False):
+	"""Rows of query as tuples from a server-side cursor, only the rows being handed out are in memory"""
+	db = db or frappe.db
+	try:
+		with db.unbuffered_cursor():
+			yield from db.sql(query, as_iterator=True)
+	finally:
+		if close:
+			db.close()
+
+
+def iter_export_file(rows, plan, file_format):
+	"""Blocks of bytes of the export file with plan.headers and rows"""
+	if file_format == "CSV":
+		yield from iter_csv_blocks(rows, plan)
+	else:
+		yield from iter_xlsx_blocks(rows, plan)
+
+
+def iter_csv_blocks(rows, plan):
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+
+	def flush():
+		block = buffer.getvalue().encode("utf-8")
+		buffer.seek(0)
+		buffer.truncate()
+		return block
+
+	# the header goes out before the query runs
+	writer.writerow(plan.headers)
+	yield flush()
+
+	for count, row in enumerate(rows, 1):
+		writer.writerow(get_export_row(row, plan))
+		if count % EXPORT_BLOCK_ROWS == 0:
+			yield flush()
+	yield flush()
+
+
+def iter_xlsx_blocks(rows, plan):
+	import openpyxl
+	from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+	with tempfile.NamedTemporaryFile(suffix=".xlsx") as f:
+		workbook = openpyxl.Workbook(write_only=True)
+		sheet = workbook.create_sheet()
+		sheet.append(plan.headers)
+		for row in rows:
+			sheet.append(
+				[
+					ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+					for value in get_export_row(row, plan)
+				]
+			)
+		workbook.save(f.name)
+
+		f.seek(0)
+		while block := f.read(1 << 20):
+			yield block
+
+
+def get_export_row(row, plan):
+	if not plan.html_columns:
+		return row
+	row = list(row)
+	for index in plan.html_columns:
+		row[index] = strip_html(cstr(row[index]))
+	return row
+
+
+def get_export_file_name(doctype, file_format):
+	extension = EXPORT_FORMATS[file_format][0]
+	return f"{frappe.scrub(doctype)}_{now_datetime():%Y%m%d_%H%M%S}_{frappe.generate_hash(length=6)}.{extension}"
@@ -0,0 +1,607 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Bulk creation of Renewal Tracking documents from one spreadsheet.
+
+Each row of the file holds the renewal's header columns and one item line
+(the item columns of item_import). Consecutive rows with the same Renewal
+Key make up one renewal, the header is taken from its first row. The file
+is streamed once and handled RENEWAL_IMPORT_CHUNK_SIZE renewals at a
+time, each chunk in its own transaction:
+
+1. headers are checked the way validate would, links and items with one
+   IN query per doctype for the whole chunk
+2. exchange rates come from the cached lookups in utils.currency, line
+   values and totals of every renewal from one calculate_line_item_groups
+   pass, stages from one classify_renewal_stages pass
+3. names are reserved from the naming series in one block
+4. renewals, items and their stage events go in with bulk inserts
+
+A renewal with any invalid row is left out whole and reported. Keys that
+already exist are skipped, so a failed import can be rerun with the same
+file.
+
+Submitted imports go in with docstatus 1 and a Submit stage event, the
+one event a new document submitted through the controller records. The
+controller itself is bypassed: no validate, before_submit or on_submit,
+no doc_events hooks of other apps and no Version. Everything this app's
+controller computes is computed here in bulk instead.
+"""
+
+import time
+
+import frappe
+from frappe.model.naming import parse_naming_series
+from frappe.utils import cint, cstr, flt, getdate, now_datetime, today
+from frappe.utils.file_manager import get_file_path
+
+from ostec_native.ostec_native.doctype.renewal_stage_event.renewal_stage_event import record_stage_events
+from ostec_native.ostec_native.doctype.renewal_tracking.item_import import (
+	get_column_plan,
+	is_csv,
+	iter_file_rows,
+	map_row,
+	resolve_item_masters,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.line_items import calculate_line_item_groups
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_stage import (
+	NO_STAGE,
+	classify_renewal_stages,
+	get_stage_labels,
+	get_transition_dates,
+)
+from ostec_native.utils.currency import get_company_currencies, get_exchange_rates
+
+IMPORT_RENEWALS_METHOD = (
+	"ostec_native.ostec_native.doctype.renewal_tracking.renewal_import.import_renewals"
+)
+RENEWAL_IMPORT_PROGRESS_EVENT = "renewal_import_progress"
+
+# Renewals validated, named and inserted per transaction
+RENEWAL_IMPORT_CHUNK_SIZE = 500
+
+# Spreadsheet header -> Renewal Tracking field
+RENEWAL_COLUMNS = {
+	"Renewal Key": "external_key",
+	"Renewal Title": "renewal_title",
+	"Customer": "customer",
+	"Renewal Type": "renewal_type",
+	"Date": "date",
+	"Delivery Date": "delivery_date",
+	"License Start": "license_start",
+	"License End": "license_end",
+	"Company": "company",
+	"Currency": "currency",
+	"Exchange Rate": "exchange_rate",
+}
+DATE_FIELDS = ("date", "delivery_date", "license_start", "license_end")
+MANDATORY_FIELDS = ("renewal_title", "license_start", "license_end")
+# Header fields linking to a master, checked when the file supplies a value
+RENEWAL_LINK_FIELDS = {"customer": "Customer", "company": "Company", "currency": "Currency"}
+
+PARENT_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"naming_series",
+	"external_key",
+	"renewal_title",
+	"customer",
+	"customer_name",
+	"account_manager",
+	"renewal_type",
+	"renewal_outcome",
+	"date",
+	"delivery_date",
+	"license_start",
+	"license_end",
+	"renewal_stage",
+	"next_stage_transition",
+	"company",
+	"currency",
+	"exchange_rate",
+	"manual_exchange_rate",
+	"net_total",
+	"net_total_base",
+)
+
+ITEM_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"parent",
+	"parenttype",
+	"parentfield",
+	"idx",
+	"item_code",
+	"item_name",
+	"description",
+	"brand",
+	"item_group",
+	"oum",
+	"qty",
+	"rate",
+	"amount",
+	"base_rate",
+	"base_amount",
+)
+
+# Errors kept in the summary, failed counts all of them
+MAX_IMPORT_ERRORS = 1000
+
+
+@frappe.whitelist()
+def enqueue_renewal_import(file_url, submit=0):
+	"""Queue import_renewals for file_url, progress and the summary arrive on RENEWAL_IMPORT_PROGRESS_EVENT"""
+	frappe.has_permission("Renewal Tracking", "create", throw=True)
+	if cint(submit):
+		frappe.has_permission("Renewal Tracking", "submit", throw=True)
+
+	# a wrong file fails here rather than silently in the worker
+	rows = iter_file_rows(get_file_path(file_url), is_csv(file_url))
+	try:
+		headers = [cstr(header).strip() for header in next(rows, None) or ()]
+	finally:
+		rows.close()
+	if "Renewal Key" not in headers:
+		frappe.throw("The file has no Renewal Key column")
+
+	job_id = f"renewal_import::{file_url}"
+	frappe.enqueue(
+		IMPORT_RENEWALS_METHOD,
+		queue="long",
+		job_id=job_id,
+		deduplicate=True,
+		file_url=file_url,
+		submit=cint(submit),
+	)
+	return job_id
+
+
+def import_renewals(file_url, submit=False, chunk_size=RENEWAL_IMPORT_CHUNK_SIZE):
+	"""
+	Create a Renewal Tracking for every Renewal Key in the file, submitted
+	when submit is set. Commits after every chunk_size renewals
+
+	Returns {"renewals", "items", "skipped", "failed", "errors", "seconds"},
+	errors being dicts of row (number in the file, header is row 1),
+	renewal_key, field, value and message
+	"""
+	started = time.perf_counter()
+	summary = frappe._dict(renewals=0, items=0, skipped=0, failed=0, errors=[])
+	file_path = get_file_path(file_url)
+
+	chunk = []
+	for group in iter_renewal_groups(file_path, is_csv(file_url)):
+		chunk.append(group)
+		if len(chunk) == chunk_size:
+			import_renewal_chunk(chunk, summary, submit)
+			chunk = []
+	if chunk:
+		import_renewal_chunk(chunk, summary, submit)
+
+	summary.seconds = round(time.perf_counter() - started, 2)
+	publish_progress(summary, done=True)
+	return summary
+
+
+def iter_renewal_groups(file_path, csv_file):
+	"""
+	One group per Renewal Key: key, position of its first row, header
+	values from that row and the (position, item) item_rows that have an
+	Item Code. Rows without a Renewal Key are ignored
+	"""
+	rows = iter_file_rows(file_path, csv_file)
+	try:
+		headers = next(rows, None) or ()
+		header_plan = [
+			(index, RENEWAL_COLUMNS[cstr(header).strip()])
+			for index, header in enumerate(headers)
+			if cstr(header).strip() in RENEWAL_COLUMNS
+		]
+		key_index = next((index for index, fieldname in header_plan if fieldname == "external_key"), None)
+		if key_index is None:
+			frappe.throw("The file has no Renewal Key column")
+		item_plan = get_column_plan(headers)
+
+		# keys of the groups handed out so far, to catch a key coming back later in the file
+		seen = set()
+		group = None
+		for position, row in enumerate(rows):
+			key = cstr(row[key_index]).strip() if key_index < len(row) else ""
+			if not key:
+				continue
+
+			if not group or group.key != key:
+				if group:
+					yield group
+				group = get_renewal_group(header_plan, key, position, row)
+				if key in seen:
+					group.errors.append(
+						get_renewal_error(
+							group, position, "external_key", key, "Rows of Renewal Key {0} must be consecutive"
+						)
+					)
+				seen.add(key)
+
+			if item := map_row(item_plan, row):
+				group.item_rows.append((position, item))
+
+		if group:
+			yield group
+	finally:
+		rows.close()
+
+
+def get_renewal_group(header_plan, key, position, row):
+	header = frappe._dict.fromkeys(RENEWAL_COLUMNS.values())
+	for index, fieldname in header_plan:
+		if index < len(row) and row[index] not in (None, ""):
+			header[fieldname] = row[index]
+	return frappe._dict(key=key, position=position, header=header, item_rows=[], errors=[])
+
+
+def import_renewal_chunk(groups, summary, submit=False):
+	"""Validate, compute and insert one chunk of renewal groups in one transaction"""
+	try:
+		existing = set(
+			frappe.get_all(
+				"Renewal Tracking",
+				filters={"external_key": ("in", [group.key for group in groups]), "docstatus": ("<", 2)},
+				pluck="external_key",
+			)
+		)
+		# renewals already created by an earlier run of the file, a repeated key still gets its error
+		skipped = {id(group) for group in groups if group.key in existing and not group.errors}
+		groups = [group for group in groups if id(group) not in skipped]
+		summary.skipped += len(skipped)
+
+		check_renewal_groups(groups)
+		valid = set_renewal_values([group for group in groups if not group.errors])
+		insert_renewals(valid, submit)
+		frappe.db.commit()
+
+		summary.renewals += len(valid)
+		summary.items += sum(len(group.item_rows) for group in valid)
+		rejected = [group for group in groups if group.errors]
+
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(message=frappe.get_traceback(), title="Renewal Import Failed")
+		for group in groups:
+			group.errors = [get_renewal_error(group, group.position, "external_key", group.key, str(e))]
+		rejected = groups
+
+	summary.failed += len(rejected)
+	for group in rejected:
+		summary.errors.extend(group.errors[: MAX_IMPORT_ERRORS - len(summary.errors)])
+	publish_progress(summary)
+
+
+def check_renewal_groups(groups):
+	"""
+	Check headers and items of groups the way a save would, filling
+	group.errors. Master lookups are one IN query per doctype for all groups
+	"""
+	for group in groups:
+		check_renewal_header(group)
+
+	masters = {}
+	for fieldname, doctype in RENEWAL_LINK_FIELDS.items():
+		values = {cstr(group.header[fieldname]) for group in groups if group.header[fieldname]}
+		fields = ["name", "customer_name", "account_manager"] if doctype == "Customer" else ["name"]
+		masters[fieldname] = (
+			{
+				master.name.lower(): master
+				for master in frappe.get_all(doctype, filters={"name": ("in", values)}, fields=fields)
+			}
+			if values
+			else {}
+		)
+
+	for group in groups:
+		header = group.header
+		for fieldname, doctype in RENEWAL_LINK_FIELDS.items():
+			if not header[fieldname]:
+				continue
+			master = masters[fieldname].get(cstr(header[fieldname]).lower())
+			if not master:
+				group.errors.append(
+					get_renewal_error(
+						group, group.position, fieldname, header[fieldname], f"{doctype} {{0}} does not exist"
+					)
+				)
+				continue
+			header[fieldname] = master.name
+			if doctype == "Customer":
+				# fetched from the customer on save
+				header.customer_name = master.customer_name
+				header.account_manager = master.account_manager
+
+	group_of = {}
+	for group in groups:
+		for position, _ in group.item_rows:
+			group_of[position] = group
+
+	_, errors = resolve_item_masters([row for group in groups for row in group.item_rows])
+	for error in errors:
+		group = group_of[error["row"] - 2]
+		error["renewal_key"] = group.key
+		group.errors.append(error)
+
+	# resolve_item_masters corrects and fills the item dicts in place
+	for group in groups:
+		group.item_rows = [frappe._dict(item) for _, item in group.item_rows]
+
+
+def check_renewal_header(group):
+	"""Mandatory fields, dates and renewal type of one group, as validate_license_dates and a save check them"""
+	header = group.header
+	meta = frappe.get_meta("Renewal Tracking")
+
+	for fieldname in MANDATORY_FIELDS:
+		if not header[fieldname]:
+			group.errors.append(
+				get_renewal_error(group, group.position, fieldname, "", f"{meta.get_label(fieldname)} is mandatory")
+			)
+
+	for fieldname in DATE_FIELDS:
+		if not header[fieldname]:
+			continue
+		try:
+			header[fieldname] = getdate(header[fieldname])
+		except Exception:
+			group.errors.append(
+				get_renewal_error(group, group.position, fieldname, header[fieldname], "{0} is not a valid date")
+			)
+			header[fieldname] = None
+
+	if header.license_start and header.license_end and header.license_end <= header.license_start:
+		group.errors.append(
+			get_renewal_error(
+				group,
+				group.position,
+				"license_end",
+				header.license_end,
+				f"License End Date ({{0}}) must be after License Start Date ({header.license_start})",
+			)
+		)
+
+	renewal_types = meta.get_options("renewal_type").split("\n")
+	if header.renewal_type and cstr(header.renewal_type) not in renewal_types:
+		group.errors.append(
+			get_renewal_error(
+				group, group.position, "renewal_type", header.renewal_type, "{0} is not a valid Renewal Type"
+			)
+		)
+
+	header.renewal_title = cstr(header.renewal_title)
+	header.exchange_rate = flt(header.exchange_rate)
+
+
+def set_renewal_values(groups):
+	"""
+	Exchange rate, line values, totals and stage of every group, what
+	set_exchange_rate and calculate_values would set on save. Groups whose
+	currency pair has no rate get an error instead, the rest are returned
+	"""
+	company_currencies = get_company_currencies([group.header.company for group in groups])
+
+	pairs_by_date = {}
+	for group in groups:
+		header = group.header
+		header.company_currency = company_currencies.get(header.company)
+		if not header.currency or not header.company:
+			continue
+		if header.currency == header.company_currency:
+			header.exchange_rate = 1.0
+		else:
+			# looked up for rates given in the file too, to tell which of them are manual
+			pairs_by_date.setdefault(header.date, set()).add((header.currency, header.company_currency))
+
+	rates_by_date = {date: get_exchange_rates(pairs, date) for date, pairs in pairs_by_date.items()}
+	for group in groups:
+		header = group.header
+		header.manual_exchange_rate = 0
+		if not header.currency or not header.company or header.currency == header.company_currency:
+			continue
+		system_rate = flt(rates_by_date[header.date].get((header.currency, header.company_currency)))
+		if header.exchange_rate > 0:
+			header.manual_exchange_rate = cint(flt(header.exchange_rate, 9) != flt(system_rate, 9))
+		else:
+			header.exchange_rate = system_rate
+			if not header.exchange_rate:
+				group.errors.append(
+					get_renewal_error(
+						group,
+						group.position,
+						"exchange_rate",
+						header.currency,
+						f"Currency pair {{0}} to {header.company_currency} not available in system. "
+						"Please enter the exchange rate in the file.",
+					)
+				)
+	groups = [group for group in groups if not group.errors]
+	if not groups:
+		return groups
+
+	totals = calculate_line_item_groups(
+		[
+			(
+				group.item_rows,
+				group.header.exchange_rate,
+				bool(
+					group.header.currency
+					and group.header.company_currency
+					and group.header.currency != group.header.company_currency
+				),
+			)
+			for group in groups
+		]
+	)
+
+	stages = classify_renewal_stages(
+		[group.header.license_start for group in groups], [group.header.license_end for group in groups], today()
+	)
+	labels = get_stage_labels(stages.codes)
+	transitions = get_transition_dates(stages.next_transition)
+
+	for i, group in enumerate(groups):
+		group.header.net_total, group.header.net_total_base = totals[i]
+		group.header.renewal_stage = labels[i]
+		group.header.next_stage_transition = transitions[i]
+		group.header.days_remaining = int(stages.days_remaining[i]) if stages.codes[i] != NO_STAGE else None
+
+	return groups
+
+
+def insert_renewals(groups, submit=False):
+	"""
+	Name groups from the naming series in one block and bulk insert them
+	with their items and stage events. With submit they go in submitted,
+	without passing through the controller's submit hooks
+	"""
+	if not groups:
+		return
+
+	naming_series = frappe.get_meta("Renewal Tracking").get_field("naming_series").default
+	names = reserve_series_names(naming_series, len(groups))
+
+	now = now_datetime()
+	user = frappe.session.user
+	docstatus = 1 if submit else 0
+
+	parents = []
+	children = []
+	for name, group in zip(names, groups):
+		group.name = name
+		header = group.header
+		parents.append(
+			(
+				name,
+				now,
+				now,
+				user,
+				user,
+				docstatus,
+				naming_series,
+				group.key,
+				header.renewal_title,
+				header.customer,
+				header.customer_name,
+				header.account_manager,
+				header.renewal_type,
+				"Not Decided",
+				header.date,
+				header.delivery_date,
+				header.license_start,
+				header.license_end,
+				header.renewal_stage,
+				header.next_stage_transition,
+				header.company,
+				header.currency,
+				header.exchange_rate,
+				header.manual_exchange_rate,
+				header.net_total,
+				header.net_total_base,
+			)
+		)
+		for idx, item in enumerate(group.item_rows, 1):
+			children.append(
+				(
+					frappe.generate_hash(length=10),
+					now,
+					now,
+					user,
+					user,
+					docstatus,
+					name,
+					"Renewal Tracking",
+					"items",
+					idx,
+					item.item_code,
+					item.item_name,
+					item.description,
+					item.brand,
+					item.item_group,
+					item.oum,
+					item.qty,
+					item.rate,
+					item.amount,
+					item.base_rate,
+					item.base_amount,
+				)
+			)
+
+	frappe.db.bulk_insert("Renewal Tracking", PARENT_FIELDS, parents)
+	frappe.db.bulk_insert("Renewal Tracking Item", ITEM_FIELDS, children)
+
+	# a new document records its stage on its first save (on_update) or, inserted submitted, on on_submit
+	record_stage_events(
+		[
+			{
+				"name": group.name,
+				"old_stage": None,
+				"new_stage": group.header.renewal_stage,
+				"days_remaining": group.header.days_remaining,
+			}
+			for group in groups
+		],
+		"Submit" if submit else "Save",
+	)
+
+
+def reserve_series_names(naming_series, count):
+	"""
+	count consecutive names of naming_series, advancing its counter in
+	tabSeries once under a row lock instead of once per document
+	"""
+	if "#" not in naming_series:
+		naming_series = f"{naming_series}.#####"
+
+	block = {}
+
+	def reserve_block(prefix, digits):
+		current = frappe.db.sql("SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE", prefix)
+		if current and current[0][0] is not None:
+			block["start"] = cint(current[0][0]) + 1
+			frappe.db.sql("UPDATE `tabSeries` SET `current` = `current` + %s WHERE `name` = %s", (count, prefix))
+		else:
+			block["start"] = 1
+			frappe.db.sql("INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)", (prefix, count))
+		block["digits"] = digits
+		# stands in for the number, swapped for each one below
+		return "\0"
+
+	template = parse_naming_series(naming_series, number_generator=reserve_block)
+	return [
+		template.replace("\0", str(number).zfill(block["digits"]))
+		for number in range(block["start"], block["start"] + count)
+	]
+
+
+def get_renewal_error(group, position, field, value, message):
+	"""Error entry for the row at position of group, message is formatted with value"""
+	value = cstr(value)
+	return {
+		"row": position + 2,
+		"renewal_key": group.key,
+		"field": field,
+		"value": value,
+		"message": message.format(value),
+	}
+
+
+def publish_progress(summary, done=False):
+	frappe.publish_realtime(
+		RENEWAL_IMPORT_PROGRESS_EVENT,
+		{**summary, "done": done} if done else {key: value for key, value in summary.items() if key != "errors"},
+		user=frappe.session.user,
+	)
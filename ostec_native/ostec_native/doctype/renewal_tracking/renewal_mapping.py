@@ -0,0 +1,613 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Mapping of Renewal Tracking onto Quotation, Supplier Quotation and
+Request for Quotation.
+
+RENEWAL_TABLE_MAPS holds the get_mapped_doc table maps of the make_*
+buttons. Rather than have get_mapped_doc resolve them against the metas
+for every document and every item row, get_mapping_plan compiles them
+once per process into a MappingPlan per target doctype: the fields copied
+by name, the link fields filled with the renewal, the field_map pairs
+and the fetch_from fields of each link. Fetched values are read with one
+query per linked doctype for all rows instead of one document load per
+row. Plans are dropped when the metadata version changes, which
+frappe.clear_cache does whenever a DocType, Custom Field or Property
+Setter is saved. map_renewal produces the same document as get_mapped_doc.
+
+make_documents_for_renewals applies the plans to every renewal matching
+a stage / company / account manager filter, as a background job queued
+by enqueue_renewal_mapping. It works through the renewals
+MAPPING_CHUNK_SIZE at a time:
+
+1. renewals that already have a non-cancelled target document linked
+   through renewal_tracking are skipped, with one query for the chunk
+2. the renewals and their items are read with one query per table
+3. each renewal is mapped and inserted inside a savepoint, so one that
+   fails validation is reported and the others still go in
+
+Every chunk is committed and reported on RENEWAL_MAPPING_PROGRESS_EVENT,
+the summary lists the created and failed renewals.
+
+Once a heavy stage run has finished, enqueue_milestone_quotations queues
+draft_milestone_quotations for the day. It drafts Quotations for the
+renewals whose stage events show them entering QUOTATION_MILESTONE_STAGE,
+through the same batch.
+"""
+
+import json
+import time
+
+import frappe
+from frappe.model import child_table_fields, default_fields, table_fields
+from frappe.utils import add_days, cint, flt, getdate, nowdate, today
+
+MAKE_DOCUMENTS_METHOD = (
+	"ostec_native.ostec_native.doctype.renewal_tracking.renewal_mapping.make_documents_for_renewals"
+)
+RENEWAL_MAPPING_PROGRESS_EVENT = "renewal_mapping_progress"
+
+# Renewals read, mapped and inserted per transaction
+MAPPING_CHUNK_SIZE = 100
+
+# A batch of 1,000 quotations runs past the long queue's default timeout on a busy site
+MAPPING_JOB_TIMEOUT = 3600
+
+DRAFT_MILESTONE_QUOTATIONS_METHOD = (
+	"ostec_native.ostec_native.doctype.renewal_tracking.renewal_mapping.draft_milestone_quotations"
+)
+# Entering this stage drafts a Quotation, the README's "prepare quotation" step
+QUOTATION_MILESTONE_STAGE = "90 Days to Expiry"
+# Days of stage events looked at, so renewals a missed day or the light job moved are caught up
+MILESTONE_LOOKBACK_DAYS = 7
+
+
+def set_quotation_values(source, target):
+	target.transaction_date = nowdate()
+	target.valid_till = add_days(nowdate(), 30)
+
+
+def set_supplier_quotation_values(source, target):
+	target.transaction_date = nowdate()
+
+
+def set_request_for_quotation_values(source, target):
+	target.transaction_date = nowdate()
+	target.status = "Draft"
+
+
+def set_schedule_date(source, target, source_parent):
+	target.schedule_date = add_days(nowdate(), 7)
+
+
+RENEWAL_TABLE_MAPS = {
+	"Quotation": {
+		"Renewal Tracking": {
+			"doctype": "Quotation",
+			"field_map": {
+				"name": "renewal_tracking",
+				"company": "company",
+				"currency": "currency",
+				"exchange_rate": "conversion_rate",
+			},
+		},
+		"Renewal Tracking Item": {
+			"doctype": "Quotation Item",
+			"field_map": {
+				"item_code": "item_code",
+				"item_name": "item_name",
+				"description": "description",
+				"qty": "qty",
+				"oum": "uom",
+				"rate": "rate",
+				"amount": "amount",
+				"brand": "brand",
+			},
+		},
+	},
+	"Supplier Quotation": {
+		"Renewal Tracking": {
+			"doctype": "Supplier Quotation",
+			"field_map": {
+				"name": "renewal_tracking",
+				"company": "company",
+				"currency": "currency",
+				"exchange_rate": "conversion_rate",
+			},
+		},
+		"Renewal Tracking Item": {
+			"doctype": "Supplier Quotation Item",
+			"field_map": {
+				"item_code": "item_code",
+				"item_name": "item_name",
+				"description": "description",
+				"qty": "qty",
+				"oum": "uom",
+				"rate": "rate",
+				"amount": "amount",
+				"brand": "brand",
+			},
+		},
+	},
+	"Request for Quotation": {
+		"Renewal Tracking": {
+			"doctype": "Request for Quotation",
+			"field_map": {
+				"name": "renewal_tracking",
+				"company": "company",
+			},
+		},
+		"Renewal Tracking Item": {
+			"doctype": "Request for Quotation Item",
+			"field_map": {
+				"item_code": "item_code",
+				"item_name": "item_name",
+				"description": "description",
+				"qty": "qty",
+				"oum": "uom",
+				"brand": "brand",
+			},
+			"postprocess": set_schedule_date,
+		},
+	},
+}
+
+# Header defaults each make_* button sets after mapping
+SET_MISSING_VALUES = {
+	"Quotation": set_quotation_values,
+	"Supplier Quotation": set_supplier_quotation_values,
+	"Request for Quotation": set_request_for_quotation_values,
+}
+
+# (site, target doctype) -> MappingPlan, kept for the life of the process
+MAPPING_PLANS = {}
+
+
+class TablePlan:
+	"""map_fields of one source doctype onto the target doctype of table_map, resolved from their metas"""
+
+	def __init__(self, source_doctype, table_map, source_parent_doctype=None):
+		source_meta = frappe.get_meta(source_doctype)
+		target_meta = frappe.get_meta(table_map["doctype"])
+		self.doctype = table_map["doctype"]
+		self.postprocess = table_map.get("postprocess")
+
+		no_copy_fields = {
+			df.fieldname
+			for meta in (source_meta, target_meta)
+			for df in meta.get("fields")
+			if df.no_copy == 1 or df.fieldtype in table_fields
+		}
+		no_copy_fields.update(default_fields, child_table_fields, table_map.get("field_no_map", ()))
+		source_fields = {df.fieldname for df in source_meta.get("fields")}
+
+		# fields with the same name on both sides
+		self.copy_fields = []
+		# (fieldname, to_parent) of links to the source, or its parent, filled when nothing was copied in
+		self.source_links = []
+		for df in target_meta.get("fields"):
+			if df.fieldname in no_copy_fields:
+				continue
+			if df.fieldname in source_fields:
+				self.copy_fields.append(df.fieldname)
+			if df.fieldtype == "Link":
+				if df.options == source_doctype:
+					self.source_links.append((df.fieldname, False))
+				elif source_parent_doctype and df.options == source_parent_doctype:
+					self.source_links.append((df.fieldname, True))
+
+		field_map = table_map.get("field_map") or {}
+		self.field_map = list(field_map.items() if isinstance(field_map, dict) else field_map)
+
+		# (link fieldname, linked doctype, [(fieldname, linked fieldname, overwrite)]) in meta order
+		self.fetches = []
+		for df in target_meta.get("fields", {"fieldtype": "Link"}):
+			fetch_fields = [
+				(fetch_df.fieldname, fetch_df.fetch_from.split(".")[1], fetch_df.fieldtype == "Read Only")
+				for fetch_df in target_meta.get("fields", {"fetch_from": f"^{df.fieldname}."})
+				if (fetch_df.fieldtype == "Read Only" or fetch_df.read_only)
+				and fetch_df.fieldname not in no_copy_fields
+			]
+			if fetch_fields:
+				self.fetches.append((df.fieldname, df.options, fetch_fields))
+
+	def set_values(self, source_doc, target_doc, source_parent=None):
+		"""Everything map_fields sets before the fetches, in one update"""
+		values = {}
+		for fieldname in self.copy_fields:
+			value = source_doc.get(fieldname)
+			if value not in (None, ""):
+				values[fieldname] = value
+		for fieldname, to_parent in self.source_links:
+			if fieldname not in values and not target_doc.get(fieldname):
+				values[fieldname] = source_parent.name if to_parent else source_doc.name
+		for source_fieldname, fieldname in self.field_map:
+			value = source_doc.get(source_fieldname)
+			if value not in (None, ""):
+				values[fieldname] = value
+		if source_doc.idx:
+			values["idx"] = source_doc.idx
+		target_doc.update(values)
+
+	def fetch_values(self, target_docs):
+		"""map_fetch_fields of every target_docs row, reading each linked doctype once for all of them"""
+		for link_fieldname, link_doctype, fetch_fields in self.fetches:
+			linked = get_linked_values(
+				link_doctype,
+				{doc.get(link_fieldname) for doc in target_docs if doc.get(link_fieldname)},
+				[linked_fieldname for _fieldname, linked_fieldname, _overwrite in fetch_fields],
+			)
+			for doc in target_docs:
+				values = doc.get(link_fieldname) and linked.get(str(doc.get(link_fieldname)).casefold())
+				if values is None:
+					continue
+				for fieldname, linked_fieldname, overwrite in fetch_fields:
+					if (overwrite or not doc.get(fieldname)) and values.get(linked_fieldname) not in (None, ""):
+						doc.set(fieldname, values[linked_fieldname])
+
+
+class MappingPlan:
+	"""RENEWAL_TABLE_MAPS of one target doctype compiled against the current metas"""
+
+	def __init__(self, target_doctype):
+		self.target_doctype = target_doctype
+		self.table_maps = RENEWAL_TABLE_MAPS[target_doctype]
+		self.set_missing_values = SET_MISSING_VALUES[target_doctype]
+		self.metadata_version = get_metadata_version()
+
+		self.parent = TablePlan("Renewal Tracking", self.table_maps["Renewal Tracking"])
+		self.items = TablePlan(
+			"Renewal Tracking Item", self.table_maps["Renewal Tracking Item"], "Renewal Tracking"
+		)
+		self.parentfield = next(
+			df.fieldname
+			for df in frappe.get_meta(target_doctype).get_table_fields()
+			if df.options == self.items.doctype
+		)
+
+	def map(self, source_doc, target_doc):
+		"""Map source_doc onto target_doc the way get_mapped_doc does, past the permission checks"""
+		target_doc.run_method("before_mapping", source_doc, self.table_maps)
+
+		self.parent.set_values(source_doc, target_doc)
+		self.parent.fetch_values([target_doc])
+		if self.parent.postprocess:
+			self.parent.postprocess(source_doc, target_doc, None)
+
+		# rows picked in the form's "select items" dialog
+		selected = (frappe.flags.selected_children or {}).get("items")
+		rows = []
+		for source_item in source_doc.get("items"):
+			if selected is not None and source_item.name not in selected:
+				continue
+			target_item = frappe.new_doc(self.items.doctype, parent_doc=target_doc, parentfield=self.parentfield)
+			self.items.set_values(source_item, target_item, source_doc)
+			rows.append((source_item, target_item))
+
+		self.items.fetch_values([target_item for _source_item, target_item in rows])
+		for source_item, target_item in rows:
+			if self.items.postprocess:
+				self.items.postprocess(source_item, target_item, source_doc)
+			target_item.idx = None
+			target_doc.append(self.parentfield, target_item)
+
+		self.set_missing_values(source_doc, target_doc)
+		target_doc.run_method("after_mapping", source_doc)
+		target_doc.set_onload("load_after_mapping", True)
+		return target_doc
+
+
+def get_mapping_plan(target_doctype):
+	"""The MappingPlan of target_doctype, compiled again when the metadata version has moved on"""
+	key = (frappe.local.site, target_doctype)
+	plan = MAPPING_PLANS.get(key)
+	if not plan or plan.metadata_version != get_metadata_version():
+		plan = MAPPING_PLANS[key] = MappingPlan(target_doctype)
+	return plan
+
+
+def get_metadata_version():
+	"""Changes whenever frappe.clear_cache drops a cached meta"""
+	return frappe.cache.get_value("metadata_version") or frappe.reset_metadata_version()
+
+
+def get_linked_values(doctype, names, fieldnames):
+	"""
+	{name.casefold(): {fieldname: value}} of the doctype records named in
+	names, numbers typed the way a loaded document has them
+	"""
+	if not names:
+		return {}
+
+	meta = frappe.get_meta(doctype)
+	fieldnames = set(fieldnames)
+	if not fieldnames <= set(meta.get_valid_columns()):
+		# fetched from something other than a column, only a loaded document has it
+		values = {}
+		for name in names:
+			try:
+				doc = frappe.get_doc(doctype, name)
+			except Exception:
+				continue
+			values[str(name).casefold()] = {fieldname: doc.get(fieldname) for fieldname in fieldnames}
+		return values
+
+	rows = frappe.get_all(doctype, filters={"name": ("in", list(names))}, fields=["name", *fieldnames])
+	for df in meta.get("fields", {"fieldname": ("in", list(fieldnames))}):
+		for row in rows:
+			if df.fieldtype == "Check":
+				row[df.fieldname] = cint(row[df.fieldname])
+			elif row[df.fieldname] is not None and df.fieldtype == "Int":
+				row[df.fieldname] = cint(row[df.fieldname])
+			elif row[df.fieldname] is not None and df.fieldtype in ("Float", "Currency", "Percent"):
+				row[df.fieldname] = flt(row[df.fieldname])
+	return {str(row.name).casefold(): row for row in rows}
+
+
+@frappe.whitelist()
+def enqueue_renewal_mapping(
+	target_doctype="Quotation", renewal_stage=None, company=None, account_manager=None, supplier=None
+):
+	"""
+	Queue make_documents_for_renewals for the submitted renewals matching
+	the filter, progress and the summary arrive on RENEWAL_MAPPING_PROGRESS_EVENT
+	"""
+	check_mapping_target(target_doctype, supplier)
+
+	filters = get_renewal_filters(renewal_stage, company, account_manager)
+	job_id = f"renewal_mapping::{target_doctype}::{json.dumps(filters, sort_keys=True)}"
+	frappe.enqueue(
+		MAKE_DOCUMENTS_METHOD,
+		queue="long",
+		timeout=MAPPING_JOB_TIMEOUT,
+		job_id=job_id,
+		deduplicate=True,
+		target_doctype=target_doctype,
+		renewal_stage=renewal_stage,
+		company=company,
+		account_manager=account_manager,
+		supplier=supplier,
+	)
+	return job_id
+
+
+def make_documents_for_renewals(
+	target_doctype="Quotation",
+	renewal_stage=None,
+	company=None,
+	account_manager=None,
+	supplier=None,
+	names=None,
+	chunk_size=MAPPING_CHUNK_SIZE,
+):
+	"""
+	Insert a draft target_doctype for every submitted renewal matching
+	the filter, or for the renewals in names. Quotations are made out to
+	the renewal's customer, Supplier Quotations and Requests for
+	Quotation to supplier. Commits after every chunk_size renewals
+
+	Returns {"target_doctype", "created", "failed", "skipped", "seconds"},
+	created being {"renewal_tracking", "name"} dicts, failed
+	{"renewal_tracking", "message"} dicts and skipped the number of
+	renewals that already had a target document
+	"""
+	check_mapping_target(target_doctype, supplier)
+
+	started = time.perf_counter()
+	summary = frappe._dict(target_doctype=target_doctype, created=[], failed=[], skipped=0)
+
+	if names is None:
+		names = frappe.get_list(
+			"Renewal Tracking",
+			filters=get_renewal_filters(renewal_stage, company, account_manager),
+			pluck="name",
+			order_by="name",
+			limit_page_length=0,
+		)
+
+	for start in range(0, len(names), chunk_size):
+		make_documents_for_chunk(target_doctype, names[start : start + chunk_size], summary, supplier)
+		frappe.db.commit()
+		publish_progress(summary, total=len(names))
+
+	summary.seconds = round(time.perf_counter() - started, 2)
+	if summary.failed:
+		frappe.log_error(
+			title=f"Renewal {target_doctype} generation: {len(summary.failed)} failed",
+			message=json.dumps(summary.failed, indent=1, default=str),
+		)
+	publish_progress(summary, total=len(names), done=True)
+	return summary
+
+
+def enqueue_milestone_quotations(as_of):
+	"""
+	Queue the day's draft_milestone_quotations, called once the heavy stage
+	run has finished. Site config renewal_milestone_quotations = 0 turns it off
+	"""
+	if not cint(frappe.conf.get("renewal_milestone_quotations", 1)):
+		return
+
+	as_of = getdate(as_of)
+	frappe.enqueue(
+		DRAFT_MILESTONE_QUOTATIONS_METHOD,
+		queue="long",
+		timeout=MAPPING_JOB_TIMEOUT,
+		job_id=f"renewal_milestone_quotations::{as_of}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		as_of=str(as_of),
+	)
+
+
+def draft_milestone_quotations(as_of=None):
+	"""
+	Draft a Quotation for every submitted renewal that entered
+	QUOTATION_MILESTONE_STAGE in the MILESTONE_LOOKBACK_DAYS up to as_of.
+	Renewals already linked from a Quotation are skipped, so running it
+	again drafts nothing twice. Returns the make_documents_for_renewals summary
+	"""
+	as_of = getdate(as_of or today())
+	summary = make_documents_for_renewals("Quotation", names=get_milestone_renewals(as_of))
+
+	frappe.logger().info(
+		f"Milestone quotations for {as_of}: {len(summary.created)} drafted, "
+		f"{summary.skipped} already quoted, {len(summary.failed)} failed"
+	)
+	return summary
+
+
+def get_milestone_renewals(as_of):
+	"""Submitted renewals with a stage event into QUOTATION_MILESTONE_STAGE within the lookback window"""
+	return frappe.db.sql(
+		"""
+		SELECT DISTINCT event.renewal_tracking
+		FROM `tabRenewal Stage Event` event
+		INNER JOIN `tabRenewal Tracking` rt ON rt.name = event.renewal_tracking
+		WHERE event.as_of BETWEEN %(from_date)s AND %(as_of)s
+			AND event.new_stage = %(stage)s
+			AND rt.docstatus = 1
+		ORDER BY event.renewal_tracking
+		""",
+		{
+			"from_date": add_days(as_of, -(MILESTONE_LOOKBACK_DAYS - 1)),
+			"as_of": as_of,
+			"stage": QUOTATION_MILESTONE_STAGE,
+		},
+		pluck=True,
+	)
+
+
+def make_documents_for_chunk(target_doctype, names, summary, supplier=None):
+	linked = get_linked_renewals(target_doctype, names)
+	summary.skipped += len(linked)
+
+	sources = get_renewal_sources([name for name in names if name not in linked])
+	for name in names:
+		if name in linked:
+			continue
+
+		frappe.db.savepoint("renewal_mapping")
+		try:
+			if name not in sources:
+				frappe.throw(f"Renewal Tracking {name} not found", frappe.DoesNotExistError)
+			target_doc = map_renewal(sources[name], target_doctype, ignore_permissions=True)
+			set_party(sources[name], target_doc, supplier)
+			target_doc.insert()
+		except Exception as e:
+			frappe.db.rollback(save_point="renewal_mapping")
+			summary.failed.append({"renewal_tracking": name, "message": str(e)})
+		else:
+			summary.created.append({"renewal_tracking": name, "name": target_doc.name})
+
+
+def map_renewal(source, target_doctype, target_doc=None, ignore_permissions=False):
+	"""
+	get_mapped_doc of a renewal onto target_doctype through its compiled
+	MappingPlan. source is a Renewal Tracking name or an already loaded
+	document, target_doc a document or its JSON to map onto
+	"""
+	apply_strict_user_permissions = frappe.get_system_settings("apply_strict_user_permissions")
+
+	if not target_doc:
+		target_doc = frappe.new_doc(target_doctype)
+	elif isinstance(target_doc, str):
+		target_doc = frappe.get_doc(json.loads(target_doc))
+
+	if not apply_strict_user_permissions and not ignore_permissions and not target_doc.has_permission("create"):
+		target_doc.raise_no_permission_to("create")
+
+	source_doc = frappe.get_doc("Renewal Tracking", source) if isinstance(source, str) else source
+	if not ignore_permissions and not source_doc.has_permission("read"):
+		source_doc.raise_no_permission_to("read")
+
+	get_mapping_plan(target_doctype).map(source_doc, target_doc)
+
+	if apply_strict_user_permissions and not ignore_permissions and not target_doc.has_permission("create"):
+		target_doc.raise_no_permission_to("create")
+	return target_doc
+
+
+def set_party(source_doc, target_doc, supplier=None):
+	"""The make_* buttons leave the party to the user, a batch has to fill it in"""
+	if target_doc.doctype == "Quotation":
+		target_doc.quotation_to = "Customer"
+		target_doc.party_name = source_doc.customer
+	elif target_doc.doctype == "Supplier Quotation":
+		target_doc.supplier = supplier
+	else:
+		target_doc.append("suppliers", {"supplier": supplier})
+
+
+def get_renewal_sources(names):
+	"""Renewal Tracking documents of names, with their items, read with one query per table"""
+	if not names:
+		return {}
+
+	parents = frappe.get_all("Renewal Tracking", filters={"name": ("in", names)}, fields=["*"])
+	items = frappe.get_all(
+		"Renewal Tracking Item",
+		filters={"parent": ("in", names), "parenttype": "Renewal Tracking", "parentfield": "items"},
+		fields=["*"],
+		order_by="idx asc",
+	)
+
+	items_by_parent = {}
+	for item in items:
+		items_by_parent.setdefault(item.parent, []).append(item)
+
+	return {
+		parent.name: frappe.get_doc(
+			{**parent, "doctype": "Renewal Tracking", "items": items_by_parent.get(parent.name, [])}
+		)
+		for parent in parents
+	}
+
+
+def get_linked_renewals(target_doctype, names):
+	"""Those of names already linked from a draft or submitted target_doctype"""
+	if not names:
+		return set()
+	return set(
+		frappe.get_all(
+			target_doctype,
+			filters={"renewal_tracking": ("in", names), "docstatus": ("<", 2)},
+			pluck="renewal_tracking",
+		)
+	)
+
+
+def get_renewal_filters(renewal_stage=None, company=None, account_manager=None):
+	filters = {"docstatus": 1}
+	for fieldname, value in (
+		("renewal_stage", renewal_stage),
+		("company", company),
+		("account_manager", account_manager),
+	):
+		if value:
+			filters[fieldname] = value
+	return filters
+
+
+def check_mapping_target(target_doctype, supplier=None):
+	if target_doctype not in RENEWAL_TABLE_MAPS:
+		frappe.throw(f"Cannot make {target_doctype} from Renewal Tracking")
+	if target_doctype != "Quotation" and not supplier:
+		frappe.throw(f"A supplier is needed to make {target_doctype} documents")
+	frappe.has_permission("Renewal Tracking", "read", throw=True)
+	frappe.has_permission(target_doctype, "create", throw=True)
+
+
+def publish_progress(summary, total, done=False):
+	message = {
+		"target_doctype": summary.target_doctype,
+		"total": total,
+		"created": len(summary.created),
+		"failed": len(summary.failed),
+		"skipped": summary.skipped,
+		"done": done,
+	}
+	if done:
+		message.update(summary, done=True, total=total)
+	frappe.publish_realtime(RENEWAL_MAPPING_PROGRESS_EVENT, message, user=frappe.session.user)
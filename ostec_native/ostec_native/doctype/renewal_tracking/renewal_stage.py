@@ -0,0 +1,129 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Vectorized renewal stage classifier.
+
+Classifies whole batches of (license_start, license_end) pairs against an
+as-of date in one NumPy pass. RenewalTracking.calculate_renewal_stage, the
+scheduled jobs and reports all delegate here so the stage rules live in one
+place:
+
+1. as_of < license_start → Open
+2. as_of >= license_start AND as_of < (license_end - 90 days) → Running
+3. as_of >= (license_end - 90 days) AND as_of < (license_end - 60 days) → 90 Days to Expiry
+4. as_of >= (license_end - 60 days) AND as_of < (license_end - 30 days) → 60 Days to Expiry
+5. as_of >= (license_end - 30 days) AND as_of < license_end → 30 Days to Expiry
+6. as_of >= license_end → Expired
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+from frappe.utils import getdate, today
+
+RENEWAL_STAGES = (
+	"Open",
+	"Running",
+	"90 Days to Expiry",
+	"60 Days to Expiry",
+	"30 Days to Expiry",
+	"Expired",
+)
+
+# stage codes, indexes into RENEWAL_STAGES
+OPEN, RUNNING, DAYS_90, DAYS_60, DAYS_30, EXPIRED = range(len(RENEWAL_STAGES))
+# code for rows missing license_start or license_end
+NO_STAGE = -1
+
+NAT = np.datetime64("NaT", "D")
+
+
+class StageBatch(NamedTuple):
+	"""Result of classify_renewal_stages, one entry per input row"""
+
+	# int8 stage codes, NO_STAGE where a license date is missing
+	codes: np.ndarray
+	# int64 days from as_of to license_end, 0 where codes == NO_STAGE
+	days_remaining: np.ndarray
+	# datetime64[D] first stage boundary after as_of, NaT once expired
+	next_transition: np.ndarray
+
+
+def to_datetime64(values) -> np.ndarray:
+	"""Convert a sequence of dates, date strings or None to a datetime64[D] array (None → NaT)"""
+	if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+		return values.astype("datetime64[D]")
+	return np.array([value or None for value in values], dtype="datetime64[D]")
+
+
+def classify_renewal_stages(license_start, license_end, as_of=None) -> StageBatch:
+	"""Classify a batch of license date pairs against as_of (default today)"""
+	start = to_datetime64(license_start)
+	end = to_datetime64(license_end)
+	as_of = np.datetime64(getdate(as_of or today()), "D")
+
+	missing = np.isnat(start) | np.isnat(end)
+
+	date_90_days_before = end - np.timedelta64(90, "D")
+	date_60_days_before = end - np.timedelta64(60, "D")
+	date_30_days_before = end - np.timedelta64(30, "D")
+
+	codes = np.select(
+		[
+			as_of < start,
+			as_of >= end,
+			as_of >= date_30_days_before,
+			as_of >= date_60_days_before,
+			as_of >= date_90_days_before,
+		],
+		[OPEN, EXPIRED, DAYS_30, DAYS_60, DAYS_90],
+		default=RUNNING,
+	).astype(np.int8)
+	codes[missing] = NO_STAGE
+
+	# stage can only change again on the next boundary date
+	next_transition = np.select(
+		[
+			as_of < start,
+			as_of < date_90_days_before,
+			as_of < date_60_days_before,
+			as_of < date_30_days_before,
+			as_of < end,
+		],
+		[start, date_90_days_before, date_60_days_before, date_30_days_before, end],
+		default=NAT,
+	).astype("datetime64[D]")
+	next_transition[missing] = NAT
+
+	days_remaining = np.where(missing, 0, (end - as_of).astype(np.int64))
+
+	return StageBatch(codes, days_remaining, next_transition)
+
+
+def get_stage_labels(codes) -> list:
+	"""Stage labels for an array of stage codes (None for NO_STAGE)"""
+	return [RENEWAL_STAGES[code] if code != NO_STAGE else None for code in codes.tolist()]
+
+
+def get_transition_dates(next_transition) -> list:
+	"""datetime.date values for a datetime64[D] array (None for NaT)"""
+	return next_transition.astype(object).tolist()
+
+
+def get_renewal_stage(license_start, license_end, as_of=None):
+	"""
+	Classify a single document
+
+	Returns (renewal_stage, next_stage_transition, days_remaining),
+	all None when a license date is missing
+	"""
+	batch = classify_renewal_stages([license_start], [license_end], as_of)
+	if batch.codes[0] == NO_STAGE:
+		return None, None, None
+
+	return (
+		RENEWAL_STAGES[batch.codes[0]],
+		get_transition_dates(batch.next_transition)[0],
+		int(batch.days_remaining[0]),
+	)
@@ -55,6 +55,13 @@ frappe.ui.form.on('Renewal Tracking', {
         get_exchange_rate(frm);
     },
     
+    date: function(frm) {
+        // Rates are effective by date, fetch the one for the new date
+        if (frm.doc.currency) {
+            get_exchange_rate(frm);
+        }
+    },
+    
     exchange_rate: function(frm) {
         // Recalculate all items when exchange rate changes
         if (frm.doc.items && frm.doc.items.length > 0) {
@@ -164,6 +171,18 @@ function add_upload_download_buttons(frm) {
 }
 
 function download_items_template(frm) {
+    // Saved items are streamed by the server, the browser only builds the
+    // file for new or edited documents the server has not seen yet
+    if (!frm.is_new() && !frm.is_dirty() && frm.doc.items && frm.doc.items.length > 0) {
+        let args = {
+            filters: JSON.stringify([['Renewal Tracking', 'name', '=', frm.doc.name]]),
+            doctype: 'Renewal Tracking Item',
+            file_format: 'CSV'
+        };
+        window.open('/api/method/ostec_native.ostec_native.doctype.renewal_tracking.renewal_export.export_renewals?' + $.param(args));
+        return;
+    }
+    
     // Prepare data for download
     let data = [];
     
@@ -250,44 +269,160 @@ function upload_items_from_file(frm) {
             allowed_file_types: ['.csv', '.xlsx', '.xls']
         },
         on_success: function(file_doc) {
-            // Process the uploaded file
-            frappe.call({
-                method: 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.import_items',
-                args: {
-                    file_url: file_doc.file_url,
-                    parent_doc: frm.doc.name
-                },
-                callback: function(r) {
-                    if (r.message) {
-                        // Clear existing items
-                        frm.clear_table('items');
-                        
-                        // Add imported items
-                        r.message.forEach(function(item_data) {
-                            let item = frm.add_child('items');
-                            Object.assign(item, item_data);
-                        });
-                        
-                        // Refresh and recalculate
-                        frm.refresh_field('items');
-                        
-                        // Recalculate all values
-                        frm.doc.items.forEach(function(item) {
-                            calculate_item_values(frm, item.doctype, item.name);
-                        });
-                        calculate_totals(frm);
-                        
-                        frappe.show_alert({
-                            message: __('Items imported successfully'),
-                            indicator: 'green'
-                        });
-                    }
+            // Saved drafts import in a background job, new documents page the rows into the form
+            if (!frm.is_new()) {
+                enqueue_item_import(frm, file_doc.file_url);
+                return;
+            }
+            
+            // Clear existing items, the file replaces them
+            frm.clear_table('items');
+            import_items_page(frm, file_doc.file_url, 0, []);
+        }
+    });
+}
+
+function enqueue_item_import(frm, file_url) {
+    // The job writes the rows into the saved draft, unsaved edits go first
+    let save = frm.is_dirty() ? frm.save() : Promise.resolve();
+    save.then(function() {
+        frappe.call({
+            method: 'ostec_native.ostec_native.doctype.renewal_item_import.renewal_item_import.enqueue_item_import',
+            args: {
+                renewal_tracking: frm.doc.name,
+                file_url: file_url
+            },
+            callback: function(r) {
+                if (r.message) {
+                    watch_item_import(frm, r.message);
                 }
+            }
+        });
+    });
+}
+
+function watch_item_import(frm, import_name) {
+    // Progress arrives over realtime, polling the status record covers a missed or absent socket
+    let finished = false;
+    let poll = null;
+    
+    let on_progress = function(status) {
+        if (finished || !status || status.name !== import_name) {
+            return;
+        }
+        
+        if (status.status === 'Queued' || status.status === 'Running') {
+            frappe.show_progress(
+                __('Importing items'),
+                status.rows_read,
+                status.total_rows || status.rows_read,
+                __('{0} rows imported, {1} rejected', [status.rows_imported, status.rows_failed])
+            );
+            return;
+        }
+        
+        finished = true;
+        clearInterval(poll);
+        frappe.realtime.off('renewal_item_import_progress', on_progress);
+        frappe.hide_progress();
+        
+        frm.reload_doc().then(function() {
+            let errors = status.errors || [];
+            if (status.status === 'Failed') {
+                frappe.msgprint({
+                    title: __('Item import failed'),
+                    indicator: 'red',
+                    message: errors.length ? errors[errors.length - 1].message : ''
+                });
+            } else if (errors.length) {
+                show_import_errors(errors, status.rows_failed);
+            } else {
+                frappe.show_alert({
+                    message: __('{0} items imported successfully', [status.rows_imported]),
+                    indicator: 'green'
+                });
+            }
+        });
+    };
+    
+    frappe.realtime.on('renewal_item_import_progress', on_progress);
+    poll = setInterval(function() {
+        frappe.call({
+            method: 'ostec_native.ostec_native.doctype.renewal_item_import.renewal_item_import.get_item_import_status',
+            args: { import_name: import_name },
+            callback: function(r) {
+                on_progress(r.message);
+            }
+        });
+    }, 5000);
+    
+    frappe.show_progress(__('Importing items'), 0, 1, __('Queued'));
+}
+
+function import_items_page(frm, file_url, start, errors) {
+    // The server streams the file and returns it a page at a time,
+    // so large files never travel as one response
+    frappe.call({
+        method: 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.import_items_page',
+        args: {
+            file_url: file_url,
+            start: start
+        },
+        freeze: true,
+        freeze_message: __('Importing items... {0} rows read', [frm.doc.items.length]),
+        callback: function(r) {
+            if (!r.message) {
+                return;
+            }
+            
+            // Add imported items, rows the server rejected come back in errors
+            r.message.items.forEach(function(item_data) {
+                let item = frm.add_child('items');
+                Object.assign(item, item_data);
+            });
+            errors = errors.concat(r.message.errors || []);
+            
+            if (r.message.next_start !== null && r.message.next_start !== undefined) {
+                import_items_page(frm, file_url, r.message.next_start, errors);
+                return;
+            }
+            
+            // Refresh and recalculate once every page is in
+            frm.refresh_field('items');
+            
+            // Recalculate all values
+            frm.doc.items.forEach(function(item) {
+                calculate_item_values(frm, item.doctype, item.name);
+            });
+            calculate_totals(frm);
+            
+            if (errors.length) {
+                show_import_errors(errors);
+                return;
+            }
+            
+            frappe.show_alert({
+                message: __('Items imported successfully'),
+                indicator: 'green'
             });
         }
     });
 }
 
+function show_import_errors(errors, failed_rows) {
+    // One list of every rejected row instead of failing on save one at a time
+    let rows = errors.slice(0, 200).map(function(error) {
+        return `<tr><td>${error.row}</td><td>${frappe.utils.escape_html(error.item_code)}</td><td>${frappe.utils.escape_html(error.message)}</td></tr>`;
+    }).join('');
+    let more = errors.length > 200 ? `<p>${__('... and {0} more', [errors.length - 200])}</p>` : '';
+    
+    frappe.msgprint({
+        title: __('{0} rows were not imported', [failed_rows || errors.length]),
+        indicator: 'orange',
+        message: `<table class="table table-bordered"><thead><tr><th>${__('Row')}</th><th>${__('Item Code')}</th><th>${__('Error')}</th></tr></thead><tbody>${rows}</tbody></table>${more}`
+    });
+}
+
 function strip_html(html) {
     if (!html) return '';
     let tmp = document.createElement('DIV');
@@ -300,47 +435,55 @@ function get_exchange_rate(frm) {
         return;
     }
     
-    // Get company currency
-    frappe.db.get_value('Company', frm.doc.company, 'default_currency', function(r) {
-        let company_currency = r.default_currency;
-        
-        // Check if base currency is selected (Ostec Ltd = GHS, Ostec SA = CFA)
-        if (frm.doc.currency === company_currency) {
-            // Base currency selected, exchange rate = 1
-            frm.set_value('exchange_rate', 1.0);
-            return;
-        }
-        
-        // Try to find exchange rate from Currency Exchange doctype
-        frappe.call({
-            method: 'frappe.client.get_value',
-            args: {
-                doctype: 'Currency Exchange',
-                filters: {
-                    from_currency: frm.doc.currency,
-                    to_currency: company_currency
-                },
-                fieldname: 'exchange_rate'
-            },
-            callback: function(response) {
-                if (response.message && response.message.exchange_rate) {
-                    // Found exchange rate in system, set it
-                    frm.set_value('exchange_rate', flt(response.message.exchange_rate));
-                } else {
-                    // Currency pair not available, prompt user to enter rate manually
-                    frappe.prompt({
-                        label: 'Exchange Rate',
-                        fieldname: 'rate',
-                        fieldtype: 'Float',
-                        description: `Currency pair ${frm.doc.currency} to ${company_currency} not found in system. Please enter the exchange rate manually.`,
-                        default: frm.doc.exchange_rate || 1.0,
-                        reqd: 1
-                    }, function(values) {
-                        frm.set_value('exchange_rate', flt(values.rate));
-                    }, 'Enter Exchange Rate', 'Set Rate');
-                }
+    // Company currency and the Currency Exchange rate effective on the renewal date, in one (server-cached) call
+    frappe.call({
+        method: 'ostec_native.utils.currency.get_currency_conversion',
+        args: {
+            company: frm.doc.company,
+            currency: frm.doc.currency,
+            date: frm.doc.date
+        },
+        callback: function(r) {
+            let company_currency = r.message && r.message.company_currency;
+            frm.company_currency = {company: frm.doc.company, currency: company_currency};
+            
+            // Check if base currency is selected (Ostec Ltd = GHS, Ostec SA = CFA)
+            if (frm.doc.currency === company_currency) {
+                // Base currency selected, exchange rate = 1
+                frm.set_value('exchange_rate', 1.0);
+                return;
             }
-        });
+            
+            if (r.message && r.message.exchange_rate) {
+                // Found exchange rate in system, set it
+                frm.set_value('exchange_rate', flt(r.message.exchange_rate));
+            } else {
+                // Currency pair not available, prompt user to enter rate manually
+                frappe.prompt({
+                    label: 'Exchange Rate',
+                    fieldname: 'rate',
+                    fieldtype: 'Float',
+                    description: `Currency pair ${frm.doc.currency} to ${company_currency} not found in system. Please enter the exchange rate manually.`,
+                    default: frm.doc.exchange_rate || 1.0,
+                    reqd: 1
+                }, function(values) {
+                    frm.set_value('exchange_rate', flt(values.rate));
+                }, 'Enter Exchange Rate', 'Set Rate');
+            }
+        }
+    });
+}
+
+function with_company_currency(frm, callback) {
+    // Company currency is fetched once per company, not once per item row
+    if (frm.company_currency && frm.company_currency.company === frm.doc.company) {
+        callback(frm.company_currency.currency);
+        return;
+    }
+    
+    frappe.db.get_value('Company', frm.doc.company, 'default_currency', function(r) {
+        frm.company_currency = {company: frm.doc.company, currency: r.default_currency};
+        callback(r.default_currency);
     });
 }
 
@@ -363,9 +506,7 @@ function calculate_item_values(frm, cdt, cdn) {
         return;
     }
     
-    frappe.db.get_value('Company', frm.doc.company, 'default_currency', function(r) {
-        let company_currency = r.default_currency;
-        
+    with_company_currency(frm, function(company_currency) {
         // Check if currency conversion is needed
         if (frm.doc.currency && company_currency && frm.doc.currency !== company_currency) {
             // Different currencies - apply exchange rate
@@ -438,9 +579,9 @@ function validate_and_calculate(frm) {
         return;
     }
     
-    // Calculate days remaining
+    // Calculate days remaining (virtual field, shown only and never saved)
     let today = frappe.datetime.get_today();
-    let days_remaining = frappe.datetime.get_day_diff(frm.doc.license_end, today);
-    frm.set_value('days_remaining', days_remaining);
+    frm.doc.days_remaining = frappe.datetime.get_day_diff(frm.doc.license_end, today);
+    frm.refresh_field('days_remaining');
 }
 
@@ -3,55 +3,142 @@
 
 # import frappe
 # -*- coding: utf-8 -*-
+import hashlib
 import json
+import time
+from itertools import islice
 
 import frappe
+from frappe.model import no_value_fields
 from frappe.model.document import Document
-from frappe.utils import flt,getdate,nowdate
+from frappe.utils import cint, cstr, flt,getdate,nowdate
 # new additions to handle date automation
-from frappe.utils import getdate, today, date_diff, add_days
+from frappe.utils import getdate, today, date_diff, add_days, now_datetime
+from frappe.utils.file_manager import get_file_path
 from typing import Optional
 
+from ostec_native.ostec_native.doctype.renewal_job_run.renewal_job_run import (
+    JobRunMetrics,
+    finish_job_run,
+    start_job_run,
+)
+from ostec_native.ostec_native.doctype.renewal_stage_event.renewal_stage_event import record_stage_events
+from ostec_native.ostec_native.doctype.renewal_tracking.item_import import (
+    IMPORT_PAGE_LENGTH,
+    is_csv,
+    iter_import_items,
+    read_import_page,
+    resolve_item_masters,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.line_items import calculate_line_items
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_mapping import (
+    enqueue_milestone_quotations,
+    map_renewal,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_stage import (
+    classify_renewal_stages,
+    get_renewal_stage,
+    get_stage_labels,
+    get_transition_dates,
+)
+from ostec_native.utils.currency import get_company_currency, get_exchange_rate
+from ostec_native.utils.lock import LeaseLock, LeaseLostError, acquire_with_policy
+
+
+# Item fields calculate_values computes, the fingerprint covers what they are computed from
+ITEM_COMPUTED_FIELDS = ('amount', 'base_rate', 'base_amount')
+
+
+def get_item_fingerprint_fields():
+    """
+    Item fields besides name, idx, qty and rate that a save has to write
+    back when they change: every Renewal Tracking Item field holding a
+    value, custom fields included, except the computed ones
+    """
+    return [
+        df.fieldname
+        for df in frappe.get_meta('Renewal Tracking Item').fields
+        if df.fieldtype not in no_value_fields
+        and df.fieldname not in ('qty', 'rate', *ITEM_COMPUTED_FIELDS)
+    ]
+
+
+def get_days_remaining(license_end, as_of=None):
+    """Days from as_of (default today) until license_end, negative once expired"""
+    if not license_end:
+        return None
+    return date_diff(license_end, as_of or today())
 
 
 class RenewalTracking(Document):
+    @property
+    def days_remaining(self):
+        """Virtual field, derived from license_end at read time instead of stored daily"""
+        return get_days_remaining(self.license_end)
+    
     def validate(self):
+        """Validate dates, then compute items, totals and stage in one pass"""
+        try:
+            self.validate_license_dates()
+        except Exception as e:
+            frappe.log_error(
+                message=frappe.get_traceback(),
+                title=f"Renewal Tracking Validation Error - {self.name}"
+            )
+            frappe.throw(str(e))
+        
         self.set_exchange_rate()
-        self.calculate_item_values()
-        self.calculate_totals()
-    
-    def before_save(self):
-        self.calculate_item_values()
-        self.calculate_totals()
+        
+        # Header-only edits leave the item table and its totals as last calculated
+        fingerprint = self.get_items_fingerprint()
+        doc_before_save = self.get_doc_before_save()
+        self.flags.items_unchanged = bool(
+            self._action == 'save'
+            and doc_before_save
+            and doc_before_save.items_fingerprint == fingerprint
+        )
+        
+        if self.flags.items_unchanged:
+            self.net_total = doc_before_save.net_total
+            self.net_total_base = doc_before_save.net_total_base
+            self.calculate_renewal_stage()
+        else:
+            self.calculate_values()
+        self.items_fingerprint = fingerprint
     
     def set_exchange_rate(self):
-        """Set exchange rate from Currency Exchange doctype"""
+        """
+        Set exchange rate from Currency Exchange doctype, and
+        manual_exchange_rate when the rate entered is not the one in the
+        system, so revalue_draft_renewals keeps it
+        """
         if not self.currency or not self.company:
             return
         
-        company_currency = frappe.db.get_value('Company', self.company, 'default_currency')
+        company_currency = self.get_company_currency()
         
         # For Ostec Ltd (GHS) or Ostec SA (CFA) - if base currency selected, exchange rate = 1
         if self.currency == company_currency:
             self.exchange_rate = 1.0
+            self.manual_exchange_rate = 0
             return
         
         # If exchange rate already manually entered, keep it
         if self.exchange_rate and self.exchange_rate > 0:
+            if self.is_new() or self.has_value_changed('exchange_rate') or self.has_value_changed('currency'):
+                # the form fills in the Currency Exchange rate too, only a different rate is manual
+                system_rate = get_exchange_rate(self.currency, company_currency, self.date)
+                self.manual_exchange_rate = cint(flt(self.exchange_rate, 9) != flt(system_rate, 9))
             return
         
-        # Try to find exchange rate from Currency Exchange doctype
-        exchange_rate_value = frappe.db.get_value('Currency Exchange',
-            {
-                'from_currency': self.currency,
-                'to_currency': company_currency
-            },
-            'exchange_rate'
-        )
+        # Try to find exchange rate from Currency Exchange doctype,
+        # the latest entry effective on the renewal's date
+        exchange_rate_value = get_exchange_rate(self.currency, company_currency, self.date)
         
         if exchange_rate_value:
             # Found in system, store the exchange rate
             self.exchange_rate = flt(exchange_rate_value)
+            self.manual_exchange_rate = 0
         else:
             # Currency pair not available in system, user must enter manually
             frappe.throw(
@@ -59,92 +146,77 @@ class RenewalTracking(Document):
                 'Please enter the exchange rate manually.'
             )
     
-    def calculate_item_values(self):
-        """Calculate amounts and base currency values for all items"""
-        if not self.items:
-            return
-        
-        # Get exchange rate
-        exchange_rate = flt(self.exchange_rate) or 1.0
+    def calculate_values(self):
+        """
+        Compute everything derived on save with a single walk over the items:
+        amount, base_rate and base_amount of each row, net_total and
+        net_total_base, then renewal_stage and next_stage_transition
+        (days_remaining is derived from license_end when read)
+        """
         company_currency = self.get_company_currency()
+        # Ostec Ltd (GHS) or Ostec SA (CFA) in their own currency need no conversion
+        convert = bool(self.currency and company_currency and self.currency != company_currency)
         
+        self.net_total, self.net_total_base = calculate_line_items(self.items, self.exchange_rate, convert)
+        
+        self.calculate_renewal_stage()
+    
+    def get_items_fingerprint(self):
+        """
+        Hash over company, currency, exchange rate and every item row's
+        user-entered fields, equal fingerprints mean calculate_values would
+        produce the same values and the rows need no rewrite
+        """
+        digest = hashlib.sha1(
+            json.dumps([self.company, self.currency, flt(self.exchange_rate)]).encode()
+        )
+        fingerprint_fields = get_item_fingerprint_fields()
         for item in self.items:
-            # Calculate amount = qty * rate
-            item.amount = flt(item.qty, 2) * flt(item.rate, 2)
-            
-            # Calculate base currency values using exchange rate
-            if self.currency and company_currency and self.currency != company_currency:
-                # Different currencies - apply exchange rate
-                item.base_rate = flt(item.rate, 2) * exchange_rate
-                item.base_amount = flt(item.amount, 2) * exchange_rate
-            else:
-                # Same currency (base currency) - no conversion needed
-                item.base_rate = item.rate
-                item.base_amount = item.amount
-    
-    def calculate_totals(self):
-        """Calculate net_total and net_total_base from all item lines"""
-        if not self.items:
-            self.net_total = 0.0
-            self.net_total_base = 0.0
+            digest.update(json.dumps(
+                [item.name, item.idx, flt(item.qty), flt(item.rate)]
+                + [cstr(item.get(field)) for field in fingerprint_fields]
+            ).encode())
+        return digest.hexdigest()
+    
+    def update_child_table(self, fieldname, df=None):
+        """Skip rewriting the item rows when validate found them unchanged"""
+        # validate only runs on save and submit, so the flag is stale for cancel and update after submit
+        if fieldname == 'items' and self._action == 'save' and self.flags.items_unchanged:
             return
-        
-        # Sum all amounts
-        self.net_total = sum(flt(item.amount, 2) for item in self.items)
-        
-        # Sum all base amounts
-        self.net_total_base = sum(flt(item.base_amount, 2) for item in self.items)
+        super().update_child_table(fieldname, df)
     
     def get_company_currency(self):
         """Get company's default currency"""
-        if self.company:
-            return frappe.db.get_value('Company', self.company, 'default_currency')
-        return None
-    # Addionnal methods to hnadle automation
-    def validate(self):
-        """Validate document before saving"""
-        try:
-            self.validate_license_dates()
-        except Exception as e:
-            frappe.log_error(
-                message=frappe.get_traceback(),
-                title=f"Renewal Tracking Validation Error - {self.name}"
-            )
-            frappe.throw(str(e))
+        return get_company_currency(self.company)
     
-    def before_save(self):
-        """Calculate renewal stage before saving"""
-        try:
-            self.calculate_renewal_stage()
-        except Exception as e:
-            frappe.log_error(
-                message=frappe.get_traceback(),
-                title=f"Renewal Tracking Before Save Error - {self.name}"
-            )
+    def on_update(self):
+        """Record the stage change made by validate"""
+        if self._action != 'save':
+            return
+        
+        doc_before_save = self.get_doc_before_save()
+        self.record_stage_change(doc_before_save.renewal_stage if doc_before_save else None, 'Save')
     
     def on_submit(self):
-        """Calculate and update renewal stage on submission"""
-        try:
-            self.calculate_renewal_stage()
-            frappe.db.set_value(
-                'Renewal Tracking',
-                self.name,
-                {
-                    'renewal_stage': self.renewal_stage,
-                    'days_remaining': self.days_remaining
-                },
-                update_modified=False
-            )
-            frappe.db.commit()
-            
-            frappe.logger().info(
-                f"Renewal stage set to '{self.renewal_stage}' on submission of {self.name}"
-            )
-        except Exception as e:
-            frappe.log_error(
-                message=frappe.get_traceback(),
-                title=f"Error calculating renewal stage on submit - {self.name}"
-            )
+        """Record the stage validate set on submission, it is already saved with the document"""
+        doc_before_save = self.get_doc_before_save()
+        self.record_stage_change(doc_before_save.renewal_stage if doc_before_save else None, 'Submit')
+        
+        frappe.logger().info(
+            f"Renewal stage set to '{self.renewal_stage}' on submission of {self.name}"
+        )
+    
+    def record_stage_change(self, old_stage, source):
+        """Append a Renewal Stage Event if the stage moved away from old_stage"""
+        record_stage_events(
+            [{
+                'name': self.name,
+                'old_stage': old_stage,
+                'new_stage': self.renewal_stage,
+                'days_remaining': self.days_remaining
+            }],
+            source
+        )
     
     def validate_license_dates(self):
         """Validate that license dates are logical"""
@@ -178,40 +250,17 @@ class RenewalTracking(Document):
         4. nowdate >= (license_end - 60 days) AND nowdate < (license_end - 30 days) → 60 Days to Expiry
         5. nowdate >= (license_end - 30 days) AND nowdate < license_end → 30 Days to Expiry
         6. nowdate >= license_end → Expired
+        
+        Also sets next_stage_transition, the first of those boundary dates
+        after nowdate (empty once Expired), used by the scheduled jobs
+        
+        The rules live in renewal_stage.classify_renewal_stages, shared with
+        the scheduled jobs and reports
         """
         try:
-            if not self.license_start or not self.license_end:
-                self.renewal_stage = None
-                self.days_remaining = None
-                return
-            
-            # Get dates
-            now_date = getdate(today())
-            license_start = getdate(self.license_start)
-            license_end = getdate(self.license_end)
-            
-            # Calculate days remaining until license end
-            days_to_end = date_diff(license_end, now_date)
-            self.days_remaining = days_to_end
-            
-            # Calculate milestone dates
-            date_90_days_before = add_days(license_end, -90)
-            date_60_days_before = add_days(license_end, -60)
-            date_30_days_before = add_days(license_end, -30)
-            
-            # Determine renewal stage based on logic
-            if now_date < license_start:
-                self.renewal_stage = "Open"
-            elif now_date >= license_end:
-                self.renewal_stage = "Expired"
-            elif now_date >= date_30_days_before:
-                self.renewal_stage = "30 Days to Expiry"
-            elif now_date >= date_60_days_before:
-                self.renewal_stage = "60 Days to Expiry"
-            elif now_date >= date_90_days_before:
-                self.renewal_stage = "90 Days to Expiry"
-            else:
-                self.renewal_stage = "Running"
+            self.renewal_stage, self.next_stage_transition, _ = get_renewal_stage(
+                self.license_start, self.license_end, today()
+            )
             
             frappe.logger().debug(
                 f"Renewal Stage calculated for {self.name}: {self.renewal_stage} "
@@ -224,413 +273,121 @@ class RenewalTracking(Document):
                 title=f"Error calculating renewal stage for {self.name}"
             )
             self.renewal_stage = None
-            self.days_remaining = None
+            self.next_stage_transition = None
             raise
 
 
-# =============================================================================
-# SCHEDULED TASKS
-# =============================================================================
+# Composite indexes for the scheduler and list view access paths
+RENEWAL_TRACKING_INDEXES = (
+    # heavy job and the first branch of the light job
+    ('docstatus', 'next_stage_transition'),
+    # second branch of the light job
+    ('docstatus', 'modified'),
+    # list view filtered on stage, sorted on modified
+    ('renewal_stage', 'modified'),
+    # default list view sort
+    ('modified',),
+    # list view sort/filter on License End (days remaining)
+    ('license_end',),
+)
 
-def update_all_renewal_stages_heavy():
-    """
-    Heavy job: Update ALL renewal tracking records (runs at 2 AM)
-    Processes all submitted (docstatus=1) documents with valid license dates
-    """
-    try:
-        frappe.logger().info("Starting HEAVY renewal stage update job at 2 AM")
-        
-        filters = {
-            'docstatus': 1,
-            'license_start': ['is', 'set'],
-            'license_end': ['is', 'set']
-        }
-        
-        renewal_docs = frappe.get_all(
-            'Renewal Tracking',
-            filters=filters,
-            pluck='name'
-        )
-        
-        total_count = len(renewal_docs)
-        success_count = 0
-        error_count = 0
-        errors = []
-        stage_changes = []
-        
-        frappe.logger().info(f"Found {total_count} submitted renewal tracking records to process")
-        
-        for idx, name in enumerate(renewal_docs, 1):
-            try:
-                doc = frappe.get_doc('Renewal Tracking', name)
-                old_stage = doc.renewal_stage
-                
-                doc.calculate_renewal_stage()
-                
-                frappe.db.set_value(
-                    'Renewal Tracking',
-                    name,
-                    {
-                        'renewal_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    },
-                    update_modified=False
-                )
-                
-                if old_stage != doc.renewal_stage:
-                    stage_changes.append({
-                        'name': name,
-                        'old_stage': old_stage,
-                        'new_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    })
-                    frappe.logger().info(
-                        f"[{idx}/{total_count}] {name}: {old_stage} → {doc.renewal_stage}"
-                    )
-                
-                success_count += 1
-                
-                if idx % 50 == 0:
-                    frappe.db.commit()
-                    frappe.logger().info(f"Progress: {idx}/{total_count} records processed")
-                
-            except Exception as e:
-                error_count += 1
-                error_msg = f"Error updating {name}: {str(e)}"
-                errors.append(error_msg)
-                frappe.log_error(
-                    message=frappe.get_traceback(),
-                    title=f"Heavy Job Error - {name}"
-                )
-                continue
-        
-        frappe.db.commit()
-        
-        summary = (
-            f"HEAVY Job Completed:\n"
-            f"Total: {total_count}\n"
-            f"Success: {success_count}\n"
-            f"Errors: {error_count}\n"
-            f"Stage Changes: {len(stage_changes)}"
-        )
-        
-        frappe.logger().info(summary)
-        
-        if stage_changes:
-            change_details = "\n".join([
-                f"{c['name']}: {c['old_stage']} → {c['new_stage']} ({c['days_remaining']} days)"
-                for c in stage_changes
-            ])
-            frappe.logger().info(f"Stage Changes:\n{change_details}")
-        
-        if errors:
-            frappe.log_error(
-                message="\n".join(errors),
-                title="Heavy Job - Failed Updates Summary"
-            )
-        
-        return {
-            'total': total_count,
-            'success': success_count,
-            'errors': error_count,
-            'stage_changes': len(stage_changes)
-        }
-        
-    except Exception as e:
-        frappe.log_error(
-            message=frappe.get_traceback(),
-            title="Heavy Renewal Stage Update Job Failed"
-        )
-        raise
 
+def on_doctype_update():
+    """Add the composite indexes in RENEWAL_TRACKING_INDEXES"""
+    existing = {}
+    for index in frappe.db.sql("SHOW INDEX FROM `tabRenewal Tracking`", as_dict=True):
+        existing.setdefault(index.Key_name, []).append(index.Column_name)
+    
+    for fields in RENEWAL_TRACKING_INDEXES:
+        # skip when an index (e.g. a framework one) already leads with these columns
+        if any(tuple(columns[:len(fields)]) == fields for columns in existing.values()):
+            continue
+        frappe.db.add_index('Renewal Tracking', list(fields), '_'.join(fields) + '_index')
 
-def update_all_renewal_stages_light():
+
+# Import errors listed in the message, the rest are only counted
+MAX_IMPORT_ERRORS_SHOWN = 100
+
+
+@frappe.whitelist()
+def import_items(file_url, parent_doc):
     """
-    Light job: Update only recently modified or critical renewal tracking records (runs at 2 PM)
-    Focuses on submitted documents (docstatus=1) that are:
-    1. Modified today
-    2. In critical stages (30/60/90 days, Expired)
-    3. With license_end within next 120 days
+    Import items from uploaded CSV/Excel file in one response, for files of
+    up to IMPORT_PAGE_LENGTH rows. Larger files go through import_items_page
+    or the background item import
     """
+    file_path = get_file_path(file_url)
+    
     try:
-        frappe.logger().info("Starting LIGHT renewal stage update job at 2 PM")
-        
-        now_date = today()
-        critical_date = add_days(now_date, 120)
-        
-        filters = [
-            ['Renewal Tracking', 'docstatus', '=', 1],
-            ['Renewal Tracking', 'license_start', 'is', 'set'],
-            ['Renewal Tracking', 'license_end', 'is', 'set'],
-        ]
-        
-        or_filters = [
-            ['Renewal Tracking', 'modified', '>=', now_date],
-            ['Renewal Tracking', 'license_end', '<=', critical_date],
-            ['Renewal Tracking', 'renewal_stage', 'in', [
-                '30 Days to Expiry',
-                '60 Days to Expiry', 
-                '90 Days to Expiry',
-                'Expired'
-            ]]
-        ]
-        
-        renewal_docs = frappe.get_all(
-            'Renewal Tracking',
-            filters=filters,
-            or_filters=or_filters,
-            pluck='name'
-        )
-        
-        renewal_docs = list(set(renewal_docs))
-        
-        total_count = len(renewal_docs)
-        success_count = 0
-        error_count = 0
-        stage_changes = []
-        
-        frappe.logger().info(f"Found {total_count} critical submitted renewal records to process")
-        
-        for idx, name in enumerate(renewal_docs, 1):
-            try:
-                doc = frappe.get_doc('Renewal Tracking', name)
-                old_stage = doc.renewal_stage
-                
-                doc.calculate_renewal_stage()
-                
-                frappe.db.set_value(
-                    'Renewal Tracking',
-                    name,
-                    {
-                        'renewal_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    },
-                    update_modified=False
-                )
-                
-                if old_stage != doc.renewal_stage:
-                    stage_changes.append({
-                        'name': name,
-                        'old_stage': old_stage,
-                        'new_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    })
-                    frappe.logger().info(
-                        f"[{idx}/{total_count}] {name}: {old_stage} → {doc.renewal_stage}"
-                    )
-                
-                success_count += 1
-                
-                if idx % 20 == 0:
-                    frappe.db.commit()
-                
-            except Exception as e:
-                error_count += 1
-                frappe.log_error(
-                    message=frappe.get_traceback(),
-                    title=f"Light Job Error - {name}"
-                )
-                continue
-        
-        frappe.db.commit()
-        
-        summary = (
-            f"LIGHT Job Completed:\n"
-            f"Total: {total_count}\n"
-            f"Success: {success_count}\n"
-            f"Errors: {error_count}\n"
-            f"Stage Changes: {len(stage_changes)}"
-        )
-        
-        frappe.logger().info(summary)
-        
-        if stage_changes:
-            change_summary = "\n".join([
-                f"{c['name']}: {c['old_stage']} → {c['new_stage']} ({c['days_remaining']} days)"
-                for c in stage_changes
-            ])
-            frappe.logger().info(f"Stage Changes:\n{change_summary}")
-        
-        return {
-            'total': total_count,
-            'success': success_count,
-            'errors': error_count,
-            'stage_changes': len(stage_changes)
-        }
-        
+        # Streamed row by row, reading stops one row past the limit, see item_import
+        reader = iter_import_items(file_path, is_csv(file_url))
+        try:
+            rows = list(islice(reader, IMPORT_PAGE_LENGTH + 1))
+        finally:
+            reader.close()
     except Exception as e:
-        frappe.log_error(
-            message=frappe.get_traceback(),
-            title="Light Renewal Stage Update Job Failed"
+        frappe.throw(f'Error reading file: {str(e)}')
+    
+    if len(rows) > IMPORT_PAGE_LENGTH:
+        frappe.throw(
+            f'The file has more than {IMPORT_PAGE_LENGTH} items, '
+            'import it from the form, which reads it a page at a time'
         )
-        raise
+    
+    items, errors = resolve_item_masters(rows)
+    if errors:
+        throw_import_errors(errors)
+    
+    return items
+
+
+def throw_import_errors(errors):
+    """Report every failed row of an import in one message"""
+    messages = [f"Row {error['row']}: {error['message']}" for error in errors[:MAX_IMPORT_ERRORS_SHOWN]]
+    if len(errors) > MAX_IMPORT_ERRORS_SHOWN:
+        messages.append(f"... and {len(errors) - MAX_IMPORT_ERRORS_SHOWN} more")
+    frappe.throw(messages, title=f"{len(errors)} rows could not be imported", as_list=True)
+
 
 @frappe.whitelist()
-def import_items(file_url, parent_doc):
-    """Import items from uploaded CSV/Excel file"""
-    import csv
-    import openpyxl
-    from frappe.utils.file_manager import get_file_path
+def import_items_page(file_url, start=0, page_length=IMPORT_PAGE_LENGTH):
+    """
+    One page of items from an uploaded CSV/Excel file, so large files are
+    read in bounded chunks instead of one response holding every row
     
-    # Get the file path
-    file_path = get_file_path(file_url)
+    Rows that do not match the Item, Brand, Item Group or UOM masters are
+    left out and listed in errors
     
-    items = []
+    Returns {"items": [...], "errors": [...], "next_start": start of the next page, None after the last one}
+    """
+    file_path = get_file_path(file_url)
     
     try:
-        # Determine file type and read accordingly
-        if file_url.endswith('.csv'):
-            # Read CSV file
-            with open(file_path, 'r', encoding='utf-8-sig') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if row.get('Item Code'):  # Skip empty rows
-                        items.append({
-                            'item_code': row.get('Item Code', ''),
-                            'item_name': row.get('Item Name', ''),
-                            'description': row.get('Description', ''),
-                            'brand': row.get('Brand', ''),
-                            'item_group': row.get('Item Group', ''),
-                            'oum': row.get('UOM', ''),
-                            'qty': flt(row.get('Qty', 0)),
-                            'rate': flt(row.get('Rate', 0)),
-                        })
-        else:
-            # Read Excel file
-            workbook = openpyxl.load_workbook(file_path)
-            sheet = workbook.active
-            
-            # Get headers from first row
-            headers = [cell.value for cell in sheet[1]]
-            
-            # Read data rows
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if row[0]:  # Skip empty rows (check if Item Code exists)
-                    item_data = dict(zip(headers, row))
-                    items.append({
-                        'item_code': item_data.get('Item Code', ''),
-                        'item_name': item_data.get('Item Name', ''),
-                        'description': item_data.get('Description', ''),
-                        'brand': item_data.get('Brand', ''),
-                        'item_group': item_data.get('Item Group', ''),
-                        'oum': item_data.get('UOM', ''),
-                        'qty': flt(item_data.get('Qty', 0)),
-                        'rate': flt(item_data.get('Rate', 0)),
-                    })
+        # the client asks for the page length, the server bounds it
+        page_length = min(cint(page_length) or IMPORT_PAGE_LENGTH, IMPORT_PAGE_LENGTH)
+        return read_import_page(file_path, is_csv(file_url), cint(start), page_length)
     except Exception as e:
         frappe.throw(f'Error reading file: {str(e)}')
-    
-    return items
 
 
 @frappe.whitelist()
 def make_request_for_quotation(source_name, target_doc=None):
     """Create Request for Quotation from Renewal Tracking"""
-    from frappe.model.mapper import get_mapped_doc
-    
-    def set_missing_values(source, target):
-        target.transaction_date = frappe.utils.nowdate()
-        target.status = "Draft"
-    
-    def update_item(source, target, source_parent):
-        target.schedule_date = frappe.utils.add_days(frappe.utils.nowdate(), 7)
-    
-    doclist = get_mapped_doc("Renewal Tracking", source_name, {
-        "Renewal Tracking": {
-            "doctype": "Request for Quotation",
-            "field_map": {
-                "name": "renewal_tracking",
-                "company": "company"
-            }
-        },
-        "Renewal Tracking Item": {
-            "doctype": "Request for Quotation Item",
-            "field_map": {
-                "item_code": "item_code",
-                "item_name": "item_name",
-                "description": "description",
-                "qty": "qty",
-                "oum": "uom",
-                "brand": "brand"
-            },
-            "postprocess": update_item
-        }
-    }, target_doc, set_missing_values)
-    
-    return doclist
+    return map_renewal(source_name, 'Request for Quotation', target_doc)
 
 
 @frappe.whitelist()
 def make_supplier_quotation(source_name, target_doc=None):
     """Create Supplier Quotation from Renewal Tracking"""
-    from frappe.model.mapper import get_mapped_doc
-    
-    def set_missing_values(source, target):
-        target.transaction_date = frappe.utils.nowdate()
-    
-    doclist = get_mapped_doc("Renewal Tracking", source_name, {
-        "Renewal Tracking": {
-            "doctype": "Supplier Quotation",
-            "field_map": {
-                "name": "renewal_tracking",
-                "company": "company",
-                "currency": "currency",
-                "exchange_rate": "conversion_rate"
-            }
-        },
-        "Renewal Tracking Item": {
-            "doctype": "Supplier Quotation Item",
-            "field_map": {
-                "item_code": "item_code",
-                "item_name": "item_name",
-                "description": "description",
-                "qty": "qty",
-                "oum": "uom",
-                "rate": "rate",
-                "amount": "amount",
-                "brand": "brand"
-            }
-        }
-    }, target_doc, set_missing_values)
-    
-    return doclist
+    return map_renewal(source_name, 'Supplier Quotation', target_doc)
 
 
 @frappe.whitelist()
 def make_quotation(source_name, target_doc=None):
     """Create Customer Quotation from Renewal Tracking"""
-    from frappe.model.mapper import get_mapped_doc
-    
-    def set_missing_values(source, target):
-        target.transaction_date = frappe.utils.nowdate()
-        target.valid_till = frappe.utils.add_days(frappe.utils.nowdate(), 30)
-    
-    doclist = get_mapped_doc("Renewal Tracking", source_name, {
-        "Renewal Tracking": {
-            "doctype": "Quotation",
-            "field_map": {
-                "name": "renewal_tracking",
-                "company": "company",
-                "currency": "currency",
-                "exchange_rate": "conversion_rate"
-            }
-        },
-        "Renewal Tracking Item": {
-            "doctype": "Quotation Item",
-            "field_map": {
-                "item_code": "item_code",
-                "item_name": "item_name",
-                "description": "description",
-                "qty": "qty",
-                "oum": "uom",
-                "rate": "rate",
-                "amount": "amount",
-                "brand": "brand"
-            }
-        }
-    }, target_doc, set_missing_values)
-    
-    return doclist
+    return map_renewal(source_name, 'Quotation', target_doc)
+
+
 #whitelist for automation 
 @frappe.whitelist()
 def update_single_renewal_stage(docname: str) -> dict:
@@ -647,22 +404,43 @@ def update_single_renewal_stage(docname: str) -> dict:
         if not frappe.has_permission('Renewal Tracking', 'write', docname):
             frappe.throw("Insufficient permissions to update this document")
         
-        doc = frappe.get_doc('Renewal Tracking', docname)
-        old_stage = doc.renewal_stage
-        
-        doc.calculate_renewal_stage()
+        # Only one manual update of the document at a time, the scheduled jobs
+        # never wait for it nor it for them
+        lock = LeaseLock(f'{SINGLE_UPDATE_LOCK}|{docname}', ttl=60)
+        if not lock.acquire(wait=SINGLE_UPDATE_LOCK_WAIT):
+            return {
+                'success': False,
+                'error': 'The stage of this renewal is already being updated, please try again in a moment'
+            }
         
-        # Update directly in database to avoid triggering workflows
-        frappe.db.set_value(
-            'Renewal Tracking',
-            docname,
-            {
-                'renewal_stage': doc.renewal_stage,
-                'days_remaining': doc.days_remaining
-            },
-            update_modified=False
-        )
-        frappe.db.commit()
+        try:
+            # The row lock waits out a scheduled job's page holding this row,
+            # and reads the stage that page committed
+            old_stage, old_transition = frappe.db.get_value(
+                'Renewal Tracking', docname, ['renewal_stage', 'next_stage_transition'], for_update=True
+            )
+            doc = frappe.get_doc('Renewal Tracking', docname)
+            
+            doc.calculate_renewal_stage()
+            
+            # Update directly in database to avoid triggering workflows,
+            # and only when the stage actually moved
+            if (old_stage, getdate(old_transition) if old_transition else None) != (
+                doc.renewal_stage, doc.next_stage_transition
+            ):
+                frappe.db.set_value(
+                    'Renewal Tracking',
+                    docname,
+                    {
+                        'renewal_stage': doc.renewal_stage,
+                        'next_stage_transition': doc.next_stage_transition
+                    },
+                    update_modified=False
+                )
+                doc.record_stage_change(old_stage, 'Manual')
+                frappe.db.commit()
+        finally:
+            lock.release()
         
         return {
             'success': True,
@@ -686,222 +464,812 @@ def update_single_renewal_stage(docname: str) -> dict:
 # SCHEDULED TASKS
 # =============================================================================
 
-def update_all_renewal_stages_heavy():
+# Number of documents fetched per page and recomputed by a single bulk UPDATE
+HEAVY_JOB_CHUNK_SIZE = 1000
+LIGHT_JOB_CHUNK_SIZE = 200
+
+# Heavy job sharding defaults, overridable from site_config.json with
+# renewal_stage_shard_size and renewal_stage_max_parallel_shards
+HEAVY_JOB_SHARD_SIZE = 5000
+HEAVY_JOB_MAX_PARALLEL_SHARDS = 4
+# Seconds the coordination keys and checkpoints of a heavy run are kept in Redis
+HEAVY_JOB_RUN_EXPIRY = 24 * 60 * 60
+# Attempts per shard before it reports in with an error, each retry
+# resumes from the shard's last checkpoint
+HEAVY_JOB_MAX_SHARD_ATTEMPTS = 3
+# Seconds without a checkpoint after which a re-run treats a started shard as dead
+HEAVY_JOB_SHARD_STALE_AFTER = 10 * 60
+
+# Lease lock shared by the heavy job and the light job
+RENEWAL_STAGE_LOCK = 'renewal_stage_jobs'
+# Lease length, renewed after every page, so it only lapses when a job stops making progress
+RENEWAL_STAGE_LOCK_TTL = 15 * 60
+# Lease length of a heavy run. Shards waiting on the long queue cannot renew it, so it
+# lasts as long as the run's keys and the last shard releases it. A heavy job of a
+# later day takes it over from a run that never finished, see take_over_heavy_run_lock
+HEAVY_RUN_LOCK_TTL = HEAVY_JOB_RUN_EXPIRY
+# Key holding [run_id, as_of] of the heavy run that holds the lease
+HEAVY_RUN_HOLDER_KEY = 'renewal_stage_heavy_run_holder'
+# What a scheduled job does when the lock is held: skip, wait or handoff.
+# Overridable from site_config.json with renewal_stage_lock_policy and
+# renewal_stage_lock_wait (seconds to wait before skipping)
+RENEWAL_STAGE_LOCK_POLICY = 'wait'
+RENEWAL_STAGE_LOCK_WAIT = 5 * 60
+# Per document lease of update_single_renewal_stage, named SINGLE_UPDATE_LOCK|<docname>.
+# Row locks keep it consistent with the scheduled jobs, so it does not take RENEWAL_STAGE_LOCK
+SINGLE_UPDATE_LOCK = 'renewal_stage_manual'
+# Seconds update_single_renewal_stage waits for another update of the same document
+SINGLE_UPDATE_LOCK_WAIT = 10
+
+HEAVY_JOB_METHOD = 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.update_all_renewal_stages_heavy'
+LIGHT_JOB_METHOD = 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.update_all_renewal_stages_light'
+
+# Columns every stage computation needs, as yielded by iter_renewal_tracking_pages
+RENEWAL_STAGE_COLUMNS = "name, renewal_stage, next_stage_transition, license_start, license_end"
+
+
+def get_renewal_page_query(conditions):
+    """Keyset page query over Renewal Tracking for a WHERE fragment"""
+    return f"""
+        SELECT {RENEWAL_STAGE_COLUMNS}
+        FROM `tabRenewal Tracking`
+        WHERE name > %(start_after)s
+            AND ({conditions})
+        ORDER BY name
+        LIMIT %(page_size)s
     """
-    Heavy job: Update ALL renewal tracking records (runs at 2 AM)
-    Processes all submitted (docstatus=1) documents with valid license dates
+
+
+def iter_renewal_tracking_pages(conditions, values=None, page_size=1000, start_after='', end_at=None, page_query=None):
     """
-    try:
-        frappe.logger().info("Starting HEAVY renewal stage update job at 2 AM")
+    Stream Renewal Tracking rows (name, dates, current stage) matching the
+    SQL conditions in fixed-size pages ordered by name
+
+    Each page is fetched with keyset pagination (name > last name seen)
+    rather than OFFSET or a materialised list of names, so memory stays at
+    one page whatever the table size. Rows inserted behind the cursor are
+    skipped and rows ahead of it are picked up, but no row is seen twice
+    or skipped because of concurrent writes. end_at bounds the range
+    (inclusive) for sharded runs
+    
+    page_query replaces the query built from conditions, for shapes that
+    need the keyset condition elsewhere (LIGHT_JOB_PAGE_QUERY). It takes
+    %(start_after)s and %(page_size)s, end_at does not apply to it
+    """
+    values = dict(values or {})
+    if end_at:
+        conditions = f"({conditions}) AND name <= %(end_at)s"
+        values['end_at'] = end_at
+    query = page_query or get_renewal_page_query(conditions)
+    
+    while True:
+        values.update(start_after=start_after, page_size=page_size)
+        page = frappe.db.sql(query, values, as_dict=True)
+        if not page:
+            return
         
-        # Get all SUBMITTED renewal tracking documents
-        filters = {
-            'docstatus': 1,  # Only submitted documents
-            'license_start': ['is', 'set'],
-            'license_end': ['is', 'set']
-        }
+        yield page
         
-        renewal_docs = frappe.get_all(
-            'Renewal Tracking',
-            filters=filters,
-            pluck='name'
+        if len(page) < page_size:
+            return
+        start_after = page[-1].name
+
+
+def write_renewal_stages(rows, as_of=None, metrics=None):
+    """
+    Classify rows (name, renewal_stage, next_stage_transition, license_start,
+    license_end) and write the ones whose stage or transition date moved
+    with a single UPDATE ... CASE statement
+
+    Time spent and rows written are added to metrics (a JobRunMetrics) when given
+
+    Returns list of dicts (name, old_stage, new_stage, days_remaining)
+    """
+    metrics = metrics or JobRunMetrics()
+
+    with metrics.phase('compute'):
+        batch = classify_renewal_stages(
+            [row.license_start for row in rows],
+            [row.license_end for row in rows],
+            as_of
+        )
+        stages = get_stage_labels(batch.codes)
+        transitions = get_transition_dates(batch.next_transition)
+
+        results = []
+        changed = []
+        for row, stage, transition, days_remaining in zip(
+            rows, stages, transitions, batch.days_remaining.tolist()
+        ):
+            results.append(frappe._dict(
+                name=row.name,
+                old_stage=row.renewal_stage,
+                new_stage=stage,
+                days_remaining=days_remaining
+            ))
+            old_transition = getdate(row.next_stage_transition) if row.next_stage_transition else None
+            if (row.renewal_stage, old_transition) != (stage, transition):
+                changed.append((row.name, stage, transition))
+
+    if not changed:
+        return results
+
+    with metrics.phase('write'):
+        stage_cases = " ".join(["WHEN %s THEN %s"] * len(changed))
+        transition_cases = " ".join(["WHEN %s THEN %s"] * len(changed))
+        placeholders = ", ".join(["%s"] * len(changed))
+
+        values = []
+        for name, stage, _ in changed:
+            values.extend((name, stage))
+        for name, _, transition in changed:
+            values.extend((name, transition))
+        values.extend(name for name, _, _ in changed)
+
+        frappe.db.sql(
+            f"""
+            UPDATE `tabRenewal Tracking`
+            SET
+                renewal_stage = CASE name {stage_cases} END,
+                next_stage_transition = CASE name {transition_cases} END
+            WHERE name IN ({placeholders})
+            """,
+            values
+        )
+
+    metrics.rows_written += len(changed)
+
+    return results
+
+
+# Submitted documents whose stage boundary has been reached by %(as_of)s
+DUE_RENEWAL_CONDITIONS = """
+    docstatus = 1
+    AND next_stage_transition <= %(as_of)s
+    AND license_start IS NOT NULL
+    AND license_end IS NOT NULL
+"""
+
+
+# Submitted documents due for a transition OR modified today, written as a
+# UNION of two subqueries so each branch is served by its own
+# (docstatus, ...) index instead of one OR that scans the table.
+# UNION also removes duplicates
+LIGHT_JOB_CANDIDATES_SQL = """
+    (
+        SELECT name FROM `tabRenewal Tracking`
+        WHERE docstatus = 1
+            AND next_stage_transition <= %(as_of)s
+            AND license_start IS NOT NULL
+            AND license_end IS NOT NULL
+            AND name > %(start_after)s
+        ORDER BY name
+        LIMIT %(page_size)s
+    )
+    UNION
+    (
+        SELECT name FROM `tabRenewal Tracking`
+        WHERE docstatus = 1
+            AND modified >= %(as_of)s
+            AND license_start IS NOT NULL
+            AND license_end IS NOT NULL
+            AND name > %(start_after)s
+        ORDER BY name
+        LIMIT %(page_size)s
+    )
+"""
+
+
+# Page query of the light job. The keyset condition and limit sit inside
+# each UNION branch, so a page reads at most page_size candidates per
+# branch from the range of its index, and the rows are then joined in by
+# primary key. Wrapping the whole UNION in name IN (...) instead would
+# materialise every candidate again on every page
+LIGHT_JOB_PAGE_QUERY = f"""
+    SELECT rt.name, rt.renewal_stage, rt.next_stage_transition, rt.license_start, rt.license_end
+    FROM ({LIGHT_JOB_CANDIDATES_SQL}) AS candidates
+    INNER JOIN `tabRenewal Tracking` rt ON rt.name = candidates.name
+    ORDER BY rt.name
+    LIMIT %(page_size)s
+"""
+
+
+def update_renewal_stages_in_pages(pages, as_of, job_label, metrics=None, on_page=None):
+    """
+    Run write_renewal_stages over a stream of row pages, committing after every page.
+    Stage changes are appended to Renewal Stage Event with job_label
+    (Heavy or Light) as their source
+
+    Counters and fetch/compute/write timings are accumulated on metrics
+    (a JobRunMetrics) page by page. on_page(last_name, errors) is called
+    once a page is committed or rolled back, e.g. to checkpoint progress
+
+    Returns (total_count, success_count, error_count, errors, stage_changes)
+    """
+    metrics = metrics or JobRunMetrics()
+    total_count = 0
+    success_count = 0
+    error_count = 0
+    errors = []
+    stage_changes = []
+
+    pages = iter(pages)
+    while True:
+        # Fetching happens lazily inside the page generator
+        with metrics.phase('fetch'):
+            page = next(pages, None)
+        if page is None:
+            break
+
+        total_count += len(page)
+        metrics.rows_scanned += len(page)
+
+        try:
+            rows = write_renewal_stages(page, as_of, metrics)
+
+            # One multi-row INSERT per page, in the same transaction as the UPDATE,
+            # then commit every page to prevent long transactions
+            with metrics.phase('write'):
+                record_stage_events(rows, job_label, as_of)
+                frappe.db.commit()
+            metrics.commit_count += 1
+        except Exception as e:
+            frappe.db.rollback()
+            error_count += len(page)
+            metrics.errors += len(page)
+            errors.append(f"Error updating {page[0].name} to {page[-1].name}: {str(e)}")
+            frappe.log_error(
+                message=frappe.get_traceback(),
+                title=f"{job_label} Job Error - {page[0].name} to {page[-1].name}"
+            )
+        else:
+            success_count += len(rows)
+
+            # Track stage changes
+            page_changes = [row for row in rows if row.old_stage != row.new_stage]
+            stage_changes.extend(page_changes)
+            metrics.stage_changes += len(page_changes)
+
+            frappe.logger().info(f"Progress: {total_count} records processed")
+
+        if on_page:
+            on_page(page[-1].name, errors)
+
+    return total_count, success_count, error_count, errors, stage_changes
+
+
+def get_heavy_job_settings():
+    """(shard_size, max_parallel_shards) from site config, falling back to the defaults"""
+    return (
+        cint(frappe.conf.get('renewal_stage_shard_size')) or HEAVY_JOB_SHARD_SIZE,
+        cint(frappe.conf.get('renewal_stage_max_parallel_shards')) or HEAVY_JOB_MAX_PARALLEL_SHARDS
+    )
+
+
+def get_renewal_lock_settings():
+    """(policy, wait seconds) for the scheduled jobs from site config, falling back to the defaults"""
+    return (
+        frappe.conf.get('renewal_stage_lock_policy') or RENEWAL_STAGE_LOCK_POLICY,
+        cint(frappe.conf.get('renewal_stage_lock_wait') or RENEWAL_STAGE_LOCK_WAIT)
+    )
+
+
+def acquire_renewal_stage_lock(job_type, as_of, handoff_method):
+    """
+    Take the renewal stage lock for a scheduled job following the configured policy
+
+    Returns (lock, None) when acquired, else (None, summary of the skipped
+    or handed off run, which is recorded in the Renewal Job Run ledger)
+    """
+    policy, wait = get_renewal_lock_settings()
+    lock = LeaseLock(RENEWAL_STAGE_LOCK, ttl=RENEWAL_STAGE_LOCK_TTL)
+    outcome = acquire_with_policy(lock, policy, wait, handoff_method=handoff_method)
+    if outcome == 'acquired':
+        return lock, None
+    
+    job_run = start_job_run(
+        job_type, as_of, shards=0, lock_wait_time=lock.wait_time, status=outcome.title()
+    )
+    frappe.logger().info(
+        f"{job_type} renewal stage job {outcome}: lock held by another run "
+        f"(policy {policy}, waited {lock.wait_time:.1f}s)"
+    )
+    return None, {
+        'total': 0,
+        'success': 0,
+        'errors': 0,
+        'stage_changes': 0,
+        'job_run': job_run,
+        'lock': outcome
+    }
+
+
+def get_heavy_run_lock(run_id):
+    """The lease held on behalf of a heavy run, shared by all of its shards"""
+    return LeaseLock(
+        RENEWAL_STAGE_LOCK,
+        ttl=HEAVY_RUN_LOCK_TTL,
+        token=frappe.cache.get_value(get_heavy_run_key(run_id, 'lock_token'))
+    )
+
+
+def take_over_heavy_run_lock(as_of):
+    """
+    The lease of the unfinished heavy run still holding the renewal stage
+    lock, for a heavy job started meanwhile. A run of the same as-of date
+    is resumed under it. A run of an earlier date is closed as Failed and
+    its lease released: its shards stop at their next checkpoint and the
+    rows they left are due again. Returns None when no heavy run holds it
+    """
+    holder = frappe.cache.get_value(HEAVY_RUN_HOLDER_KEY)
+    if not holder:
+        return None
+    
+    run_id, run_as_of = holder
+    lock = get_heavy_run_lock(run_id)
+    if lock.holder() != lock.token:
+        return None
+    if getdate(run_as_of) == as_of:
+        return lock
+    
+    frappe.cache.delete_value(HEAVY_RUN_HOLDER_KEY)
+    frappe.cache.delete_value(get_heavy_date_key(run_as_of))
+    frappe.db.set_value(
+        'Renewal Job Run',
+        run_id,
+        {
+            'status': 'Failed',
+            'ended_at': now_datetime(),
+            'error_details': f'Not finished when the heavy job of {as_of} started'
+        }
+    )
+    frappe.db.commit()
+    lock.release()
+    frappe.logger().warning(f"Heavy run {run_id} of {run_as_of} never finished, taken over on {as_of}")
+    return None
+
+
+def get_renewal_stage_shards(as_of, shard_size):
+    """
+    Split the documents due on as_of into name ranges of at most shard_size
+    rows, using keyset pagination on name
+
+    Returns list of (start_after, end_at) tuples, end_at is None for the last range
+    """
+    shards = []
+    start_after = ''
+    
+    while True:
+        end_at = frappe.db.sql(
+            f"""
+            SELECT name FROM `tabRenewal Tracking`
+            WHERE name > %(start_after)s
+                AND ({DUE_RENEWAL_CONDITIONS})
+            ORDER BY name
+            LIMIT 1 OFFSET %(offset)s
+            """,
+            {'as_of': as_of, 'start_after': start_after, 'offset': shard_size - 1}
         )
+        if not end_at:
+            shards.append((start_after, None))
+            return shards
         
-        total_count = len(renewal_docs)
-        success_count = 0
-        error_count = 0
-        errors = []
-        stage_changes = []
+        shards.append((start_after, end_at[0][0]))
+        start_after = end_at[0][0]
+
+
+def run_renewal_stage_shard(as_of, start_after, end_at=None, run_id=None):
+    """
+    Recompute the due documents with start_after < name <= end_at
+
+    When run_id is set this runs as one shard of a coordinated heavy run.
+    Progress (last committed name plus partial counters) is checkpointed
+    after every page, so a retry or a re-run of the heavy job on the same
+    as-of date resumes where the last attempt stopped. On failure the
+    shard is retried up to HEAVY_JOB_MAX_SHARD_ATTEMPTS times. The result
+    is stored for the coordinator, the next pending shard is enqueued and
+    the shard that finishes the run adds the run summary under 'summary'
+    """
+    as_of = getdate(as_of)
+    checkpoint = None
+    if run_id:
+        done = frappe.cache.hget(get_heavy_run_key(run_id, 'results'), start_after)
+        if done:
+            # Already reported in, e.g. enqueued again by a resumed run
+            return done
+        checkpoint = get_shard_checkpoint(run_id, start_after)
+    
+    checkpoint = checkpoint or {'last_name': start_after, 'metrics': {}, 'error_messages': [], 'attempts': 0}
+    checkpoint['attempts'] += 1
+    metrics = JobRunMetrics(**checkpoint['metrics'])
+    previous_errors = checkpoint['error_messages']
+    lock = get_heavy_run_lock(run_id) if run_id else None
+    
+    def save_checkpoint(last_name=None, errors=()):
+        checkpoint.update(
+            last_name=last_name or checkpoint['last_name'],
+            metrics=metrics.as_dict(),
+            error_messages=previous_errors + list(errors)
+        )
+        set_shard_checkpoint(run_id, start_after, checkpoint)
         
-        frappe.logger().info(f"Found {total_count} submitted renewal tracking records to process")
-        
-        for idx, name in enumerate(renewal_docs, 1):
-            try:
-                doc = frappe.get_doc('Renewal Tracking', name)
-                old_stage = doc.renewal_stage
-                
-                # Calculate new stage
-                doc.calculate_renewal_stage()
-                
-                # Update database directly without affecting docstatus
-                frappe.db.set_value(
-                    'Renewal Tracking',
-                    name,
-                    {
-                        'renewal_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    },
-                    update_modified=False  # Don't update modified timestamp
-                )
-                
-                # Track stage changes
-                if old_stage != doc.renewal_stage:
-                    stage_changes.append({
-                        'name': name,
-                        'old_stage': old_stage,
-                        'new_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    })
-                    frappe.logger().info(
-                        f"[{idx}/{total_count}] {name}: {old_stage} → {doc.renewal_stage}"
-                    )
-                
-                success_count += 1
-                
-                # Commit every 50 records to prevent long transactions
-                if idx % 50 == 0:
-                    frappe.db.commit()
-                    frappe.logger().info(f"Progress: {idx}/{total_count} records processed")
-                
-            except Exception as e:
-                error_count += 1
-                error_msg = f"Error updating {name}: {str(e)}"
-                errors.append(error_msg)
-                frappe.log_error(
-                    message=frappe.get_traceback(),
-                    title=f"Heavy Job Error - {name}"
+        # Heartbeat for the run's lease. Without it another pass may be writing
+        # the same rows, so stop here, the checkpoint is kept for a resume
+        if not lock.renew():
+            raise LeaseLostError(f"Heavy run {run_id}: renewal stage lock lease lost")
+    
+    try:
+        if run_id:
+            # Mark the attempt as alive before the first page
+            save_checkpoint()
+            if checkpoint['last_name'] != start_after:
+                frappe.logger().info(
+                    f"Heavy run {run_id}: resuming shard {start_after} to {end_at} "
+                    f"after {checkpoint['last_name']} (attempt {checkpoint['attempts']})"
                 )
-                continue
         
-        # Final commit
-        frappe.db.commit()
+        pages = iter_renewal_tracking_pages(
+            DUE_RENEWAL_CONDITIONS,
+            {'as_of': as_of},
+            page_size=HEAVY_JOB_CHUNK_SIZE,
+            start_after=checkpoint['last_name'],
+            end_at=end_at
+        )
         
-        # Summary logging
-        summary = (
-            f"HEAVY Job Completed:\n"
-            f"Total: {total_count}\n"
-            f"Success: {success_count}\n"
-            f"Errors: {error_count}\n"
-            f"Stage Changes: {len(stage_changes)}"
+        _, _, _, errors, stage_changes = update_renewal_stages_in_pages(
+            pages, as_of, "Heavy", metrics, on_page=save_checkpoint if run_id else None
         )
+        error_messages = previous_errors + errors
+        stage_changes = [dict(c) for c in stage_changes]
+    except LeaseLostError as e:
+        # Neither retried nor reported in, the shard is left to a resume of the run
+        frappe.db.rollback()
+        frappe.logger().warning(f"{e}, stopping shard {start_after} to {end_at} at {checkpoint['last_name']}")
+        return {'lease_lost': True, 'attempts': checkpoint['attempts']}
+    except Exception as e:
+        if not run_id:
+            raise
         
-        frappe.logger().info(summary)
+        frappe.db.rollback()
+        frappe.log_error(
+            message=frappe.get_traceback(),
+            title=f"Heavy Job Shard Failed - {start_after} to {end_at}"
+        )
         
-        if stage_changes:
-            change_details = "\n".join([
-                f"{c['name']}: {c['old_stage']} → {c['new_stage']} ({c['days_remaining']} days)"
-                for c in stage_changes
-            ])
-            frappe.logger().info(f"Stage Changes:\n{change_details}")
+        if checkpoint['attempts'] < HEAVY_JOB_MAX_SHARD_ATTEMPTS:
+            # Committed pages are kept, the retry resumes after the last one
+            enqueue_renewal_stage_shard(run_id, as_of, start_after, end_at, attempt=checkpoint['attempts'] + 1)
+            return {'retrying': True, 'attempts': checkpoint['attempts']}
         
-        if errors:
-            frappe.log_error(
-                message="\n".join(errors),
-                title="Heavy Job - Failed Updates Summary"
-            )
+        # Still report in, or the run would never be summarized
+        error_messages = checkpoint['error_messages'] + [
+            f"Shard {start_after} to {end_at} failed after {checkpoint['attempts']} attempts: {str(e)}"
+        ]
+        stage_changes = []
+    
+    result = {
+        'total': metrics.rows_scanned,
+        'success': metrics.rows_scanned - metrics.errors,
+        'errors': metrics.errors,
+        'error_messages': error_messages,
+        'stage_changes': stage_changes,
+        'metrics': metrics.as_dict()
+    }
+    
+    if run_id:
+        result['summary'] = report_renewal_stage_shard(run_id, as_of, start_after, result)
+    
+    return result
+
+
+def report_renewal_stage_shard(run_id, as_of, start_after, result):
+    """
+    Store a finished shard's result and enqueue the next pending shard.
+    The last shard to report in summarizes the run, clears its keys,
+    queues the day's milestone quotations and returns the summary
+    """
+    cache = frappe.cache
+    results_key = cache.make_key(get_heavy_run_key(run_id, 'results'))
+    finished_key = cache.make_key(get_heavy_run_key(run_id, 'finished'))
+    
+    cache.hset(get_heavy_run_key(run_id, 'results'), start_after, result)
+    cache.expire(results_key, HEAVY_JOB_RUN_EXPIRY)
+    enqueue_next_renewal_stage_shard(run_id, as_of)
+    
+    # Only the last shard to finish sees the final count
+    finished = cache.incr(finished_key)
+    cache.expire(finished_key, HEAVY_JOB_RUN_EXPIRY)
+    if finished != cache.get_value(get_heavy_run_key(run_id, 'shards')):
+        return None
+    
+    results = list(cache.hgetall(get_heavy_run_key(run_id, 'results')).values())
+    lock = get_heavy_run_lock(run_id)
+    for key in ('results', 'finished', 'shards', 'shard_list', 'pending', 'checkpoints', 'lock_token'):
+        cache.delete_value(get_heavy_run_key(run_id, key))
+    cache.delete_value(get_heavy_date_key(as_of))
+    if (cache.get_value(HEAVY_RUN_HOLDER_KEY) or [None])[0] == run_id:
+        cache.delete_value(HEAVY_RUN_HOLDER_KEY)
+    
+    summary = summarize_heavy_job(results, job_run=run_id)
+    lock.release()
+    
+    # Stages are settled for the day, draft the quotations of renewals that reached the milestone
+    enqueue_milestone_quotations(as_of)
+    return summary
+
+
+def get_heavy_run_key(run_id, key):
+    return f'renewal_stage_heavy_run|{run_id}|{key}'
+
+
+def get_heavy_date_key(as_of):
+    """Key holding the run_id of the unfinished heavy run for an as-of date"""
+    return f'renewal_stage_heavy_run_for|{getdate(as_of)}'
+
+
+def get_shard_checkpoint(run_id, start_after):
+    return frappe.cache.hget(get_heavy_run_key(run_id, 'checkpoints'), start_after)
+
+
+def set_shard_checkpoint(run_id, start_after, checkpoint):
+    """Persist a shard's progress, with the time as its heartbeat"""
+    cache = frappe.cache
+    checkpoint['updated_at'] = time.time()
+    cache.hset(get_heavy_run_key(run_id, 'checkpoints'), start_after, checkpoint)
+    cache.expire(cache.make_key(get_heavy_run_key(run_id, 'checkpoints')), HEAVY_JOB_RUN_EXPIRY)
+
+
+def enqueue_renewal_stage_shard(run_id, as_of, start_after, end_at, attempt=1):
+    """Enqueue one shard on the long queue, skipped if the same attempt is already queued or running"""
+    frappe.enqueue(
+        'ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.run_renewal_stage_shard',
+        queue='long',
+        job_id=f'renewal_stage_shard::{run_id}::{start_after}::{attempt}',
+        deduplicate=True,
+        as_of=str(as_of),
+        start_after=start_after,
+        end_at=end_at,
+        run_id=run_id
+    )
+
+
+def enqueue_next_renewal_stage_shard(run_id, as_of):
+    """Pop the next pending shard of a heavy run and enqueue it"""
+    shard = frappe.cache.lpop(get_heavy_run_key(run_id, 'pending'))
+    if not shard:
+        return
+    
+    start_after, end_at = json.loads(shard)
+    checkpoint = get_shard_checkpoint(run_id, start_after)
+    enqueue_renewal_stage_shard(
+        run_id, as_of, start_after, end_at, attempt=(checkpoint['attempts'] if checkpoint else 0) + 1
+    )
+
+
+def queue_pending_renewal_stage_shards(run_id, shards):
+    cache = frappe.cache
+    cache.delete_value(get_heavy_run_key(run_id, 'pending'))
+    for shard in shards:
+        cache.rpush(get_heavy_run_key(run_id, 'pending'), json.dumps(shard))
+    cache.expire(cache.make_key(get_heavy_run_key(run_id, 'pending')), HEAVY_JOB_RUN_EXPIRY)
+
+
+def resume_heavy_run(run_id, as_of, max_parallel_shards):
+    """
+    Re-queue the shards of an unfinished heavy run that neither reported in
+    nor checkpointed within HEAVY_JOB_SHARD_STALE_AFTER seconds, e.g. after
+    the worker running them was killed. They resume from their checkpoints
+    """
+    cache = frappe.cache
+    shards = cache.get_value(get_heavy_run_key(run_id, 'shard_list')) or []
+    done = cache.hgetall(get_heavy_run_key(run_id, 'results'))
+    checkpoints = cache.hgetall(get_heavy_run_key(run_id, 'checkpoints'))
+    stale_before = time.time() - HEAVY_JOB_SHARD_STALE_AFTER
+    
+    remaining = [
+        shard for shard in shards
+        if shard[0] not in done and checkpoints.get(shard[0], {}).get('updated_at', 0) < stale_before
+    ]
+    queue_pending_renewal_stage_shards(run_id, remaining)
+    
+    frappe.logger().info(
+        f"Heavy run {run_id}: resuming {len(remaining)} of {len(shards)} shards, "
+        f"{len(done)} already finished"
+    )
+    
+    # Shards still queued from the interrupted run are skipped by enqueue deduplication
+    for _ in range(min(max_parallel_shards, len(remaining))):
+        enqueue_next_renewal_stage_shard(run_id, as_of)
+    
+    return {
+        'run_id': run_id,
+        'shards': len(shards),
+        'resumed': len(remaining)
+    }
+
+
+def summarize_heavy_job(results, job_run=None):
+    """
+    Aggregate per-shard results into the heavy job summary dict and error log,
+    and close the Renewal Job Run ledger entry job_run when given
+    """
+    total_count = sum(r['total'] for r in results)
+    success_count = sum(r['success'] for r in results)
+    error_count = sum(r['errors'] for r in results)
+    errors = [e for r in results for e in r['error_messages']]
+    stage_changes = [c for r in results for c in r['stage_changes']]
+    # Counted from the metrics so pages committed before a resume are included
+    stage_change_count = sum(r['metrics']['stage_changes'] for r in results)
+    
+    # Summary logging
+    summary = (
+        f"HEAVY Job Completed:\n"
+        f"Total: {total_count}\n"
+        f"Success: {success_count}\n"
+        f"Errors: {error_count}\n"
+        f"Stage Changes: {stage_change_count}"
+    )
+    
+    frappe.logger().info(summary)
+    
+    if stage_changes:
+        change_details = "\n".join([
+            f"{c['name']}: {c['old_stage']} → {c['new_stage']} ({c['days_remaining']} days)"
+            for c in stage_changes
+        ])
+        frappe.logger().info(f"Stage Changes:\n{change_details}")
+    
+    if errors:
+        frappe.log_error(
+            message="\n".join(errors),
+            title="Heavy Job - Failed Updates Summary"
+        )
+    
+    if job_run:
+        metrics = JobRunMetrics()
+        for r in results:
+            metrics.add(JobRunMetrics(**r.get('metrics', {})))
+        finish_job_run(job_run, metrics, errors=errors)
+    
+    return {
+        'total': total_count,
+        'success': success_count,
+        'errors': error_count,
+        'stage_changes': stage_change_count,
+        'job_run': job_run
+    }
+
+
+def update_all_renewal_stages_heavy():
+    """
+    Heavy job: Update renewal tracking records (runs at 2 AM)
+    Processes submitted (docstatus=1) documents whose next_stage_transition
+    is today or earlier, so the cost follows the number of real transitions
+
+    Rows are streamed in keyset pages of HEAVY_JOB_CHUNK_SIZE documents and
+    recomputed set-based, one bulk UPDATE per page, so neither the documents
+    nor the full list of names are ever held in memory.
+    Runs with more than one shard of due documents are coordinated here:
+    shards are enqueued on the long queue, at most max_parallel_shards at a
+    time, and the last one to finish logs the summary. Returns the summary
+    dict when the run fits in one shard, else the run_id and shard count
+
+    Each run is recorded as a Renewal Job Run, whose name doubles as the
+    run_id. Shards checkpoint after every page, so running the job again on
+    the same day resumes an interrupted run instead of starting over
+
+    The run holds the renewal stage lease lock from start until its last
+    shard reports in, with a lease of HEAVY_RUN_LOCK_TTL so shards waiting
+    on the long queue keep it too. A shard that finds the lease lost stops.
+    A second pass started meanwhile skips, waits or hands off per
+    get_renewal_lock_settings, a heavy job takes over the lease instead,
+    see take_over_heavy_run_lock
+    """
+    job_run = None
+    lock = None
+    try:
+        frappe.logger().info("Starting HEAVY renewal stage update job at 2 AM")
+        
+        as_of = getdate(today())
+        shard_size, max_parallel_shards = get_heavy_job_settings()
+        cache = frappe.cache
+        
+        lock = take_over_heavy_run_lock(as_of)
+        if not lock:
+            lock, skipped = acquire_renewal_stage_lock('Heavy', as_of, HEAVY_JOB_METHOD)
+            if skipped:
+                return skipped
+        
+        # Held until the last shard reports in, however long the shards wait on the queue
+        lock.ttl = HEAVY_RUN_LOCK_TTL
+        lock.renew()
+        
+        # An unfinished run for today, e.g. its worker was killed
+        run_id = cache.get_value(get_heavy_date_key(as_of))
+        if run_id and cache.get_value(get_heavy_run_key(run_id, 'shards')):
+            cache.set_value(get_heavy_run_key(run_id, 'lock_token'), lock.token, expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+            cache.set_value(HEAVY_RUN_HOLDER_KEY, [run_id, str(as_of)], expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+            return resume_heavy_run(run_id, as_of, max_parallel_shards)
+        
+        # Split SUBMITTED documents due for a stage transition into shards
+        shards = get_renewal_stage_shards(as_of, shard_size)
+        job_run = start_job_run('Heavy', as_of, shards=len(shards), lock_wait_time=lock.wait_time)
+        
+        run_id = job_run
+        cache.set_value(get_heavy_run_key(run_id, 'lock_token'), lock.token, expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+        cache.set_value(HEAVY_RUN_HOLDER_KEY, [run_id, str(as_of)], expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+        cache.set_value(get_heavy_date_key(as_of), run_id, expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+        cache.set_value(get_heavy_run_key(run_id, 'shards'), len(shards), expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+        cache.set_value(get_heavy_run_key(run_id, 'shard_list'), shards, expires_in_sec=HEAVY_JOB_RUN_EXPIRY)
+        
+        if len(shards) == 1:
+            # Small runs are processed inline, still checkpointed
+            result = run_renewal_stage_shard(as_of, *shards[0], run_id=run_id)
+            return result.get('summary') or {'run_id': run_id, 'shards': 1}
+        
+        queue_pending_renewal_stage_shards(run_id, shards)
+        
+        frappe.logger().info(
+            f"Heavy run {run_id}: {len(shards)} shards of up to {shard_size} records, "
+            f"{max_parallel_shards} in parallel"
+        )
+        
+        # Each finished shard enqueues the next pending one
+        for _ in range(min(max_parallel_shards, len(shards))):
+            enqueue_next_renewal_stage_shard(run_id, as_of)
         
         return {
-            'total': total_count,
-            'success': success_count,
-            'errors': error_count,
-            'stage_changes': len(stage_changes)
+            'run_id': run_id,
+            'shards': len(shards)
         }
         
     except Exception as e:
+        frappe.db.rollback()
         frappe.log_error(
             message=frappe.get_traceback(),
             title="Heavy Renewal Stage Update Job Failed"
         )
+        if job_run:
+            finish_job_run(job_run, JobRunMetrics(), status='Failed', errors=[str(e)])
+        if lock:
+            lock.release()
         raise
 
 
 def update_all_renewal_stages_light():
     """
-    Light job: Update only recently modified or critical renewal tracking records (runs at 2 PM)
+    Light job: Update only due or recently modified renewal tracking records (runs at 2 PM)
     Focuses on submitted documents (docstatus=1) that are:
-    1. Modified today
-    2. In critical stages (30/60/90 days, Expired)
-    3. With license_end within next 120 days
+    1. Due for a stage transition (next_stage_transition today or earlier)
+    2. Modified today, e.g. dates changed through frappe.db.set_value,
+       which skips the controller
+
+    Runs under the renewal stage lease lock, see update_all_renewal_stages_heavy
     """
+    job_run = None
+    lock = None
+    metrics = JobRunMetrics()
     try:
         frappe.logger().info("Starting LIGHT renewal stage update job at 2 PM")
         
-        now_date = today()
-        critical_date = add_days(now_date, 120)  # Look ahead 120 days
+        now_date = getdate(today())
         
-        # Build filters for light job - ONLY SUBMITTED documents
-        filters = [
-            ['Renewal Tracking', 'docstatus', '=', 1],  # Only submitted
-            ['Renewal Tracking', 'license_start', 'is', 'set'],
-            ['Renewal Tracking', 'license_end', 'is', 'set'],
-        ]
+        lock, skipped = acquire_renewal_stage_lock('Light', now_date, LIGHT_JOB_METHOD)
+        if skipped:
+            return skipped
         
-        # Get records modified today OR with upcoming expiry OR in critical stages
-        or_filters = [
-            ['Renewal Tracking', 'modified', '>=', now_date],
-            ['Renewal Tracking', 'license_end', '<=', critical_date],
-            ['Renewal Tracking', 'renewal_stage', 'in', [
-                '30 Days to Expiry',
-                '60 Days to Expiry', 
-                '90 Days to Expiry',
-                'Expired'
-            ]]
-        ]
+        job_run = start_job_run('Light', now_date, lock_wait_time=lock.wait_time)
         
-        renewal_docs = frappe.get_all(
-            'Renewal Tracking',
-            filters=filters,
-            or_filters=or_filters,
-            pluck='name'
+        pages = iter_renewal_tracking_pages(
+            None,
+            {'as_of': now_date},
+            page_size=LIGHT_JOB_CHUNK_SIZE,
+            page_query=LIGHT_JOB_PAGE_QUERY
         )
         
-        # Remove duplicates
-        renewal_docs = list(set(renewal_docs))
-        
-        total_count = len(renewal_docs)
-        success_count = 0
-        error_count = 0
-        stage_changes = []
-        
-        frappe.logger().info(f"Found {total_count} critical submitted renewal records to process")
-        
-        for idx, name in enumerate(renewal_docs, 1):
-            try:
-                doc = frappe.get_doc('Renewal Tracking', name)
-                old_stage = doc.renewal_stage
-                
-                # Calculate new stage
-                doc.calculate_renewal_stage()
-                
-                # Update database directly without affecting docstatus
-                frappe.db.set_value(
-                    'Renewal Tracking',
-                    name,
-                    {
-                        'renewal_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    },
-                    update_modified=False
-                )
-                
-                # Track stage changes for reporting
-                if old_stage != doc.renewal_stage:
-                    stage_changes.append({
-                        'name': name,
-                        'old_stage': old_stage,
-                        'new_stage': doc.renewal_stage,
-                        'days_remaining': doc.days_remaining
-                    })
-                    frappe.logger().info(
-                        f"[{idx}/{total_count}] {name}: {old_stage} → {doc.renewal_stage}"
-                    )
-                
-                success_count += 1
-                
-                # Commit every 20 records (smaller batches for light job)
-                if idx % 20 == 0:
-                    frappe.db.commit()
-                
-            except Exception as e:
-                error_count += 1
-                frappe.log_error(
-                    message=frappe.get_traceback(),
-                    title=f"Light Job Error - {name}"
-                )
-                continue
-        
-        # Final commit
-        frappe.db.commit()
+        total_count, success_count, error_count, errors, stage_changes = update_renewal_stages_in_pages(
+            pages, now_date, "Light", metrics, on_page=lambda *args: lock.renew()
+        )
         
         # Summary logging
         summary = (
@@ -921,16 +1289,166 @@ def update_all_renewal_stages_light():
             ])
             frappe.logger().info(f"Stage Changes:\n{change_summary}")
         
+        finish_job_run(job_run, metrics, errors=errors)
+        
         return {
             'total': total_count,
             'success': success_count,
             'errors': error_count,
-            'stage_changes': len(stage_changes)
+            'stage_changes': len(stage_changes),
+            'job_run': job_run
         }
         
     except Exception as e:
+        frappe.db.rollback()
         frappe.log_error(
             message=frappe.get_traceback(),
             title="Light Renewal Stage Update Job Failed"
         )
-        raise
\ No newline at end of file
+        if job_run:
+            finish_job_run(job_run, metrics, status='Failed', errors=[str(e)])
+        raise
+    
+    finally:
+        if lock:
+            lock.release()
+
+
+# =============================================================================
+# EXCHANGE RATE REVALUATION
+# =============================================================================
+
+# Draft renewals rewritten and committed per batch by the revaluation job
+REVALUATION_BATCH_SIZE = 1000
+
+REVALUATION_METHOD = 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.revalue_draft_renewals'
+
+# Rate of the latest Currency Exchange entry effective on the renewal's date,
+# one lookup on the (from_currency, to_currency, date) index per renewal
+EFFECTIVE_EXCHANGE_RATE_SQL = """
+    SELECT ce.exchange_rate
+    FROM `tabCurrency Exchange` ce
+    WHERE ce.from_currency = rt.currency
+        AND ce.to_currency = c.default_currency
+        AND ce.`date` <= COALESCE(rt.`date`, %(today)s)
+    ORDER BY ce.`date` DESC, ce.modified DESC
+    LIMIT 1
+"""
+
+
+def enqueue_draft_renewal_revaluation(doc, method=None):
+    """doc_event on Currency Exchange, revalue the draft renewals of the pair(s) the change touches"""
+    pairs = {(doc.from_currency, doc.to_currency)}
+    before = doc.get_doc_before_save()
+    if before:
+        pairs.add((before.from_currency, before.to_currency))
+    
+    for from_currency, to_currency in pairs:
+        frappe.enqueue(
+            REVALUATION_METHOD,
+            queue='long',
+            job_id=f'renewal_revaluation::{from_currency}::{to_currency}',
+            deduplicate=True,
+            enqueue_after_commit=True,
+            from_currency=from_currency,
+            to_currency=to_currency
+        )
+
+
+def revalue_draft_renewals(from_currency, to_currency):
+    """
+    Re-apply the effective Currency Exchange rate to every draft renewal in
+    from_currency of a company whose currency is to_currency
+    
+    Only drafts whose rate actually moved are written, a batch at a time,
+    with set-based UPDATEs over the parent and item tables. Drafts with a
+    manual_exchange_rate keep the rate the user entered.
+    
+    Returns the number of renewals revalued
+    """
+    rows = frappe.db.sql(
+        f"""
+        SELECT rt.name, rt.exchange_rate, ({EFFECTIVE_EXCHANGE_RATE_SQL}) AS effective_rate
+        FROM `tabRenewal Tracking` rt
+        INNER JOIN `tabCompany` c ON c.name = rt.company
+        WHERE rt.docstatus = 0
+            AND rt.manual_exchange_rate = 0
+            AND rt.currency = %(from_currency)s
+            AND c.default_currency = %(to_currency)s
+        """,
+        {'from_currency': from_currency, 'to_currency': to_currency, 'today': today()},
+        as_dict=True
+    )
+    
+    changed = [
+        (row.name, flt(row.effective_rate))
+        for row in rows
+        if row.effective_rate and flt(row.effective_rate) != flt(row.exchange_rate)
+    ]
+    
+    for start in range(0, len(changed), REVALUATION_BATCH_SIZE):
+        write_exchange_rates(changed[start:start + REVALUATION_BATCH_SIZE])
+        frappe.db.commit()
+    
+    if changed:
+        frappe.logger().info(
+            f"Revalued {len(changed)} draft renewals at the current {from_currency} to {to_currency} rate"
+        )
+    
+    return len(changed)
+
+
+def write_exchange_rates(changed):
+    """
+    Set exchange_rate of each (name, rate), then recompute base_rate and
+    base_amount of their items and net_total_base from those, the same
+    way calculate_values does, in three UPDATEs
+    """
+    names = [name for name, _ in changed]
+    rate_cases = " ".join(["WHEN %s THEN %s"] * len(changed))
+    placeholders = ", ".join(["%s"] * len(names))
+    
+    values = []
+    for name, rate in changed:
+        values.extend((name, rate))
+    
+    # modified moves so a form opened before the revaluation cannot save stale values over it
+    frappe.db.sql(
+        f"""
+        UPDATE `tabRenewal Tracking`
+        SET
+            exchange_rate = CASE name {rate_cases} END,
+            modified = %s
+        WHERE name IN ({placeholders})
+        """,
+        values + [now_datetime()] + names
+    )
+    
+    frappe.db.sql(
+        f"""
+        UPDATE `tabRenewal Tracking Item` item
+        INNER JOIN `tabRenewal Tracking` rt ON rt.name = item.parent
+        SET
+            item.base_rate = ROUND(item.rate, 2) * rt.exchange_rate,
+            item.base_amount = ROUND(item.amount, 2) * rt.exchange_rate
+        WHERE item.parenttype = 'Renewal Tracking'
+            AND item.parent IN ({placeholders})
+        """,
+        names
+    )
+    
+    frappe.db.sql(
+        f"""
+        UPDATE `tabRenewal Tracking` rt
+        LEFT JOIN (
+            SELECT parent, SUM(ROUND(base_amount, 2)) AS total
+            FROM `tabRenewal Tracking Item`
+            WHERE parenttype = 'Renewal Tracking'
+                AND parent IN ({placeholders})
+            GROUP BY parent
+        ) items ON items.parent = rt.name
+        SET rt.net_total_base = COALESCE(items.total, 0)
+        WHERE rt.name IN ({placeholders})
+        """,
+        names + names
+    )
@@ -2,33 +2,297 @@
 // For license information, please see license.txt
 
 frappe.listview_settings['Renewal Tracking'] = {
-    add_fields: ["renewal_stage", "days_remaining", "license_start", "license_end"],
-    
+    add_fields: ["renewal_stage", "license_start", "license_end"],
+
+    onload: function(listview) {
+        if (frappe.model.can_create('Renewal Tracking')) {
+            listview.page.add_menu_item(__('Import Renewals'), function() {
+                import_renewals_dialog(listview);
+            });
+        }
+        if (frappe.model.can_create('Quotation')) {
+            listview.page.add_menu_item(__('Make Quotations'), function() {
+                make_quotations_dialog(listview);
+            });
+        }
+        if (frappe.model.can_export('Renewal Tracking')) {
+            listview.page.add_menu_item(__('Export Renewals'), function() {
+                export_renewals_dialog(listview);
+            });
+        }
+    },
+
     formatters: {
-        days_remaining: function(value, df, doc) {
-            if (value === null || value === undefined) {
+        // days_remaining is derived at read time, so it is shown next to License End.
+        // Sorting or filtering on License End is equivalent to sorting or filtering on days remaining.
+        license_end: function(value, df, doc) {
+            if (!value) {
                 return '';
             }
-            
-            let color, text;
-            if (value < 0) {
-                color = 'red';
-                text = Math.abs(value) + ' days overdue';
-            } else if (value <= 30) {
-                color = 'red';
-                text = value + ' days';
-            } else if (value <= 60) {
-                color = 'orange';
-                text = value + ' days';
-            } else if (value <= 90) {
-                color = 'yellow';
-                text = value + ' days';
-            } else {
-                color = 'green';
-                text = value + ' days';
-            }
-            
-            return `<span style="color: ${color}; font-weight: bold;">${text}</span>`;
+
+            let days_remaining = frappe.datetime.get_day_diff(value, frappe.datetime.get_today());
+            return `${frappe.datetime.str_to_user(value)} ${format_days_remaining(days_remaining)}`;
         }
     }
-};
\ No newline at end of file
+};
+
+function format_days_remaining(value) {
+    if (value === null || value === undefined) {
+        return '';
+    }
+
+    let color, text;
+    if (value < 0) {
+        color = 'red';
+        text = Math.abs(value) + ' days overdue';
+    } else if (value <= 30) {
+        color = 'red';
+        text = value + ' days';
+    } else if (value <= 60) {
+        color = 'orange';
+        text = value + ' days';
+    } else if (value <= 90) {
+        color = 'yellow';
+        text = value + ' days';
+    } else {
+        color = 'green';
+        text = value + ' days';
+    }
+
+    return `<span style="color: ${color}; font-weight: bold;">${text}</span>`;
+}
+
+function import_renewals_dialog(listview) {
+    // One row per item line, rows sharing a Renewal Key become one renewal
+    let dialog = new frappe.ui.Dialog({
+        title: __('Import Renewals'),
+        fields: [
+            {
+                fieldname: 'file_url',
+                fieldtype: 'Attach',
+                label: __('CSV or Excel File'),
+                reqd: 1
+            },
+            {
+                fieldname: 'submit',
+                fieldtype: 'Check',
+                label: __('Submit Imported Renewals')
+            }
+        ],
+        primary_action_label: __('Import'),
+        primary_action: function(values) {
+            frappe.call({
+                method: 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_import.enqueue_renewal_import',
+                args: values,
+                callback: function() {
+                    dialog.hide();
+                    watch_renewal_import(listview);
+                }
+            });
+        }
+    });
+    dialog.show();
+}
+
+function watch_renewal_import(listview) {
+    frappe.show_progress(__('Importing renewals'), 0, 1, __('Queued'));
+
+    let on_progress = function(summary) {
+        if (!summary.done) {
+            frappe.show_progress(
+                __('Importing renewals'),
+                summary.renewals + summary.skipped + summary.failed,
+                summary.renewals + summary.skipped + summary.failed + 1,
+                __('{0} renewals created, {1} rejected', [summary.renewals, summary.failed])
+            );
+            return;
+        }
+
+        frappe.realtime.off('renewal_import_progress', on_progress);
+        frappe.hide_progress();
+        listview.refresh();
+
+        let message = __('{0} renewals with {1} items created in {2} seconds, {3} already imported, {4} rejected',
+            [summary.renewals, summary.items, summary.seconds, summary.skipped, summary.failed]);
+        let rows = (summary.errors || []).slice(0, 200).map(function(error) {
+            return `<tr><td>${error.row}</td><td>${frappe.utils.escape_html(error.renewal_key)}</td><td>${frappe.utils.escape_html(error.message)}</td></tr>`;
+        }).join('');
+
+        frappe.msgprint({
+            title: __('Renewal Import'),
+            indicator: summary.failed ? 'orange' : 'green',
+            message: rows
+                ? `<p>${message}</p><table class="table table-bordered"><thead><tr><th>${__('Row')}</th><th>${__('Renewal Key')}</th><th>${__('Error')}</th></tr></thead><tbody>${rows}</tbody></table>`
+                : message
+        });
+    };
+
+    frappe.realtime.on('renewal_import_progress', on_progress);
+}
+
+function export_renewals_dialog(listview) {
+    // The server streams the rows matching the list filters, nothing is built in the browser
+    let dialog = new frappe.ui.Dialog({
+        title: __('Export Renewals'),
+        fields: [
+            {
+                fieldname: 'doctype',
+                fieldtype: 'Select',
+                label: __('Rows'),
+                options: [
+                    { value: 'Renewal Tracking', label: __('Renewals') },
+                    { value: 'Renewal Tracking Item', label: __('Renewal Items') }
+                ],
+                default: 'Renewal Tracking'
+            },
+            {
+                fieldname: 'file_format',
+                fieldtype: 'Select',
+                label: __('Format'),
+                options: ['CSV', 'Excel'],
+                default: 'CSV'
+            },
+            {
+                fieldname: 'save_as_file',
+                fieldtype: 'Check',
+                label: __('Save as File'),
+                description: __('Export in the background and attach the result as a private File')
+            }
+        ],
+        primary_action_label: __('Export'),
+        primary_action: function(values) {
+            let args = {
+                filters: JSON.stringify(listview.get_filters_for_args()),
+                doctype: values.doctype,
+                file_format: values.file_format
+            };
+            dialog.hide();
+
+            if (!values.save_as_file) {
+                window.open('/api/method/ostec_native.ostec_native.doctype.renewal_tracking.renewal_export.export_renewals?' + $.param(args));
+                return;
+            }
+
+            frappe.call({
+                method: 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_export.enqueue_renewal_export',
+                args: args,
+                callback: function(r) {
+                    // Asking for the same export again returns the job already queued, one File arrives for both
+                    let job_id = r.message;
+                    let on_ready = function(data) {
+                        if (data.job_id !== job_id) return;
+                        frappe.realtime.off('renewal_export_ready', on_ready);
+                        frappe.msgprint(__('Export ready: {0}', [`<a href="${data.file_url}" target="_blank">${data.file_url}</a>`]));
+                    };
+                    frappe.realtime.on('renewal_export_ready', on_ready);
+                    frappe.show_alert({ message: __('Export queued'), indicator: 'blue' });
+                }
+            });
+        }
+    });
+    dialog.show();
+}
+
+function make_quotations_dialog(listview) {
+    // Prefilled from the list's equality filters, the job picks every submitted renewal matching them
+    let defaults = {};
+    (listview.filter_area.get() || []).forEach(function(filter) {
+        if (filter[2] === '=' && ['renewal_stage', 'company', 'account_manager'].includes(filter[1])) {
+            defaults[filter[1]] = filter[3];
+        }
+    });
+
+    let dialog = new frappe.ui.Dialog({
+        title: __('Make Quotations'),
+        fields: [
+            {
+                fieldname: 'target_doctype',
+                fieldtype: 'Select',
+                label: __('Make'),
+                options: ['Quotation', 'Supplier Quotation', 'Request for Quotation'],
+                default: 'Quotation',
+                reqd: 1
+            },
+            {
+                fieldname: 'supplier',
+                fieldtype: 'Link',
+                label: __('Supplier'),
+                options: 'Supplier',
+                depends_on: "eval:doc.target_doctype != 'Quotation'",
+                mandatory_depends_on: "eval:doc.target_doctype != 'Quotation'"
+            },
+            {
+                fieldname: 'renewal_stage',
+                fieldtype: 'Select',
+                label: __('Renewal Stage'),
+                options: [''].concat(frappe.meta.get_docfield('Renewal Tracking', 'renewal_stage').options.split('\n')),
+                default: defaults.renewal_stage
+            },
+            {
+                fieldname: 'company',
+                fieldtype: 'Link',
+                label: __('Company'),
+                options: 'Company',
+                default: defaults.company
+            },
+            {
+                fieldname: 'account_manager',
+                fieldtype: 'Link',
+                label: __('Account Manager'),
+                options: 'User',
+                default: defaults.account_manager
+            }
+        ],
+        primary_action_label: __('Make'),
+        primary_action: function(values) {
+            frappe.call({
+                method: 'ostec_native.ostec_native.doctype.renewal_tracking.renewal_mapping.enqueue_renewal_mapping',
+                args: values,
+                callback: function() {
+                    dialog.hide();
+                    watch_renewal_mapping(values.target_doctype);
+                }
+            });
+        }
+    });
+    dialog.show();
+}
+
+function watch_renewal_mapping(target_doctype) {
+    let title = __('Making {0}', [__(target_doctype)]);
+    frappe.show_progress(title, 0, 1, __('Queued'));
+
+    let on_progress = function(summary) {
+        if (summary.target_doctype !== target_doctype) {
+            return;
+        }
+        if (!summary.done) {
+            frappe.show_progress(
+                title,
+                summary.created + summary.failed + summary.skipped,
+                summary.total,
+                __('{0} created, {1} failed', [summary.created, summary.failed])
+            );
+            return;
+        }
+
+        frappe.realtime.off('renewal_mapping_progress', on_progress);
+        frappe.hide_progress();
+
+        let message = __('{0} {1} created in {2} seconds, {3} renewals already had one, {4} failed',
+            [summary.created.length, __(target_doctype), summary.seconds, summary.skipped, summary.failed.length]);
+        let rows = summary.failed.slice(0, 200).map(function(error) {
+            return `<tr><td>${frappe.utils.escape_html(error.renewal_tracking)}</td><td>${frappe.utils.escape_html(error.message)}</td></tr>`;
+        }).join('');
+
+        frappe.msgprint({
+            title: __('Make {0}', [__(target_doctype)]),
+            indicator: summary.failed.length ? 'orange' : 'green',
+            message: rows
+                ? `<p>${message}</p><table class="table table-bordered"><thead><tr><th>${__('Renewal Tracking')}</th><th>${__('Error')}</th></tr></thead><tbody>${rows}</tbody></table>`
+                : message
+        });
+    };
+
+    frappe.realtime.on('renewal_mapping_progress', on_progress);
+}
@@ -1,9 +1,1296 @@
 # Copyright (c) 2026, Richmond Gedziq and Contributors
 # See license.txt
 
-# import frappe
+import csv
+import io
+import os
+import random
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, cint, flt, getdate, today
+
+from ostec_native.benchmarks.dataset import (
+	BENCH_PREFIX,
+	RENEWAL_IMPORT_HEADERS,
+	delete_imported_renewals,
+	delete_renewal_dataset,
+	get_bench_items,
+	make_items_file,
+	make_renewal_dataset,
+	make_renewals_file,
+)
+from ostec_native.benchmarks.stage_classifier import reference_renewal_stage
+from ostec_native.ostec_native.doctype.renewal_job_run.renewal_job_run import start_job_run
+from ostec_native.ostec_native.doctype.renewal_stage_event.renewal_stage_event import record_stage_events
+from ostec_native.ostec_native.doctype.renewal_tracking import item_import, line_items, renewal_mapping
+from ostec_native.ostec_native.doctype.renewal_tracking.item_import import IMPORT_COLUMNS, clear_import_pages
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_export import (
+	ITEM_EXPORT_COLUMNS,
+	enqueue_renewal_export,
+	export_renewals,
+	export_renewals_to_file,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_import import (
+	import_renewals,
+	reserve_series_names,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_mapping import (
+	QUOTATION_MILESTONE_STAGE,
+	RENEWAL_TABLE_MAPS,
+	SET_MISSING_VALUES,
+	draft_milestone_quotations,
+	get_mapping_plan,
+	get_milestone_renewals,
+	get_renewal_sources,
+	make_documents_for_chunk,
+	make_documents_for_renewals,
+	map_renewal,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_stage import (
+	classify_renewal_stages,
+	get_stage_labels,
+	get_transition_dates,
+)
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import (
+	DUE_RENEWAL_CONDITIONS,
+	HEAVY_RUN_HOLDER_KEY,
+	LIGHT_JOB_METHOD,
+	LIGHT_JOB_PAGE_QUERY,
+	RENEWAL_STAGE_LOCK,
+	RENEWAL_STAGE_LOCK_TTL,
+	SINGLE_UPDATE_LOCK,
+	get_heavy_date_key,
+	get_heavy_run_key,
+	get_heavy_run_lock,
+	get_item_fingerprint_fields,
+	get_renewal_page_query,
+	get_renewal_stage_shards,
+	get_shard_checkpoint,
+	import_items,
+	import_items_page,
+	iter_renewal_tracking_pages,
+	make_quotation,
+	make_request_for_quotation,
+	make_supplier_quotation,
+	on_doctype_update,
+	revalue_draft_renewals,
+	run_renewal_stage_shard,
+	set_shard_checkpoint,
+	summarize_heavy_job,
+	update_all_renewal_stages_heavy,
+	update_all_renewal_stages_light,
+	update_single_renewal_stage,
+)
+from ostec_native.utils.currency import (
+	COMPANY_CURRENCY_CACHE,
+	EXCHANGE_RATE_CACHE,
+	clear_company_currency_cache,
+	get_company_currency,
+	get_exchange_rate,
+	get_exchange_rates,
+)
+from ostec_native.utils.lock import LeaseLock
+
+
+def make_renewal(license_start, license_end, submit=True, **kwargs):
+	doc = frappe.get_doc(
+		{
+			"doctype": "Renewal Tracking",
+			"renewal_title": "_Test Renewal",
+			"license_start": license_start,
+			"license_end": license_end,
+			**kwargs,
+		}
+	)
+	doc.insert()
+	if submit:
+		doc.submit()
+	return doc
 
 
 class TestRenewalTracking(FrappeTestCase):
-	pass
+	def test_heavy_job_matches_document_stage(self):
+		now = today()
+		docs = [
+			make_renewal(add_days(now, 10), add_days(now, 400)),
+			make_renewal(add_days(now, -10), add_days(now, 200)),
+			make_renewal(add_days(now, -200), add_days(now, 75)),
+			make_renewal(add_days(now, -200), add_days(now, 45)),
+			make_renewal(add_days(now, -200), add_days(now, 5)),
+			make_renewal(add_days(now, -400), add_days(now, -1)),
+		]
+
+		# force every row out of date and due so the job has to rewrite it
+		frappe.db.sql(
+			"""update `tabRenewal Tracking`
+			set renewal_stage = null, next_stage_transition = %(today)s
+			where name in %(names)s""",
+			{"names": tuple(d.name for d in docs), "today": now},
+		)
+
+		summary = update_all_renewal_stages_heavy()
+		self.assertEqual(summary["errors"], 0)
+		self.assertGreaterEqual(summary["stage_changes"], len(docs))
+
+		for doc in docs:
+			doc.calculate_renewal_stage()
+			stage, next_transition = frappe.db.get_value(
+				"Renewal Tracking", doc.name, ["renewal_stage", "next_stage_transition"]
+			)
+			self.assertEqual(stage, doc.renewal_stage)
+			self.assertEqual(next_transition, doc.next_stage_transition)
+
+	def test_save_computes_items_totals_and_stage(self):
+		company, company_currency = frappe.get_all(
+			"Company", fields=["name", "default_currency"], limit=1, as_list=True
+		)[0]
+		currency = "EUR" if company_currency == "USD" else "USD"
+		items = get_bench_items()[:2]
+
+		doc = make_renewal(
+			add_days(today(), -200),
+			add_days(today(), 75),
+			submit=False,
+			company=company,
+			currency=currency,
+			exchange_rate=2.5,
+			items=[
+				{"item_code": items[0].item_code, "qty": 3, "rate": 10.126},
+				{"item_code": items[1].item_code, "qty": 1.5, "rate": 4},
+			],
+		)
+
+		self.assertEqual([item.amount for item in doc.items], [3 * 10.13, 1.5 * 4])
+		self.assertEqual([item.base_rate for item in doc.items], [10.13 * 2.5, 4 * 2.5])
+		self.assertAlmostEqual(flt(doc.net_total), 36.39, places=2)
+		self.assertAlmostEqual(doc.net_total_base, 36.39 * 2.5, places=2)
+		self.assertEqual(doc.renewal_stage, "90 Days to Expiry")
+
+		# submit keeps the stage validate stored without writing it a second time
+		doc.submit()
+		self.assertEqual(frappe.db.get_value("Renewal Tracking", doc.name, "renewal_stage"), "90 Days to Expiry")
+
+	def test_array_path_matches_scalar_path(self):
+		company, company_currency = frappe.get_all(
+			"Company", fields=["name", "default_currency"], limit=1, as_list=True
+		)[0]
+		rng = random.Random(7)
+
+		for currency in (company_currency, "EUR" if company_currency == "USD" else "USD"):
+			doc = frappe.new_doc("Renewal Tracking")
+			doc.update(
+				{
+					"license_start": add_days(today(), -10),
+					"license_end": add_days(today(), 300),
+					"company": company,
+					"currency": currency,
+					"exchange_rate": 15.4783,
+				}
+			)
+			for _ in range(2000):
+				# half-cent ties and sub-cent noise exercise the rounding
+				doc.append(
+					"items",
+					{
+						"qty": rng.choice([1, 2.5, rng.randint(1, 500)]),
+						"rate": rng.choice([round(rng.uniform(0, 9999), 3), rng.randint(0, 10**6) / 100 + 0.005]),
+					},
+				)
+
+			with patch.object(line_items, "ARRAY_PATH_MIN_ROWS", 10**9):
+				doc.calculate_values()
+			scalar = [(item.amount, item.base_rate, item.base_amount) for item in doc.items]
+			scalar_totals = (doc.net_total, doc.net_total_base)
+
+			doc.calculate_values()
+			self.assertEqual([(item.amount, item.base_rate, item.base_amount) for item in doc.items], scalar)
+			self.assertAlmostEqual(doc.net_total, scalar_totals[0], places=2)
+			self.assertAlmostEqual(doc.net_total_base, scalar_totals[1], places=2)
+
+	def test_line_items_use_field_precision(self):
+		items = [frappe._dict(qty=2, rate=1.2346) for _ in range(line_items.ARRAY_PATH_MIN_ROWS)]
+		precisions = line_items.ItemPrecision(rate=3, amount=3, base_amount=3)
+
+		with patch.object(line_items, "get_item_precisions", return_value=precisions):
+			with patch.object(line_items, "ARRAY_PATH_MIN_ROWS", 10**9):
+				scalar_totals = line_items.calculate_line_items(items[:1], 0, True)
+			array_totals = line_items.calculate_line_items(items, None, True)
+
+		self.assertEqual(scalar_totals, (2.47, 2.47))
+		self.assertEqual(items[0].amount, 2.47)
+		# a missing exchange rate counts as 1 on the array path too
+		self.assertEqual(items[0].base_amount, 2.47)
+		self.assertAlmostEqual(array_totals[0], 2.47 * len(items), places=3)
+
+	def test_header_edit_skips_item_recalculation(self):
+		items = get_bench_items()[:3]
+		doc = make_renewal(
+			add_days(today(), -10),
+			add_days(today(), 300),
+			submit=False,
+			items=[{"item_code": item.item_code, "qty": 2, "rate": 10} for item in items],
+		)
+		fingerprint = doc.items_fingerprint
+		self.assertTrue(fingerprint)
+
+		def get_item_modified():
+			return frappe.get_all(
+				"Renewal Tracking Item", filters={"parent": doc.name}, pluck="modified", order_by="idx"
+			)
+
+		item_modified = get_item_modified()
+
+		doc.reload()
+		doc.renewal_outcome = "On Hold"
+		with patch.object(type(doc), "calculate_values") as calculate_values:
+			doc.save()
+		calculate_values.assert_not_called()
+		self.assertEqual(doc.items_fingerprint, fingerprint)
+		self.assertEqual(get_item_modified(), item_modified)
+		self.assertEqual(frappe.db.get_value("Renewal Tracking", doc.name, "renewal_outcome"), "On Hold")
+
+		doc.items[0].qty = 5
+		doc.save()
+		self.assertNotEqual(doc.items_fingerprint, fingerprint)
+		self.assertEqual(frappe.db.get_value("Renewal Tracking Item", doc.items[0].name, "amount"), 50)
+
+	def test_item_custom_field_edit_persists(self):
+		from frappe.custom.doctype.custom_field.custom_field import create_custom_field
+
+		create_custom_field(
+			"Renewal Tracking Item",
+			{"fieldname": "test_serial_no", "label": "Test Serial No", "fieldtype": "Data", "insert_after": "qty"},
+		)
+		self.addCleanup(frappe.delete_doc, "Custom Field", "Renewal Tracking Item-test_serial_no")
+		self.assertIn("test_serial_no", get_item_fingerprint_fields())
+		self.assertNotIn("amount", get_item_fingerprint_fields())
+
+		item = get_bench_items()[0]
+		doc = make_renewal(
+			add_days(today(), -10),
+			add_days(today(), 300),
+			submit=False,
+			items=[{"item_code": item.item_code, "qty": 2, "rate": 10}],
+		)
+
+		doc.reload()
+		doc.items[0].test_serial_no = "SN-0001"
+		doc.save()
+		self.assertEqual(frappe.db.get_value("Renewal Tracking Item", doc.items[0].name, "test_serial_no"), "SN-0001")
+
+	def test_next_stage_transition(self):
+		now = today()
+		doc = make_renewal(add_days(now, -10), add_days(now, 200))
+		self.assertEqual(doc.renewal_stage, "Running")
+		self.assertEqual(getdate(doc.next_stage_transition), getdate(add_days(now, 110)))
+
+		expired = make_renewal(add_days(now, -400), add_days(now, -1))
+		self.assertIsNone(expired.next_stage_transition)
+
+	def test_days_remaining_is_derived(self):
+		now = today()
+		doc = make_renewal(add_days(now, -10), add_days(now, 200))
+		self.assertEqual(doc.days_remaining, 200)
+
+		doc = frappe.get_doc("Renewal Tracking", doc.name)
+		self.assertEqual(doc.days_remaining, 200)
+		self.assertEqual(update_single_renewal_stage(doc.name)["days_remaining"], 200)
+
+	def test_heavy_job_skips_rows_without_transition(self):
+		now = today()
+		doc = make_renewal(add_days(now, -10), add_days(now, 200))
+		frappe.db.set_value("Renewal Tracking", doc.name, "renewal_stage", "Open", update_modified=False)
+
+		update_all_renewal_stages_heavy()
+
+		# not due yet, so the job must not have touched the row
+		self.assertEqual(frappe.db.get_value("Renewal Tracking", doc.name, "renewal_stage"), "Open")
+
+	def test_heavy_job_shards_cover_due_rows_once(self):
+		now = today()
+		docs = [make_renewal(add_days(now, -200), add_days(now, 45)) for _ in range(5)]
+		names = tuple(d.name for d in docs)
+		frappe.db.sql(
+			"""update `tabRenewal Tracking` set renewal_stage = null, next_stage_transition = %(today)s
+			where name in %(names)s""",
+			{"names": names, "today": now},
+		)
+
+		shards = get_renewal_stage_shards(getdate(now), 2)
+		self.assertGreaterEqual(len(shards), 3)
+		self.assertIsNone(shards[-1][1])
+
+		results = [run_renewal_stage_shard(now, *shard) for shard in shards]
+		summary = summarize_heavy_job(results)
+		self.assertEqual(summary["errors"], 0)
+
+		processed = [c["name"] for r in results for c in r["stage_changes"]]
+		self.assertEqual(sorted(set(processed) & set(names)), sorted(names))
+		self.assertEqual(len(processed), len(set(processed)))
+
+	def test_shard_resumes_from_checkpoint(self):
+		now = today()
+		docs = [make_renewal(add_days(now, -200), add_days(now, 45)) for _ in range(5)]
+		names = [d.name for d in docs]
+		frappe.db.sql(
+			"""update `tabRenewal Tracking` set renewal_stage = null, next_stage_transition = %(today)s
+			where name in %(names)s""",
+			{"names": tuple(names), "today": now},
+		)
+
+		# an earlier attempt committed the first two rows, then its worker died
+		run_id = start_job_run("Heavy", getdate(now))
+		frappe.cache.set_value(get_heavy_run_key(run_id, "shards"), 1)
+		lock = LeaseLock(RENEWAL_STAGE_LOCK, ttl=60)
+		self.assertTrue(lock.acquire())
+		self.addCleanup(lock.release)
+		frappe.cache.set_value(get_heavy_run_key(run_id, "lock_token"), lock.token)
+		set_shard_checkpoint(
+			run_id,
+			"",
+			{"last_name": names[1], "metrics": {"rows_scanned": 2, "stage_changes": 2}, "error_messages": [], "attempts": 1},
+		)
+		self.assertEqual(get_shard_checkpoint(run_id, "")["last_name"], names[1])
+
+		result = run_renewal_stage_shard(now, "", names[-1], run_id=run_id)
+		self.assertEqual(result["total"], 5)
+		self.assertEqual(result["summary"]["stage_changes"], 5)
+		self.assertEqual([c["name"] for c in result["stage_changes"]], names[2:])
+
+		stages = frappe.get_all(
+			"Renewal Tracking", filters={"name": ("in", names)}, fields=["name", "renewal_stage"], order_by="name"
+		)
+		self.assertEqual([s.renewal_stage for s in stages], [None, None] + ["60 Days to Expiry"] * 3)
+
+		# the finished run cleared its checkpoints and closed the ledger entry
+		self.assertIsNone(get_shard_checkpoint(run_id, ""))
+		self.assertEqual(frappe.db.get_value("Renewal Job Run", run_id, "rows_scanned"), 5)
+
+	def test_pages_stream_each_row_once(self):
+		now = today()
+		docs = [make_renewal(add_days(now, -200), add_days(now, 45)) for _ in range(7)]
+		names = {d.name for d in docs}
+		conditions = "name IN %(names)s"
+
+		pages = list(iter_renewal_tracking_pages(conditions, {"names": tuple(names)}, page_size=3))
+		self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+		streamed = [row.name for page in pages for row in page]
+		self.assertEqual(streamed, sorted(names))
+
+		# bounded range, as used by the heavy job shards
+		bounded = iter_renewal_tracking_pages(
+			conditions, {"names": tuple(names)}, page_size=3, start_after=streamed[1], end_at=streamed[4]
+		)
+		self.assertEqual([row.name for page in bounded for row in page], streamed[2:5])
+
+	def test_classifier_parity_with_document_logic(self):
+		rng = random.Random(42)
+		now = getdate(today())
+		starts, ends = [], []
+		for _ in range(5000):
+			start = add_days(now, rng.randint(-800, 200))
+			starts.append(start)
+			ends.append(add_days(start, rng.randint(1, 900)))
+
+		# boundary days are where an off-by-one would show up
+		for offset in (0, 1, 29, 30, 31, 59, 60, 61, 89, 90, 91):
+			starts.append(add_days(now, -400))
+			ends.append(add_days(now, offset))
+		starts.append(now)
+		ends.append(add_days(now, 365))
+
+		batch = classify_renewal_stages(starts, ends, now)
+		stages = get_stage_labels(batch.codes)
+		transitions = get_transition_dates(batch.next_transition)
+
+		for i, (start, end) in enumerate(zip(starts, ends)):
+			self.assertEqual(
+				(stages[i], transitions[i], int(batch.days_remaining[i])),
+				reference_renewal_stage(start, end, now),
+				msg=f"{start} → {end}",
+			)
+
+	def test_classifier_missing_dates(self):
+		batch = classify_renewal_stages([None, today()], [add_days(today(), 10), None])
+		self.assertEqual(get_stage_labels(batch.codes), [None, None])
+		self.assertEqual(get_transition_dates(batch.next_transition), [None, None])
+
+
+class TestRenewalStageLock(FrappeTestCase):
+	def setUp(self):
+		self.holder = LeaseLock(RENEWAL_STAGE_LOCK, ttl=60)
+		self.assertTrue(self.holder.acquire())
+
+	def tearDown(self):
+		self.holder.release()
+		frappe.cache.delete_value(self.holder.handoff_list)
+
+	def test_lease_is_owned_by_token(self):
+		other = LeaseLock(RENEWAL_STAGE_LOCK, ttl=60)
+		self.assertFalse(other.acquire(wait=0.2, poll_interval=0.1))
+		self.assertGreaterEqual(other.wait_time, 0.2)
+
+		self.assertFalse(other.renew())
+		self.assertFalse(other.release())
+		self.assertTrue(self.holder.renew())
+		self.assertEqual(self.holder.holder(), self.holder.token)
+
+		self.assertTrue(self.holder.release())
+		self.assertTrue(other.acquire())
+		other.release()
+
+	def test_light_job_skips_while_locked(self):
+		with patch.dict(frappe.conf, {"renewal_stage_lock_policy": "skip"}):
+			summary = update_all_renewal_stages_light()
+
+		self.assertEqual(summary["lock"], "skipped")
+		self.assertEqual(frappe.db.get_value("Renewal Job Run", summary["job_run"], "status"), "Skipped")
+
+	def test_light_job_hands_off_to_holder(self):
+		with patch.dict(frappe.conf, {"renewal_stage_lock_policy": "handoff"}):
+			summary = update_all_renewal_stages_light()
+		self.assertEqual(summary["lock"], "handed off")
+
+		# the holder enqueues the handed off job once it releases
+		with patch("frappe.enqueue") as enqueue:
+			self.holder.release()
+		enqueue.assert_called_once()
+		self.assertEqual(enqueue.call_args.args[0], LIGHT_JOB_METHOD)
+
+	def clear_heavy_run(self, run_id):
+		for key in ("results", "finished", "shards", "shard_list", "pending", "checkpoints", "lock_token"):
+			frappe.cache.delete_value(get_heavy_run_key(run_id, key))
+		frappe.cache.delete_value(get_heavy_date_key(today()))
+		frappe.cache.delete_value(HEAVY_RUN_HOLDER_KEY)
+
+	def test_sharded_run_holds_lease_while_shards_wait(self):
+		self.holder.release()
+		docs = [make_renewal(add_days(today(), -200), add_days(today(), 45)) for _ in range(3)]
+		frappe.db.sql(
+			"""update `tabRenewal Tracking` set next_stage_transition = %(today)s where name in %(names)s""",
+			{"names": tuple(doc.name for doc in docs), "today": today()},
+		)
+
+		# the shards stay queued
+		with patch.dict(frappe.conf, {"renewal_stage_shard_size": 1}), patch("frappe.enqueue"):
+			run_id = update_all_renewal_stages_heavy()["run_id"]
+		self.addCleanup(self.clear_heavy_run, run_id)
+
+		lock = get_heavy_run_lock(run_id)
+		self.addCleanup(lock.release)
+		self.assertEqual(lock.holder(), lock.token)
+		self.assertGreater(frappe.cache.ttl(lock.key), RENEWAL_STAGE_LOCK_TTL)
+
+		with patch.dict(frappe.conf, {"renewal_stage_lock_policy": "skip"}):
+			self.assertEqual(update_all_renewal_stages_light()["lock"], "skipped")
+
+	def test_shard_stops_when_lease_lost(self):
+		doc = make_renewal(add_days(today(), -200), add_days(today(), 45))
+		frappe.db.sql(
+			"""update `tabRenewal Tracking` set renewal_stage = null, next_stage_transition = %(today)s
+			where name = %(name)s""",
+			{"name": doc.name, "today": today()},
+		)
+
+		# the run's lease lapsed and another pass holds the lock now
+		run_id = start_job_run("Heavy", getdate(today()))
+		self.addCleanup(self.clear_heavy_run, run_id)
+		frappe.cache.set_value(get_heavy_run_key(run_id, "shards"), 1)
+		frappe.cache.set_value(get_heavy_run_key(run_id, "lock_token"), "lapsed")
+
+		result = run_renewal_stage_shard(today(), "", doc.name, run_id=run_id)
+		self.assertTrue(result["lease_lost"])
+		self.assertIsNone(frappe.db.get_value("Renewal Tracking", doc.name, "renewal_stage"))
+		self.assertEqual(get_shard_checkpoint(run_id, "")["last_name"], "")
+
+	def test_single_update_runs_alongside_job(self):
+		doc = make_renewal(add_days(today(), -10), add_days(today(), 200))
+		with patch(
+			"ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.SINGLE_UPDATE_LOCK_WAIT", 0
+		):
+			self.assertTrue(update_single_renewal_stage(doc.name)["success"])
+
+	def test_single_update_waits_for_same_document(self):
+		doc = make_renewal(add_days(today(), -10), add_days(today(), 200))
+		other = LeaseLock(f"{SINGLE_UPDATE_LOCK}|{doc.name}", ttl=60)
+		self.assertTrue(other.acquire())
+		self.addCleanup(other.release)
+
+		with patch(
+			"ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.SINGLE_UPDATE_LOCK_WAIT", 0
+		):
+			self.assertFalse(update_single_renewal_stage(doc.name)["success"])
+			# a manual update never makes the scheduled jobs skip
+			self.holder.release()
+			with patch.dict(frappe.conf, {"renewal_stage_lock_policy": "skip"}):
+				self.assertNotIn("lock", update_all_renewal_stages_light())
+
+		other.release()
+		self.assertTrue(update_single_renewal_stage(doc.name)["success"])
+
+
+class TestCurrencyResolver(FrappeTestCase):
+	def setUp(self):
+		self.company, self.company_currency = frappe.get_all(
+			"Company", fields=["name", "default_currency"], limit=1, as_list=True
+		)[0]
+		self.currency = "EUR" if self.company_currency == "USD" else "USD"
+		self.exchange = self.make_exchange(today(), 12.5)
+
+	def make_exchange(self, date, exchange_rate):
+		return frappe.get_doc(
+			{
+				"doctype": "Currency Exchange",
+				"date": date,
+				"from_currency": self.currency,
+				"to_currency": self.company_currency,
+				"exchange_rate": exchange_rate,
+				"for_buying": 1,
+				"for_selling": 1,
+			}
+		).insert()
+
+	def tearDown(self):
+		frappe.db.rollback()
+		frappe.cache.delete_value([COMPANY_CURRENCY_CACHE, EXCHANGE_RATE_CACHE])
+
+	def drop_local_cache(self):
+		"""Forget the per-process layer so the next lookup has to go to Redis"""
+		frappe.local.cache.clear()
+
+	def test_warm_cache_makes_no_queries(self):
+		self.assertEqual(get_company_currency(self.company), self.company_currency)
+		self.assertEqual(get_exchange_rate(self.currency, self.company_currency), 12.5)
+
+		with self.assertQueryCount(0):
+			self.assertEqual(get_company_currency(self.company), self.company_currency)
+			self.assertEqual(get_exchange_rate(self.currency, self.company_currency), 12.5)
+			self.drop_local_cache()
+			self.assertEqual(get_company_currency(self.company), self.company_currency)
+			self.assertEqual(get_exchange_rate(self.currency, self.company_currency), 12.5)
+
+	def test_missing_pair_is_cached(self):
+		self.assertIsNone(get_exchange_rate("_T1", self.company_currency))
+		with self.assertQueryCount(0):
+			self.assertIsNone(get_exchange_rate("_T1", self.company_currency))
+
+	def test_bulk_lookup(self):
+		pairs = [
+			(self.currency, self.company_currency),
+			(self.company_currency, self.company_currency),
+			("_T1", self.company_currency),
+		]
+		frappe.cache.delete_value(EXCHANGE_RATE_CACHE)
+
+		with self.assertQueryCount(1):
+			rates = get_exchange_rates(pairs)
+		self.assertEqual(rates, {pairs[0]: 12.5, pairs[1]: 1.0, pairs[2]: None})
+
+	def test_currency_exchange_change_invalidates(self):
+		self.assertEqual(get_exchange_rate(self.currency, self.company_currency), 12.5)
+
+		self.exchange.exchange_rate = 13
+		self.exchange.save()
+		self.assertEqual(get_exchange_rate(self.currency, self.company_currency), 13)
+
+		self.exchange.delete()
+		self.assertIsNone(get_exchange_rate(self.currency, self.company_currency))
+
+	def test_rate_is_effective_on_date(self):
+		self.make_exchange(add_days(today(), -30), 10)
+
+		self.assertEqual(get_exchange_rate(self.currency, self.company_currency), 12.5)
+		self.assertEqual(get_exchange_rate(self.currency, self.company_currency, add_days(today(), -10)), 10)
+		self.assertEqual(get_exchange_rate(self.currency, self.company_currency, add_days(today(), -30)), 10)
+		self.assertIsNone(get_exchange_rate(self.currency, self.company_currency, "1990-01-01"))
+
+	def test_revaluation_updates_draft_renewals(self):
+		items = get_bench_items()[:3]
+		draft = make_renewal(
+			add_days(today(), -10),
+			add_days(today(), 200),
+			submit=False,
+			date=today(),
+			company=self.company,
+			currency=self.currency,
+			exchange_rate=12.5,
+			items=[
+				{"item_code": item.item_code, "qty": i + 1, "rate": 100.555 * (i + 1), "amount": 100.555 * (i + 1) ** 2}
+				for i, item in enumerate(items)
+			],
+		)
+		older = make_renewal(
+			add_days(today(), -10),
+			add_days(today(), 200),
+			submit=False,
+			date="1990-01-01",
+			company=self.company,
+			currency=self.currency,
+			exchange_rate=9,
+		)
+		manual = make_renewal(
+			add_days(today(), -10),
+			add_days(today(), 200),
+			submit=False,
+			date=today(),
+			company=self.company,
+			currency=self.currency,
+			exchange_rate=11,
+		)
+		self.assertEqual(draft.manual_exchange_rate, 0)
+		self.assertEqual(manual.manual_exchange_rate, 1)
+
+		with patch("frappe.enqueue") as enqueue:
+			self.exchange.exchange_rate = 13
+			self.exchange.save()
+		self.assertEqual(enqueue.call_args.kwargs["from_currency"], self.currency)
+
+		self.assertEqual(revalue_draft_renewals(self.currency, self.company_currency), 1)
+		self.assertEqual(revalue_draft_renewals(self.currency, self.company_currency), 0)
+
+		draft.reload()
+		self.assertEqual(draft.exchange_rate, 13)
+		for item in draft.items:
+			self.assertAlmostEqual(item.base_rate, flt(item.rate, 2) * 13, places=6)
+			self.assertAlmostEqual(item.base_amount, flt(item.amount, 2) * 13, places=6)
+		self.assertAlmostEqual(draft.net_total_base, sum(flt(item.base_amount, 2) for item in draft.items), places=2)
+
+		# dated before every entry of the pair, so no rate is effective for it
+		self.assertEqual(frappe.db.get_value("Renewal Tracking", older.name, "exchange_rate"), 9)
+		# entered by hand, so kept
+		self.assertEqual(frappe.db.get_value("Renewal Tracking", manual.name, "exchange_rate"), 11)
+
+	def test_company_change_invalidates(self):
+		self.assertEqual(get_company_currency(self.company), self.company_currency)
+
+		frappe.db.set_value("Company", self.company, "default_currency", self.currency)
+		self.assertEqual(get_company_currency(self.company), self.company_currency)
+
+		self.assertIn(
+			"ostec_native.utils.currency.clear_company_currency_cache",
+			frappe.get_hooks("doc_events")["Company"]["on_update"],
+		)
+		clear_company_currency_cache(frappe.get_doc("Company", self.company))
+		self.assertEqual(get_company_currency(self.company), self.currency)
+
+
+class TestItemImport(FrappeTestCase):
+	def make_file(self, extension, rows):
+		file_name = f"_test-renewal-items.{extension}"
+		path = make_items_file(frappe.get_site_path("private", "files", file_name), rows)
+		self.addCleanup(os.remove, path)
+		self.addCleanup(clear_import_pages, path)
+		return f"/private/files/{file_name}"
+
+	def test_csv_and_xlsx_read_the_same_items(self):
+		csv_items = import_items(self.make_file("csv", 30), None)
+		xlsx_items = import_items(self.make_file("xlsx", 30), None)
+
+		self.assertEqual(len(csv_items), 30)
+		self.assertEqual(
+			[(item["item_code"], item["qty"], item["rate"]) for item in csv_items],
+			[(item["item_code"], item["qty"], item["rate"]) for item in xlsx_items],
+		)
+		self.assertEqual(set(csv_items[0]), set(IMPORT_COLUMNS.values()))
+
+	def test_pages_cover_every_row_once(self):
+		for extension in ("csv", "xlsx"):
+			file_url = self.make_file(extension, 25)
+			items = []
+			start = 0
+			while start is not None:
+				page = import_items_page(file_url, start, page_length=7)
+				self.assertLessEqual(len(page["items"]), 7)
+				items.extend(page["items"])
+				start = page["next_start"]
+
+			self.assertEqual(items, import_items(file_url, None))
+
+	def test_pages_read_the_file_once(self):
+		for extension in ("csv", "xlsx"):
+			file_url = self.make_file(extension, 25)
+			with patch.object(item_import, "iter_file_rows", wraps=item_import.iter_file_rows) as iter_file_rows:
+				start = 0
+				while start is not None:
+					start = import_items_page(file_url, start, page_length=7)["next_start"]
+			self.assertEqual(iter_file_rows.call_count, 1)
+
+	def test_page_length_is_bounded(self):
+		file_url = self.make_file("csv", 25)
+		with patch(
+			"ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking.IMPORT_PAGE_LENGTH", 10
+		):
+			page = import_items_page(file_url, 0, page_length=10**9)
+			self.assertEqual(len(page["items"]), 10)
+
+			# one response holds at most a page
+			self.assertRaises(frappe.ValidationError, import_items, file_url, None)
+		self.assertEqual(len(import_items(file_url, None)), 25)
+
+	def test_masters_resolved_in_constant_queries(self):
+		file_url = self.make_file("csv", 600)
+		# the file lookup, Item, Item Group and UOM, Brand is empty in generated files
+		with self.assertQueryCount(4):
+			items = import_items(file_url, None)
+		self.assertEqual(len(items), 600)
+
+	def test_rows_checked_against_masters(self):
+		item = get_bench_items()[0]
+		file_name = "_test-renewal-items-masters.csv"
+		path = frappe.get_site_path("private", "files", file_name)
+		with open(path, "w", newline="") as f:
+			writer = csv.writer(f)
+			writer.writerow(["Item Code", "Item Name", "Brand", "UOM", "Qty", "Rate"])
+			writer.writerow([item.item_code.lower(), "", "", "", 2, 10])
+			writer.writerow(["_Test Unknown Item", "", "", "", 1, 1])
+			writer.writerow([item.item_code, "Own name", "_Test Unknown Brand", "", 1, 1])
+		self.addCleanup(os.remove, path)
+
+		page = import_items_page(f"/private/files/{file_name}")
+		self.assertEqual(len(page["items"]), 1)
+		self.assertEqual(page["items"][0]["item_code"], item.item_code)
+		self.assertEqual(page["items"][0]["item_name"], item.item_name)
+		self.assertEqual(page["items"][0]["oum"], item.stock_uom)
+
+		self.assertEqual(
+			[(error["row"], error["field"]) for error in page["errors"]], [(3, "item_code"), (4, "brand")]
+		)
+		self.assertRaises(frappe.ValidationError, import_items, f"/private/files/{file_name}", None)
+
+
+class TestRenewalImport(FrappeTestCase):
+	def tearDown(self):
+		# import_renewals commits every chunk
+		delete_imported_renewals()
+
+	def make_file(self, rows):
+		file_name = "_test-renewals.csv"
+		path = frappe.get_site_path("private", "files", file_name)
+		with open(path, "w", newline="") as f:
+			writer = csv.writer(f)
+			writer.writerow([*RENEWAL_IMPORT_HEADERS, "Item Code", "Qty", "Rate"])
+			writer.writerows(rows)
+		self.addCleanup(os.remove, path)
+		return f"/private/files/{file_name}"
+
+	def get_imported(self):
+		return frappe.get_all(
+			"Renewal Tracking",
+			filters={"external_key": ("like", f"{BENCH_PREFIX}%")},
+			fields=["name", "external_key", "docstatus"],
+			order_by="name",
+		)
+
+	def test_imported_renewals_match_a_save(self):
+		file_name = "_test-renewals-generated.csv"
+		path = make_renewals_file(frappe.get_site_path("private", "files", file_name), 12, items_per_renewal=60)
+		self.addCleanup(os.remove, path)
+
+		summary = import_renewals(f"/private/files/{file_name}", chunk_size=5)
+		self.assertEqual((summary.renewals, summary.items, summary.failed), (12, 720, 0))
+
+		imported = self.get_imported()
+		self.assertEqual(len(imported), 12)
+		# one series block per chunk, so the numbers follow on
+		numbers = [cint(row.name.rsplit("-", 1)[-1]) for row in imported]
+		self.assertEqual(numbers, list(range(numbers[0], numbers[0] + 12)))
+
+		def line_values(doc):
+			# Currency columns keep 9 decimals, so compare past the float noise
+			return [
+				(item.idx, flt(item.amount, 6), flt(item.base_rate, 6), flt(item.base_amount, 6)) for item in doc.items
+			]
+
+		for row in imported:
+			doc = frappe.get_doc("Renewal Tracking", row.name)
+			stored = line_values(doc)
+			stored_totals = (flt(doc.net_total), flt(doc.net_total_base))
+			stored_stage = (doc.renewal_stage, doc.next_stage_transition)
+
+			doc.calculate_values()
+			self.assertEqual(stored, line_values(doc))
+			self.assertAlmostEqual(stored_totals[0], flt(doc.net_total), places=2)
+			self.assertAlmostEqual(stored_totals[1], flt(doc.net_total_base), places=2)
+			self.assertEqual(stored_stage, (doc.renewal_stage, doc.next_stage_transition))
+			self.assertTrue(frappe.db.exists("Renewal Stage Event", {"renewal_tracking": row.name, "source": "Save"}))
+
+	def test_invalid_renewals_left_out_and_rerun_skips(self):
+		item = get_bench_items()[0]
+		company = frappe.get_all("Company", pluck="name", limit=1)[0]
+		start, end = add_days(today(), -10), add_days(today(), 300)
+
+		def row(key, item_code=item.item_code, license_end=end):
+			return [f"{BENCH_PREFIX}{key}", f"Renewal {key}", start, license_end, company, "", "", item_code, 2, 10]
+
+		file_url = self.make_file(
+			[
+				row("A"),
+				row("A"),
+				row("B", item_code="_Test Unknown Item"),
+				row("B"),
+				row("C", license_end=add_days(start, -1)),
+				row("D"),
+				row("A"),
+			]
+		)
+
+		summary = import_renewals(file_url)
+		self.assertEqual((summary.renewals, summary.items, summary.failed), (2, 3, 3))
+		self.assertEqual(
+			sorted((error["renewal_key"], error["field"]) for error in summary.errors),
+			[
+				(f"{BENCH_PREFIX}A", "external_key"),
+				(f"{BENCH_PREFIX}B", "item_code"),
+				(f"{BENCH_PREFIX}C", "license_end"),
+			],
+		)
+		self.assertEqual(
+			[row.external_key for row in self.get_imported()], [f"{BENCH_PREFIX}A", f"{BENCH_PREFIX}D"]
+		)
+
+		rerun = import_renewals(file_url)
+		self.assertEqual((rerun.renewals, rerun.skipped), (0, 2))
+		self.assertEqual(len(self.get_imported()), 2)
+
+	def test_auto_submit(self):
+		item = get_bench_items()[0]
+		company = frappe.get_all("Company", pluck="name", limit=1)[0]
+		start, end = add_days(today(), -10), add_days(today(), 300)
+		file_url = self.make_file([[f"{BENCH_PREFIX}S", "Submitted", start, end, company, "", "", item.item_code, 1, 5]])
+
+		summary = import_renewals(file_url, submit=True)
+		self.assertEqual(summary.renewals, 1)
+
+		name = self.get_imported()[0].name
+		self.assertEqual(frappe.db.get_value("Renewal Tracking", name, "docstatus"), 1)
+		self.assertEqual(frappe.get_all("Renewal Tracking Item", filters={"parent": name}, pluck="docstatus"), [1])
+		self.assertEqual(
+			frappe.get_all("Renewal Stage Event", filters={"renewal_tracking": name}, pluck="source"), ["Submit"]
+		)
+
+	def test_series_names_reserved_in_one_block(self):
+		self.addCleanup(frappe.db.delete, "Series", {"name": "_TST-RI-"})
+		self.assertEqual(reserve_series_names("_TST-RI-.####", 3), ["_TST-RI-0001", "_TST-RI-0002", "_TST-RI-0003"])
+		self.assertEqual(reserve_series_names("_TST-RI-.####", 2), ["_TST-RI-0004", "_TST-RI-0005"])
+		self.assertEqual(frappe.db.get_value("Series", "_TST-RI-", "current", order_by="name"), 5)
+
+
+class TestRenewalExport(FrappeTestCase):
+	def setUp(self):
+		items = get_bench_items()
+		self.renewals = [
+			make_renewal(
+				add_days(today(), -10),
+				add_days(today(), 300),
+				submit=False,
+				items=[
+					{"item_code": item.item_code, "description": "<p>Line, with comma</p>", "qty": 2, "rate": 10.5}
+					for item in items[:count]
+				],
+			)
+			for count in (3, 2, 0)
+		]
+		self.filters = [["Renewal Tracking", "name", "in", [doc.name for doc in self.renewals]]]
+		# export_renewals reads through its own connection, which only sees committed rows
+		frappe.db.commit()
+
+	def tearDown(self):
+		for doc in self.renewals:
+			frappe.db.delete("Renewal Stage Event", {"renewal_tracking": doc.name})
+			frappe.db.delete("Renewal Tracking Item", {"parent": doc.name})
+			frappe.db.delete("Renewal Tracking", {"name": doc.name})
+		frappe.db.commit()
+
+	def read_response(self, response):
+		return b"".join(response.response)
+
+	def test_csv_export_streams_matching_rows(self):
+		renewals = list(csv.reader(io.StringIO(self.read_response(export_renewals(self.filters)).decode())))
+		self.assertEqual(renewals[0][0], "ID")
+		self.assertEqual(sorted(row[0] for row in renewals[1:]), sorted(doc.name for doc in self.renewals))
+
+		items = list(
+			csv.reader(
+				io.StringIO(
+					self.read_response(export_renewals(self.filters, doctype="Renewal Tracking Item")).decode()
+				)
+			)
+		)
+		self.assertEqual(items[0], ["Renewal Tracking", *ITEM_EXPORT_COLUMNS])
+		# renewals without items have no rows, items follow their idx
+		self.assertEqual(
+			[(row[0], row[1]) for row in items[1:]],
+			[(doc.name, item.item_code) for doc in sorted(self.renewals, key=lambda doc: doc.name) for item in doc.items],
+		)
+		self.assertEqual(items[1][3], "Line, with comma")
+
+	def test_excel_export_matches_csv(self):
+		import openpyxl
+
+		response = export_renewals(self.filters, doctype="Renewal Tracking Item", file_format="Excel")
+		sheet = openpyxl.load_workbook(io.BytesIO(self.read_response(response)), read_only=True).active
+		excel_rows = [[value for value in row] for row in sheet.iter_rows(values_only=True)]
+
+		csv_rows = list(
+			csv.reader(
+				io.StringIO(
+					self.read_response(export_renewals(self.filters, doctype="Renewal Tracking Item")).decode()
+				)
+			)
+		)
+		self.assertEqual(len(excel_rows), len(csv_rows))
+		self.assertEqual([row[1] for row in excel_rows], [row[1] for row in csv_rows])
+
+	def test_export_to_file(self):
+		file_url = export_renewals_to_file(self.filters, doctype="Renewal Tracking Item")
+		self.addCleanup(frappe.delete_doc, "File", frappe.db.get_value("File", {"file_url": file_url}))
+
+		with open(frappe.get_site_path(file_url.lstrip("/"))) as f:
+			self.assertEqual(len(list(csv.reader(f))), 6)
+
+	def test_export_outlives_request_connection(self):
+		response = export_renewals(self.filters)
+		# the server may close frappe.db before it iterates the body
+		frappe.db.close()
+		try:
+			renewals = list(csv.reader(io.StringIO(self.read_response(response).decode())))
+		finally:
+			frappe.db.connect()
+		self.assertEqual(sorted(row[0] for row in renewals[1:]), sorted(doc.name for doc in self.renewals))
+
+	def test_enqueue_export_deduplicates(self):
+		with patch("frappe.enqueue") as enqueue:
+			job_id = enqueue_renewal_export(self.filters, doctype="Renewal Tracking Item")
+			self.assertEqual(enqueue_renewal_export(self.filters, doctype="Renewal Tracking Item"), job_id)
+			self.assertNotEqual(enqueue_renewal_export(self.filters), job_id)
+			self.assertNotEqual(enqueue_renewal_export(self.filters[:0], doctype="Renewal Tracking Item"), job_id)
+
+		self.assertEqual(enqueue.call_args_list[0].kwargs["job_id"], job_id)
+		self.assertTrue(enqueue.call_args_list[0].kwargs["deduplicate"])
+
+	def test_unknown_doctype_rejected(self):
+		self.assertRaises(frappe.ValidationError, export_renewals, None, "User")
+
+
+class TestRenewalMapping(FrappeTestCase):
+	def setUp(self):
+		customer = frappe.get_all("Customer", pluck="name", limit=1)[0]
+		items = get_bench_items()[:3]
+		self.renewals = [
+			make_renewal(
+				add_days(today(), -200),
+				add_days(today(), 45),
+				customer=customer,
+				items=[{"item_code": item.item_code, "qty": 2, "rate": 10.5} for item in items],
+			),
+			make_renewal(
+				add_days(today(), -200),
+				add_days(today(), 50),
+				customer=customer,
+				items=[{"item_code": items[0].item_code, "qty": 1, "rate": 99}],
+			),
+			# no customer, so no party for the Quotation
+			make_renewal(add_days(today(), -200), add_days(today(), 55)),
+		]
+		self.names = [doc.name for doc in self.renewals]
+		frappe.db.commit()
+
+	def tearDown(self):
+		for name in frappe.get_all("Quotation", filters={"renewal_tracking": ("in", self.names)}, pluck="name"):
+			frappe.delete_doc("Quotation", name, force=True, ignore_permissions=True)
+		for name in self.names:
+			frappe.db.delete("Renewal Stage Event", {"renewal_tracking": name})
+			frappe.db.delete("Renewal Tracking Item", {"parent": name})
+			frappe.db.delete("Renewal Tracking", {"name": name})
+		frappe.db.commit()
+
+	def test_compiled_mapping_matches_get_mapped_doc(self):
+		from frappe.model.mapper import get_mapped_doc
+
+		# enough rows to repeat items, so fetched values are shared between rows
+		items = get_bench_items()[:5]
+		large = make_renewal(
+			add_days(today(), -200),
+			add_days(today(), 80),
+			submit=False,
+			items=[
+				{"item_code": items[index % len(items)].item_code, "qty": index + 1, "rate": 1.25 * index}
+				for index in range(60)
+			],
+		)
+		self.names.append(large.name)
+		frappe.db.commit()
+
+		sources = get_renewal_sources(self.names)
+		for target_doctype, make in (
+			("Quotation", make_quotation),
+			("Supplier Quotation", make_supplier_quotation),
+			("Request for Quotation", make_request_for_quotation),
+		):
+			for name in self.names:
+				expected = get_mapped_doc(
+					"Renewal Tracking",
+					name,
+					RENEWAL_TABLE_MAPS[target_doctype],
+					None,
+					SET_MISSING_VALUES[target_doctype],
+				).as_dict(no_default_fields=True)
+				self.assertEqual(make(name).as_dict(no_default_fields=True), expected)
+				self.assertEqual(
+					map_renewal(sources[name], target_doctype, ignore_permissions=True).as_dict(
+						no_default_fields=True
+					),
+					expected,
+				)
+
+	def test_mapping_plan_kept_until_meta_changes(self):
+		plan = get_mapping_plan("Quotation")
+		self.assertIs(get_mapping_plan("Quotation"), plan)
+
+		frappe.clear_cache(doctype="Quotation Item")
+		self.assertIsNot(get_mapping_plan("Quotation"), plan)
+
+	def test_sources_read_in_two_queries(self):
+		get_renewal_sources(self.names[:1])
+		with self.assertQueryCount(2):
+			sources = get_renewal_sources(self.names)
+
+		def values(doc):
+			return (
+				doc.customer,
+				doc.company,
+				doc.currency,
+				doc.exchange_rate,
+				[(item.name, item.idx, item.item_code, item.qty, item.rate, item.amount) for item in doc.items],
+			)
+
+		for name in self.names:
+			self.assertEqual(values(sources[name]), values(frappe.get_doc("Renewal Tracking", name)))
+
+	def test_batch_reports_created_and_failed_and_skips_linked(self):
+		summary = make_documents_for_renewals("Quotation", names=self.names, chunk_size=2)
+
+		self.assertEqual([row["renewal_tracking"] for row in summary.created], self.names[:2])
+		self.assertEqual([row["renewal_tracking"] for row in summary.failed], self.names[2:])
+		self.assertEqual(summary.skipped, 0)
+		for row, doc in zip(summary.created, self.renewals):
+			quotation = frappe.get_doc("Quotation", row["name"])
+			self.assertEqual((quotation.docstatus, quotation.renewal_tracking), (0, doc.name))
+			self.assertEqual(quotation.party_name, doc.customer)
+			self.assertEqual([item.item_code for item in quotation.items], [item.item_code for item in doc.items])
+
+		# the failed renewal is tried again, the ones with a quotation are not
+		summary = make_documents_for_renewals("Quotation", names=self.names)
+		self.assertEqual(summary.created, [])
+		self.assertEqual(summary.skipped, 2)
+		self.assertEqual([row["renewal_tracking"] for row in summary.failed], self.names[2:])
+
+	def test_chunk_queries_grow_by_a_constant_per_renewal(self):
+		items = [{"item_code": item.item_code, "qty": item.qty, "rate": item.rate} for item in self.renewals[0].items]
+		names = [
+			make_renewal(
+				add_days(today(), -200), add_days(today(), 45), customer=self.renewals[0].customer, items=items
+			).name
+			for _ in range(8)
+		]
+		self.names.extend(names)
+
+		def make_chunk(chunk):
+			summary = frappe._dict(created=[], failed=[], skipped=0)
+			make_documents_for_chunk("Quotation", chunk, summary)
+			self.assertEqual(len(summary.created), len(chunk))
+
+		def count_queries(chunk):
+			with patch.object(type(frappe.db), "sql", autospec=True, side_effect=type(frappe.db).sql) as sql:
+				make_chunk(chunk)
+			return sql.call_count
+
+		# the first Quotation loads the metas and caches the others reuse
+		make_chunk(names[:1])
+		one = count_queries(names[1:2])
+		per_renewal = count_queries(names[2:4]) - one
+		self.assertGreater(per_renewal, 0)
+
+		with self.assertQueryCount(one + 3 * per_renewal):
+			make_chunk(names[4:8])
+
+	def test_milestone_quotations_drafted_once(self):
+		def enter_milestone(name, as_of):
+			record_stage_events(
+				[{"name": name, "old_stage": "Running", "new_stage": QUOTATION_MILESTONE_STAGE, "days_remaining": 90}],
+				"Heavy",
+				as_of=as_of,
+			)
+
+		enter_milestone(self.names[0], today())
+		# before the lookback window
+		enter_milestone(self.names[1], add_days(today(), -30))
+
+		def get_fixture_milestone_renewals(as_of):
+			# the site may hold other renewals at the milestone, quotations are only drafted for the fixtures
+			return [name for name in get_milestone_renewals(as_of) if name in self.names]
+
+		with patch.object(renewal_mapping, "get_milestone_renewals", get_fixture_milestone_renewals):
+			summary = draft_milestone_quotations()
+			self.assertEqual([row["renewal_tracking"] for row in summary.created], self.names[:1])
+			self.assertEqual(
+				frappe.db.get_value("Quotation", summary.created[0]["name"], ["docstatus", "party_name"]),
+				(0, self.renewals[0].customer),
+			)
+
+			summary = draft_milestone_quotations()
+			self.assertEqual((summary.created, summary.skipped), ([], 1))
+		self.assertEqual(frappe.db.count("Quotation", {"renewal_tracking": self.names[0]}), 1)
+
+	def test_supplier_needed_for_supplier_documents(self):
+		self.assertRaises(frappe.ValidationError, make_documents_for_renewals, "Supplier Quotation", names=[])
+
+
+class TestBenchmarkDataset(FrappeTestCase):
+	def tearDown(self):
+		delete_renewal_dataset()
+
+	def test_dataset_rows_match_document_logic(self):
+		summary = make_renewal_dataset(documents=25, max_items=5, batch_size=10)
+		self.assertEqual(summary["documents"], 25)
+
+		rows = frappe.get_all(
+			"Renewal Tracking",
+			filters={"name": ("like", f"{BENCH_PREFIX}%")},
+			fields=["name", "docstatus", "license_start", "license_end", "renewal_stage", "next_stage_transition"],
+		)
+		self.assertEqual(len(rows), 25)
+
+		item_counts = dict(
+			frappe.db.sql(
+				"""select parent, count(*) from `tabRenewal Tracking Item`
+				where parent like %s group by parent""",
+				f"{BENCH_PREFIX}%",
+			)
+		)
+		self.assertEqual(sum(item_counts.values()), summary["items"])
+
+		for row in rows:
+			self.assertEqual(row.docstatus, 1)
+			self.assertTrue(1 <= item_counts[row.name] <= 5)
+			stage, next_transition, _ = reference_renewal_stage(row.license_start, row.license_end, today())
+			self.assertEqual((row.renewal_stage, row.next_stage_transition), (stage, next_transition))
+
+			doc = frappe.get_doc("Renewal Tracking", row.name)
+			self.assertAlmostEqual(flt(doc.net_total), sum(item.amount for item in doc.items), places=2)
+
+
+class TestRenewalTrackingQueryPlans(FrappeTestCase):
+	"""EXPLAIN the scheduler and list view query shapes on a 10k-row table"""
+
+	# enough rows for the planner to prefer the indexes over scanning
+	fixture_rows = 10_000
+	name_prefix = "_TEST-PLAN-"
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		on_doctype_update()
+
+		rng = random.Random(7)
+		now = getdate(today())
+		stages = ["Open", "Running", "90 Days to Expiry", "60 Days to Expiry", "30 Days to Expiry", "Expired"]
+		fields = [
+			"name",
+			"creation",
+			"modified",
+			"modified_by",
+			"owner",
+			"docstatus",
+			"naming_series",
+			"renewal_title",
+			"license_start",
+			"license_end",
+			"renewal_stage",
+			"next_stage_transition",
+		]
+		values = []
+		for i in range(cls.fixture_rows):
+			license_start = add_days(now, rng.randint(-1000, 200))
+			modified = add_days(now, -rng.randint(1, 900))
+			values.append(
+				(
+					f"{cls.name_prefix}{i:06d}",
+					modified,
+					modified,
+					"Administrator",
+					"Administrator",
+					1 if rng.random() < 0.9 else rng.choice((0, 2)),
+					"REN-ORD-.YYYY.-",
+					"_Test Plan Renewal",
+					license_start,
+					add_days(license_start, rng.randint(30, 1100)),
+					rng.choice(stages),
+					add_days(now, rng.randint(1, 1000)),
+				)
+			)
+
+		# a realistic handful of rows due today
+		for i in range(0, cls.fixture_rows, 200):
+			values[i] = (*values[i][:-1], now)
+
+		# registered first, so the rows go even when the rest of setUpClass fails
+		cls.addClassCleanup(cls.delete_fixture_rows)
+		frappe.db.bulk_insert("Renewal Tracking", fields, values)
+		# ANALYZE implicitly commits the fixture rows
+		frappe.db.sql("ANALYZE TABLE `tabRenewal Tracking`")
+
+	@classmethod
+	def delete_fixture_rows(cls):
+		frappe.db.rollback()
+		frappe.db.delete("Renewal Tracking", {"name": ("like", f"{cls.name_prefix}%")})
+		frappe.db.commit()
+
+	def assertNoFullTableScan(self, query, values=None, max_rows=None):
+		"""
+		No step reads the whole table, by a table scan (ALL) or a walk of a
+		whole index (index) over more than 1% of the rows. With max_rows,
+		no step may read more rows than that by any access type
+		"""
+		small = self.fixture_rows // 100
+		for step in frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True):
+			# derived tables and UNION results are small temp tables read in full, that's fine
+			if (step.table or "").startswith("<"):
+				continue
+			rows = cint(step.rows)
+			self.assertFalse(
+				step.type in ("ALL", "index") and rows > small,
+				msg=f"{step.type} scan of {rows} rows on {step.table} ({step.key}): {query}",
+			)
+			if max_rows is not None:
+				self.assertLessEqual(rows, max_rows, msg=f"{step.type} on {step.table} ({step.key}): {query}")
+
+	def test_heavy_job_uses_index(self):
+		self.assertNoFullTableScan(
+			get_renewal_page_query(DUE_RENEWAL_CONDITIONS),
+			{"as_of": getdate(today()), "start_after": "", "page_size": 1000},
+		)
+
+	def test_light_job_uses_index(self):
+		# the query the job runs, on its first page and on a later one
+		for start_after in ("", f"{self.name_prefix}005000"):
+			self.assertNoFullTableScan(
+				LIGHT_JOB_PAGE_QUERY,
+				{"as_of": getdate(today()), "start_after": start_after, "page_size": 200},
+				max_rows=self.fixture_rows // 100,
+			)
+
+	def test_list_view_uses_index(self):
+		self.assertNoFullTableScan(
+			"select name from `tabRenewal Tracking` order by modified desc limit 20"
+		)
+		self.assertNoFullTableScan(
+			"""select name from `tabRenewal Tracking`
+			where renewal_stage = '30 Days to Expiry' order by modified desc limit 20"""
+		)
+		self.assertNoFullTableScan(
+			"select name from `tabRenewal Tracking` order by license_end asc limit 20"
+		)
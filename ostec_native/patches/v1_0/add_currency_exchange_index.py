@@ -0,0 +1,5 @@
+from ostec_native.utils.currency import add_currency_exchange_index
+
+
+def execute():
+	add_currency_exchange_index()
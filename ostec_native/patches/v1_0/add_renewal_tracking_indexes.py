@@ -0,0 +1,5 @@
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import on_doctype_update
+
+
+def execute():
+	on_doctype_update()
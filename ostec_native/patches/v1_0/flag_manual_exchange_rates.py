@@ -0,0 +1,20 @@
+import frappe
+from frappe.utils import today
+
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import EFFECTIVE_EXCHANGE_RATE_SQL
+
+
+def execute():
+	# drafts whose rate is not the effective Currency Exchange rate were entered by hand
+	frappe.db.sql(
+		f"""
+		UPDATE `tabRenewal Tracking` rt
+		INNER JOIN `tabCompany` c ON c.name = rt.company
+		SET rt.manual_exchange_rate = 1
+		WHERE rt.docstatus = 0
+			AND rt.currency != c.default_currency
+			AND rt.exchange_rate > 0
+			AND NOT rt.exchange_rate <=> ({EFFECTIVE_EXCHANGE_RATE_SQL})
+		""",
+		{"today": today()},
+	)
@@ -0,0 +1,24 @@
+import frappe
+
+from ostec_native.ostec_native.doctype.renewal_tracking.renewal_tracking import write_renewal_stages
+
+
+def execute():
+	last_name = ""
+	while True:
+		rows = frappe.db.sql(
+			"""
+			SELECT name, renewal_stage, next_stage_transition, license_start, license_end
+			FROM `tabRenewal Tracking`
+			WHERE docstatus < 2 AND name > %(last_name)s
+			ORDER BY name
+			LIMIT 1000
+			""",
+			{"last_name": last_name},
+			as_dict=True,
+		)
+		if not rows:
+			break
+
+		write_renewal_stages(rows)
+		last_name = rows[-1].name
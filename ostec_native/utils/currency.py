@@ -0,0 +1,199 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Cached company currency and exchange rate lookups.
+
+Company -> default currency and (from, to, date) -> exchange rate are kept
+in Redis hashes. frappe.cache.hget/hset also keep every value in
+frappe.local.cache, so a request or background job asks Redis at most
+once per key and the database only on a miss. Missing currency pairs are
+cached as 0 so they do not hit the database on every save either.
+
+The rate for a date is the latest Currency Exchange entry of the pair
+dated on or before it, read through the (from_currency, to_currency,
+date) index added by add_currency_exchange_index.
+
+The doc_events in hooks.py drop the cached values whenever a Company or a
+Currency Exchange changes.
+"""
+
+import pickle
+
+import frappe
+from frappe.utils import cstr, flt, getdate, today
+
+COMPANY_CURRENCY_CACHE = "ostec_company_currency"
+EXCHANGE_RATE_CACHE = "ostec_exchange_rates"
+
+CURRENCY_EXCHANGE_INDEX = ("from_currency", "to_currency", "date")
+
+
+def get_exchange_rate_key(from_currency, to_currency, date=None):
+	return f"{from_currency}|{to_currency}|{getdate(date or today())}"
+
+
+def get_company_currency(company):
+	"""Default currency of company, None when the company does not exist"""
+	if not company:
+		return None
+	return get_company_currencies([company]).get(company)
+
+
+def get_company_currencies(companies):
+	"""{company: default currency} for many companies, one query for every uncached one"""
+	return get_cached_values(COMPANY_CURRENCY_CACHE, set(filter(None, companies)), query_company_currencies)
+
+
+def get_exchange_rate(from_currency, to_currency, date=None):
+	"""
+	Rate converting from_currency into to_currency effective on date
+	(default today), 1 for the same currency and None when the pair has no
+	Currency Exchange entry on or before date
+	"""
+	if not from_currency or not to_currency:
+		return None
+	if from_currency == to_currency:
+		return 1.0
+	return get_exchange_rates([(from_currency, to_currency)], date).get((from_currency, to_currency))
+
+
+def get_exchange_rates(pairs, date=None):
+	"""
+	{(from, to): rate} for many currency pairs at once, pairs missing from
+	Currency Exchange map to None. Uncached pairs are read with one query
+	"""
+	pairs = {(from_currency, to_currency) for from_currency, to_currency in pairs if from_currency and to_currency}
+	keys = {get_exchange_rate_key(*pair, date): pair for pair in pairs if pair[0] != pair[1]}
+
+	rates = get_cached_values(
+		EXCHANGE_RATE_CACHE, keys, lambda missing: query_exchange_rates([keys[key] for key in missing], date)
+	)
+
+	result = {pair: 1.0 for pair in pairs if pair[0] == pair[1]}
+	for key, pair in keys.items():
+		result[pair] = flt(rates.get(key)) or None
+	return result
+
+
+def get_cached_values(cache_name, keys, query):
+	"""
+	Values of keys in the cache_name hash, frappe.local.cache first, then
+	one HMGET to Redis, then query(missing keys) -> {key: value} for the
+	rest, which are written back to both layers
+	"""
+	if not keys:
+		return {}
+
+	local = frappe.local.cache.setdefault(frappe.cache.make_key(cache_name), {})
+	values = {key: local[key] for key in keys if key in local}
+
+	missing = [key for key in keys if key not in values]
+	if missing:
+		cached = frappe.cache.hmget(frappe.cache.make_key(cache_name), missing)
+		for key, value in zip(missing, cached):
+			if value is not None:
+				values[key] = local[key] = pickle.loads(value)
+
+	missing = [key for key in missing if key not in values]
+	if missing:
+		found = query(missing)
+		for key in missing:
+			values[key] = found.get(key, 0)
+			frappe.cache.hset(cache_name, key, values[key])
+
+	return values
+
+
+def query_company_currencies(companies):
+	return dict(
+		frappe.get_all(
+			"Company",
+			filters={"name": ("in", companies)},
+			fields=["name", "default_currency"],
+			as_list=True,
+		)
+	)
+
+
+def query_exchange_rates(pairs, date=None):
+	"""
+	{exchange rate key: rate} for pairs, from the latest entry of each pair
+	dated on or before date. Of several entries on that date the most
+	recently modified one wins
+	"""
+	if not pairs:
+		return {}
+
+	# The inner MAX(date) per pair is a range read on CURRENCY_EXCHANGE_INDEX
+	rows = frappe.db.sql(
+		"""
+		SELECT ce.from_currency, ce.to_currency, ce.exchange_rate
+		FROM `tabCurrency Exchange` ce
+		INNER JOIN (
+			SELECT from_currency, to_currency, MAX(`date`) AS `date`
+			FROM `tabCurrency Exchange`
+			WHERE from_currency IN %(from_currencies)s
+				AND to_currency IN %(to_currencies)s
+				AND `date` <= %(date)s
+			GROUP BY from_currency, to_currency
+		) latest
+			ON latest.from_currency = ce.from_currency
+			AND latest.to_currency = ce.to_currency
+			AND latest.`date` = ce.`date`
+		ORDER BY ce.modified DESC
+		""",
+		{
+			"from_currencies": tuple({pair[0] for pair in pairs}),
+			"to_currencies": tuple({pair[1] for pair in pairs}),
+			"date": getdate(date or today()),
+		},
+		as_dict=True,
+	)
+
+	wanted = set(pairs)
+	rates = {}
+	for row in rows:
+		pair = (row.from_currency, row.to_currency)
+		key = get_exchange_rate_key(*pair, date)
+		if pair in wanted and key not in rates:
+			rates[key] = flt(row.exchange_rate)
+	return rates
+
+
+def add_currency_exchange_index():
+	"""Index Currency Exchange on CURRENCY_EXCHANGE_INDEX unless an index already leads with it"""
+	existing = {}
+	for index in frappe.db.sql("SHOW INDEX FROM `tabCurrency Exchange`", as_dict=True):
+		existing.setdefault(index.Key_name, []).append(index.Column_name)
+
+	if any(tuple(columns[: len(CURRENCY_EXCHANGE_INDEX)]) == CURRENCY_EXCHANGE_INDEX for columns in existing.values()):
+		return
+	frappe.db.add_index("Currency Exchange", list(CURRENCY_EXCHANGE_INDEX), "from_currency_to_currency_date_index")
+
+
+def clear_company_currency_cache(doc, method=None):
+	"""doc_event on Company, forget its cached default currency"""
+	frappe.cache.hdel(COMPANY_CURRENCY_CACHE, doc.name)
+
+
+def clear_exchange_rate_cache(doc=None, method=None):
+	"""
+	doc_event on Currency Exchange, forget every cached rate
+
+	A new entry can change the effective rate of any cached date, so the
+	whole hash goes rather than the one pair
+	"""
+	frappe.cache.delete_value(EXCHANGE_RATE_CACHE)
+
+
+@frappe.whitelist()
+def get_currency_conversion(company, currency, date=None):
+	"""Company currency and the rate from currency into it, for the Renewal Tracking form"""
+	frappe.has_permission("Renewal Tracking", "read", throw=True)
+
+	company_currency = get_company_currency(company)
+	return {
+		"company_currency": company_currency,
+		"exchange_rate": get_exchange_rate(cstr(currency), company_currency, date),
+	}
@@ -0,0 +1,164 @@
+# Copyright (c) 2026, Richmond Gedziq and contributors
+# For license information, please see license.txt
+
+"""
+Redis lease locks for background jobs that must not overlap.
+
+A lease is a key set with NX and a TTL, holding a random owner token. The
+holder renews it with heartbeats while it makes progress. A holder that
+dies simply lets the lease expire instead of blocking the next run
+forever. Only the owner token can renew or release the lease, so a job
+whose lease expired cannot release the lock of the job that took over.
+
+Callers that find the lock held can skip, wait for it, or hand off: the
+hand-off registers a method that the holder enqueues when it releases.
+"""
+
+import json
+import time
+
+import frappe
+
+LOCK_POLICIES = ("skip", "wait", "handoff")
+
+DEFAULT_LEASE_TTL = 15 * 60
+
+# KEYS[1] lock key, ARGV[1] owner token, ARGV[2] ttl in milliseconds
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+	return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] lock key, ARGV[1] owner token
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+	return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LockHeldError(frappe.ValidationError):
+	pass
+
+
+class LeaseLostError(frappe.ValidationError):
+	pass
+
+
+class LeaseLock:
+	"""
+	Lease lock on name, owned by token
+
+	Pass the token of an existing holder to renew or release its lease
+	from another process, e.g. a later shard of the same job
+	"""
+
+	def __init__(self, name, ttl=DEFAULT_LEASE_TTL, token=None):
+		self.name = name
+		self.ttl = ttl
+		self.token = token or frappe.generate_hash(length=16)
+		# seconds spent in acquire(), for lock-wait metrics
+		self.wait_time = 0.0
+
+	@property
+	def key(self):
+		return frappe.cache.make_key(f"lease_lock|{self.name}")
+
+	@property
+	def handoff_list(self):
+		# rpush/lpop of the cache wrapper prefix keys themselves, raw commands need make_key
+		return f"lease_lock|{self.name}|handoff"
+
+	def acquire(self, wait=0, poll_interval=0.5):
+		"""Take the lease, polling for up to wait seconds while it is held. Returns True on success"""
+		started = time.monotonic()
+		deadline = started + wait
+		try:
+			while True:
+				if frappe.cache.set(self.key, self.token, nx=True, ex=self.ttl):
+					return True
+				if time.monotonic() >= deadline:
+					return False
+				time.sleep(poll_interval)
+		finally:
+			self.wait_time += time.monotonic() - started
+
+	def renew(self):
+		"""Heartbeat, extends the lease by ttl if it is still ours. Returns False once it is lost"""
+		return bool(frappe.cache.eval(RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)))
+
+	def release(self):
+		"""Give the lease up if it is still ours, then enqueue the methods handed off to us"""
+		released = bool(frappe.cache.eval(RELEASE_SCRIPT, 1, self.key, self.token))
+		if released:
+			self.enqueue_handoffs()
+		return released
+
+	def holder(self):
+		"""Owner token of the current lease, None when the lock is free"""
+		token = frappe.cache.get(self.key)
+		return token.decode() if token else None
+
+	def hand_off(self, method, **kwargs):
+		"""Ask the current holder to enqueue method when it releases the lock"""
+		payload = json.dumps({"method": method, "kwargs": kwargs}, sort_keys=True)
+		frappe.cache.rpush(self.handoff_list, payload)
+		frappe.cache.expire(frappe.cache.make_key(self.handoff_list), self.ttl * 4)
+		return payload
+
+	def enqueue_handoffs(self):
+		"""Enqueue every method handed off while the lock was held, once each"""
+		handoffs = set()
+		while payload := frappe.cache.lpop(self.handoff_list):
+			handoffs.add(payload.decode() if isinstance(payload, bytes) else payload)
+
+		for payload in handoffs:
+			handoff = json.loads(payload)
+			frappe.enqueue(
+				handoff["method"],
+				queue="long",
+				job_id=f"lease_lock_handoff::{self.name}::{handoff['method']}",
+				deduplicate=True,
+				**handoff["kwargs"],
+			)
+
+	def __enter__(self):
+		if not self.acquire():
+			raise LockHeldError(self.name)
+		return self
+
+	def __exit__(self, *exc):
+		self.release()
+
+def acquire_with_policy(lock, policy="wait", wait=0, handoff_method=None, handoff_kwargs=None):
+	"""
+	Acquire lock following policy when another job holds it
+
+	skip    give up at once
+	wait    poll for up to wait seconds, then give up
+	handoff give up at once, but have the holder enqueue handoff_method
+	        when it releases
+
+	Returns "acquired", "skipped" or "handed off". lock.wait_time holds
+	the seconds spent waiting
+	"""
+	if policy not in LOCK_POLICIES:
+		frappe.throw(f"Invalid lock policy {policy}, expected one of {', '.join(LOCK_POLICIES)}")
+
+	if lock.acquire(wait=wait if policy == "wait" else 0):
+		return "acquired"
+
+	if policy != "handoff" or not handoff_method:
+		return "skipped"
+
+	payload = lock.hand_off(handoff_method, **(handoff_kwargs or {}))
+	# The holder may have released between the failed acquire and the hand-off,
+	# in which case nobody would pick it up, so run it ourselves
+	if lock.acquire():
+		frappe.cache.lrem(frappe.cache.make_key(lock.handoff_list), 0, payload)
+		return "acquired"
+
+	return "handed off"